@@ -0,0 +1,125 @@
+import logging
+
+import statistic
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Adaptive sweep of one numeric benchmark parameter.
+
+Instead of running every value of e.g. iodepth, concurrent_ops or numjobs,
+the values are run in increasing order and each result (the benchmark's
+summary(): throughput in MB/s and latency in ms) is compared with the
+previous point.  Once throughput grows by less than threshold times the
+relative growth of the parameter (0.1: doubling iodepth gains less than
+10%), or latency exceeds latency_factor times the latency of the first
+point, the dimension is saturated and the remaining values are skipped.
+With a stride above 1 only every stride-th value is run at first and the
+knee is then bisected between the last points that still grew and the first
+saturated one.  Configured per
+benchmark:
+
+  adaptive:
+    param: iodepth
+    threshold: 0.1
+    latency_factor: 10
+    stride: 2
+    window: 3        # points fitted with statistic.approximate_line
+"""
+
+
+class AdaptiveSweep(object):
+    def __init__(self, values, threshold=0.1, latency_factor=None, stride=1, window=3):
+        self.values = sorted(values)
+        self.threshold = threshold
+        self.latency_factor = latency_factor
+        self.stride = max(1, stride)
+        self.window = window
+        self.results = {}
+        self.ran = []
+        self.knee = None
+        self.saturated_by = None
+
+    def record(self, value, summary):
+        """Result of value; summary is a dict with throughput and latency or None."""
+        if not summary or not summary.get('throughput'):
+            logger.warning('No throughput result for %s, cannot adapt on it', value)
+            return
+        self.results[self.values.index(value)] = (float(summary['throughput']), summary.get('latency'))
+
+    def throughput(self, index, last):
+        """Throughput of index, smoothed over the window of points run up to last."""
+        tested = sorted(i for i in self.results if i <= last)[-self.window:]
+        raw = self.results[index][0]
+        if self.window < 3 or len(tested) < 3:
+            return raw
+        try:
+            fitted = statistic.approximate_line([self.values[i] for i in tested],
+                                                [self.results[i][0] for i in tested],
+                                                [self.values[index]])
+            return float(fitted[0])
+        except (ValueError, ZeroDivisionError):
+            return raw
+
+    def saturated(self, lo, hi):
+        first_latency = self.results[min(self.results)][1]
+        latency = self.results[hi][1]
+        if self.latency_factor and first_latency and latency and latency > self.latency_factor * first_latency:
+            self.saturated_by = 'latency'
+            return True
+        tp_lo = self.throughput(lo, hi)
+        tp_hi = self.throughput(hi, hi)
+        growth = (float(self.values[hi]) - self.values[lo]) / self.values[lo]
+        if tp_lo <= 0 or growth <= 0:
+            return False
+        if (tp_hi - tp_lo) / tp_lo / growth < self.threshold:
+            self.saturated_by = 'throughput'
+            return True
+        return False
+
+    def __iter__(self):
+        """Yields the values to run, record() must be called for each before the next."""
+        n = len(self.values)
+        grown = []
+        i = 0
+        while i < n:
+            self.ran.append(self.values[i])
+            yield self.values[i]
+            if i not in self.results:
+                i += self.stride
+                continue
+            if grown and self.saturated(grown[-1], i):
+                # the knee is past the point before the last one that still grew
+                reason = self.saturated_by
+                lo = grown[-2] if len(grown) > 1 else grown[-1]
+                hi = i
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if mid not in self.results:
+                        self.ran.append(self.values[mid])
+                        yield self.values[mid]
+                        if mid not in self.results:
+                            break
+                    if self.saturated(mid, hi):
+                        hi = mid
+                    else:
+                        lo = mid
+                if hi in self.results and not self.saturated(lo, hi):
+                    lo = hi
+                self.saturated_by = reason
+                self.knee = self.values[lo]
+                return
+            grown.append(i)
+            if i < n - 1:
+                i = min(i + self.stride, n - 1)
+            else:
+                i = n
+        if grown:
+            self.knee = self.values[grown[-1]]
+
+    def report(self):
+        points = [{'value': self.values[i], 'throughput': tp, 'latency': lat}
+                  for i, (tp, lat) in sorted(self.results.items())]
+        return {'knee': self.knee, 'saturated_by': self.saturated_by,
+                'skipped': [v for v in self.values if v not in self.ran],
+                'points': points}
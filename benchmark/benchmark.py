@@ -1,25 +1,65 @@
 import subprocess
 import logging
+import os
+import time
+
+import yaml
 
 import settings
 import common
+import executor
+import idle
 import monitoring
+import progress
+import steadystate
+import tracing
 
 logger = logging.getLogger('cbt')
 
+# Default seconds assumed for the fixed costs of a test by cbt.py --plan,
+# overridden per key through the plan_costs cluster setting.
+PLAN_COSTS = {
+    'cluster_build': 600,
+    'scrub_check': 30,
+    'idle_monitoring': 60,
+    'pool_create': 30,
+    'dropcaches': 5,
+    'sync': 10,
+    'prefill_mbps': 200,
+    'osd_param': 10,
+}
+
 class Benchmark(object):
     def __init__(self, cluster, config):
         self.config = config
         self.cluster = cluster
 #        self.cluster = Ceph(settings.cluster)
-        self.archive_dir = "%s/%08d/%s" % (settings.cluster.get('archive_dir'), config.get('iteration'), self.getclass())
-        self.run_dir = "%s/%08d/%s" % (settings.cluster.get('tmp_dir'), config.get('iteration'), self.getclass())
+        # Benchmarks given a client_group only use those clients, and run
+        # concurrently with the other grouped benchmarks (see groups.py).
+        self.client_group = config.get('client_group')
+        topology = settings.get_topology()
+        if self.client_group:
+            self.clients = topology.group_nodes(self.client_group)
+            self.client_names = [topology.short(host) for host in topology.group(self.client_group)]
+            bench_dir = '%s/%s' % (self.client_group, self.getclass())
+        else:
+            self.clients = settings.getnodes('clients')
+            self.client_names = topology.shortnames('clients')
+            bench_dir = self.getclass()
+        self.archive_dir = "%s/%08d/%s" % (settings.cluster.get('archive_dir'), config.get('iteration'), bench_dir)
+        self.run_dir = "%s/%08d/%s" % (settings.cluster.get('tmp_dir'), config.get('iteration'), bench_dir)
+        # set while running concurrently: a groups.Barrier for the start of
+        # each workload phase, and whether the cluster was already set up
+        self.barrier = None
+        self.barrier_phase = 0
+        self.keep_cluster = False
         self.osd_ra = config.get('osd_ra', None)
         self.cmd_path = ''
         self.valgrind = config.get('valgrind', None)
         self.cmd_path_full = '' 
-        if self.valgrind is not None:
-            self.cmd_path_full = common.setup_valgrind(self.valgrind, self.getclass(), self.run_dir)
+        self.partial = False
+        self.steady_watcher = None
+        # valgrind is set up by run(), benchmarks are also built by --plan
 
         self.osd_ra_changed = False
         if self.osd_ra:
@@ -32,10 +72,11 @@ class Benchmark(object):
         return self.__class__.__name__
 
     def initialize(self):
-        self.cluster.cleanup()
-        use_existing = settings.cluster.get('use_existing', True)
-        if not use_existing:
-            self.cluster.initialize()
+        if not self.keep_cluster:
+            self.cluster.cleanup()
+            use_existing = settings.cluster.get('use_existing', True)
+            if not use_existing:
+                self.cluster.initialize()
 
         self.cleanup()
         # Create the run directory
@@ -48,6 +89,7 @@ class Benchmark(object):
 
         logger.debug('Cleaning existing temporary run directory: %s', self.run_dir)
         common.pdsh(settings.getnodes('clients', 'osds', 'mons', 'rgws'), 'sudo rm -rf %s' % self.run_dir).communicate()
+        common.make_remote_dir(self.run_dir)
         if self.valgrind is not None:
             logger.debug('Adding valgrind to the command path.')
             self.cmd_path_full = common.setup_valgrind(self.valgrind, self.getclass(), self.run_dir)
@@ -57,14 +99,199 @@ class Benchmark(object):
     def exists(self):
         return False
 
+    def pool_name(self, name):
+        """name of a pool the benchmark creates, per client group so concurrent groups never share one."""
+        if self.client_group:
+            return '%s-%s' % (name, self.client_group)
+        return name
+
+    def pools(self):
+        """Pools the benchmark deletes and recreates, see groups.check_round()."""
+        return []
+
+    def osd_params(self):
+        """OSD parameters run() sets, {name: value}."""
+        if self.osd_ra and self.osd_ra_changed:
+            return {'read_ahead_kb': self.osd_ra}
+        return {}
+
     def cleanup(self):
         pass
 
     def dropcaches(self):
         nodes = settings.getnodes('clients', 'osds') 
+        if self.barrier is not None:
+            # the OSDs were dropped before the concurrent start, dropping
+            # them again would disturb the other running benchmarks
+            nodes = self.clients
+
+        with tracing.phase('dropcaches'):
+            common.pdsh(nodes, 'sync').communicate()
+            common.pdsh(nodes, 'echo 3 | sudo tee /proc/sys/vm/drop_caches').communicate()
+
+    def idle_monitoring(self):
+        """
+        Monitors the idle cluster before the tests, until it is quiet with the
+        idle setting (see idle.py), otherwise for 60s.
+        """
+        detector = idle.get_detector(settings.cluster)
+        monitoring.start("%s/idle_monitoring" % self.run_dir)
+        try:
+            with tracing.phase('idle_monitoring'):
+                if detector is not None:
+                    self.cluster.wait_idle(detector)
+                else:
+                    logger.info('Pausing for 60s for idle monitoring.')
+                    time.sleep(60)
+        finally:
+            monitoring.stop()
+
+    def watch_workload(self, run_dir, out_dir, pattern, parse, steady_parse, nodes=None,
+                       progress_class=progress.Progress):
+        """
+        Starts tailing the per second output of the workload (files matching
+        pattern in run_dir on nodes, the clients by default) for the live
+        progress (live setting, see progress.py) and the steady state
+        detection (steady_state setting, see steadystate.py), unless
+        steady_parse is None.  Returns the LiveTail or None.
+        """
+        consumers = []
+        self.steady_watcher = None
+        detector = steadystate.get_detector(self.config.get('steady_state', settings.cluster.get('steady_state')))
+        if detector is not None and steady_parse is not None:
+            if detector.stop_after:
+                logger.warning('%s cannot be stopped early, ignoring stop_after', self.getclass())
+            self.steady_watcher = steadystate.SteadyStateWatcher(steady_parse, detector)
+            consumers.append(self.steady_watcher)
+        if self.config.get('live', settings.cluster.get('live', False)):
+            label = self.getclass() if self.client_group is None else '%s/%s' % (self.client_group, self.getclass())
+            consumers.append(progress_class(parse, os.path.join(out_dir, 'live.jsonl'), label))
+        if not consumers:
+            return None
+        return progress.LiveTail(nodes or self.clients, run_dir, pattern, consumers).start()
+
+    def write_steady_state(self, out_dir, pattern, parse, stopped_early=False):
+        """Stores the steady state window of the archived output if steady_state is set."""
+        if self.steady_watcher is not None:
+            steadystate.write(out_dir, pattern, parse, self.steady_watcher.detector, stopped_early)
+            return
+        # the output was not watched while the workload ran
+        detector = steadystate.get_detector(self.config.get('steady_state', settings.cluster.get('steady_state')))
+        if detector is not None:
+            steadystate.write(out_dir, pattern, parse, detector, stopped_early)
+
+    def sync_start(self):
+        """
+        Called right before each workload phase starts, waits for the other
+        concurrent benchmarks to reach the same phase.
+        """
+        if self.barrier is not None:
+            with tracing.phase('barrier', benchmark=self.getclass(), phase=self.barrier_phase):
+                self.barrier.wait(self.barrier_phase)
+            self.barrier_phase += 1
+
+    def summary(self):
+        """
+        Aggregate result of the test from its archived output, a dict with
+        throughput (MB/s) and latency (ms), or None if it is not known.
+        """
+        return None
+
+    def plan_cost(self, name):
+        return settings.cluster.get('plan_costs', {}).get(name, PLAN_COSTS[name])
+
+    def plan_seconds(self, value):
+        """time/ramp style setting in seconds, 0 if unset."""
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def estimate_initialize(self):
+        """Estimated seconds per phase of initialize(), for cbt.py --plan."""
+        phases = {}
+        if not settings.cluster.get('use_existing', True):
+            phases['cluster_build'] = self.plan_cost('cluster_build')
+        return phases
+
+    def estimate_run(self):
+        """Estimated seconds per phase of run(), for cbt.py --plan."""
+        return {}
+
+    def initialize_key(self):
+        """
+        Settings initialize() depends on.  cbt.py initializes again when a
+        test's key differs from the one of the initialized test of its class.
+        """
+        return ()
+
+    def transition_cost(self, prev):
+        """Estimated setup seconds of running this test right after prev (None: first)."""
+        cost = 0
+        if prev is None or prev.getclass() != self.getclass() or prev.initialize_key() != self.initialize_key():
+            cost += sum(self.estimate_initialize().values())
+        if self.osd_ra_changed and (prev is None or prev.osd_ra != self.osd_ra):
+            cost += self.plan_cost('osd_param')
+        return cost
+
+    def estimate_idle(self, phases):
+        # scrub check, idle monitoring and sync shared by most initialize()s
+        phases['scrub_check'] = self.plan_cost('scrub_check')
+        detector = idle.get_detector(settings.cluster)
+        if detector is not None:
+            phases['idle_monitoring'] = detector.quiet
+        else:
+            phases['idle_monitoring'] = self.plan_cost('idle_monitoring')
+        phases['sync'] = self.plan_cost('sync')
+        return phases
+
+    def deadline(self):
+        """
+        Seconds the workload may run before its hosts count as late: the
+        'deadline' setting if given, otherwise time (plus ramp) plus
+        deadline_grace.  None waits forever.
+        """
+        if self.config.get('deadline') is not None:
+            return float(self.config['deadline'])
+        try:
+            runtime = float(getattr(self, 'time', None))
+        except (TypeError, ValueError):
+            return None
+        try:
+            runtime += float(getattr(self, 'ramp', 0))
+        except (TypeError, ValueError):
+            pass
+        grace = self.config.get('deadline_grace', settings.cluster.get('deadline_grace', 300))
+        return runtime + float(grace)
+
+    def wait_workload(self, cmds, out_dir, kill_cmd=None):
+        """
+        Wait for the workload commands until the deadline, counted from the
+        start of each command.  Hosts still running then are logged and, with
+        kill_stragglers, killed (the local handle and, through kill_cmd, the
+        remote process).  The test is marked partial with a partial.yaml in
+        out_dir naming the late hosts.
+        """
+        timeout = self.deadline()
+        kill = self.config.get('kill_stragglers', settings.cluster.get('kill_stragglers', False))
+        done, late = executor.wait(cmds, timeout, kill=kill)
+        if not late:
+            return done, late
 
-        common.pdsh(nodes, 'sync').communicate()
-        common.pdsh(nodes, 'echo 3 | sudo tee /proc/sys/vm/drop_caches').communicate()
+        hosts = sorted(set(cmd.host for cmd in late))
+        logger.error('%d of %d workload commands missed the %ss deadline on %s', len(late), len(cmds),
+                     timeout, ', '.join(hosts))
+        if kill and kill_cmd:
+            common.pdsh(','.join(sorted(set(cmd.node for cmd in late))), kill_cmd).communicate()
+        self.partial = True
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        with open(os.path.join(out_dir, 'partial.yaml'), 'w') as f:
+            yaml.safe_dump({'deadline': timeout, 'killed': bool(kill), 'late_hosts': hosts,
+                            'late_commands': [cmd.command for cmd in late],
+                            'completed_hosts': sorted(set(cmd.host for cmd in done))},
+                           f, default_flow_style=False)
+        return done, late
 
     def __str__(self):
         return str(self.config)
@@ -1,7 +1,9 @@
 import subprocess
 import common
+import executor
 import settings
 import monitoring
+import tracing
 import os
 import time
 import threading
@@ -18,6 +20,7 @@ class CephTestRados(Benchmark):
         super(CephTestRados, self).__init__(cluster, config)
 
         self.tmp_conf = self.cluster.tmp_conf
+        self.pool = self.pool_name('ceph_test_rados')
 
         self.bools = {}
         if config.get('ec_pool', False):  self.bools['ec_pool'] = True
@@ -34,6 +37,8 @@ class CephTestRados(Benchmark):
         self.variables['min_stride_size'] = str(config.get('min_stride_size', self.variables['object_size'] / 10))
         self.variables['max_stride_size'] = str(config.get('max_stride_size', self.variables['object_size'] / 5))
         self.variables['max_seconds'] = str(config.get('max_seconds', 0))
+        # bounds the deadline, 0 means run until max_ops are done
+        self.time = config.get('max_seconds') or None
 
 
         self.weights = {'read': 100, 'write':100, 'delete':10}
@@ -82,13 +87,13 @@ class CephTestRados(Benchmark):
             recovery_callback = self.recovery_callback
             self.cluster.create_recovery_test(self.run_dir, recovery_callback)
 
+        self.sync_start()
         logger.info('Running ceph_test_rados.')
-        ps = []
+        cmds = []
         for i in xrange(1):
-            p = common.pdsh(settings.getnodes('clients'), self.mkcmd())
-            ps.append(p)
-        for p in ps:
-            p.wait()
+            cmds.extend(executor.fanout(self.clients, self.mkcmd(), throttle=False))
+        with tracing.phase('measure'):
+            self.wait_workload(cmds, self.out_dir, 'sudo killall -9 ceph_test_rados')
         # If we were doing recovery, wait until it's done.
         if 'recovery_test' in self.cluster.config:
             self.cluster.wait_recovery_done()
@@ -99,6 +104,13 @@ class CephTestRados(Benchmark):
         self.cluster.dump_historic_ops(self.run_dir)
         common.sync_files('%s/*' % self.run_dir, self.out_dir)
 
+    def estimate_run(self):
+        return {'pool_create': self.plan_cost('pool_create'),
+                'dropcaches': self.plan_cost('dropcaches'),
+                'settle': 5,
+                'measure': self.plan_seconds(self.time),
+                'sync': self.plan_cost('sync')}
+
     def mkcmd(self):
         cmd = [self.cmd_path]
         out_file = '%s/output' % self.run_dir
@@ -112,19 +124,22 @@ class CephTestRados(Benchmark):
                 cmd.extend(['--%s' % variable.replace('_', '-'), str(value)])
         for op, weight in self.weights.iteritems():
             cmd.extend(['--op', op, str(weight)])
-        cmd.extend(['--pool', 'ceph_test_rados'])
+        cmd.extend(['--pool', self.pool])
         cmd.extend(['|', 'awk \'{ print strftime("%Y-%m-%d %H:%M:%S"), $0; fflush(); }\'' '>', out_file])
         logger.debug("%s", cmd)
         return ' '.join(cmd)
 
     def mkpool(self):
         monitoring.start("%s/pool_monitoring" % self.run_dir)
-        self.cluster.rmpool('ceph_test_rados', self.pool_profile)
-        self.cluster.mkpool('ceph_test_rados', self.pool_profile)
+        self.cluster.rmpool(self.pool, self.pool_profile)
+        self.cluster.mkpool(self.pool, self.pool_profile)
         monitoring.stop()
 
+    def pools(self):
+        return [self.pool]
+
     def recovery_callback(self): 
-        common.pdsh(settings.getnodes('clients'), 'sudo pkill -f ceph_test_rados').communicate()
+        common.pdsh(self.clients, 'sudo pkill -f ceph_test_rados').communicate()
 
     def __str__(self):
         return "%s\n%s\n%s" % (self.run_dir, self.out_dir, super(CephTestRados, self).__str__())
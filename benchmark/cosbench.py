@@ -2,6 +2,7 @@ import subprocess
 import common
 import settings
 import monitoring
+import tracing
 import os, sys
 import time
 import threading
@@ -50,13 +51,13 @@ class Cosbench(Benchmark):
         if "username" in cosconf and "password" in cosconf and "url" in cosconf:
             if not self.use_existing:
                 user, subuser = cosconf["username"].split(':')
-                stdout, stderr = common.pdsh("%s@%s" % (self.user, self.rgw),"radosgw-admin user create --uid='%s' --display-name='%s'" % (user, user)).communicate()
-                stdout, stderr = common.pdsh("%s@%s" % (self.user, self.rgw),"radosgw-admin subuser create --uid=%s --subuser=%s --access=full" % (user, cosconf["username"])).communicate()
-                stdout, stderr = common.pdsh("%s@%s" % (self.user, self.rgw),"radosgw-admin key create --uid=%s --subuser=%s --key-type=swift" % (user, cosconf["username"])).communicate()
-                stdout, stderr = common.pdsh("%s@%s" % (self.user, self.rgw),"radosgw-admin user modify --uid=%s --max-buckets=100000" % (user)).communicate()
-                stdout, stderr = common.pdsh("%s@%s" % (self.user, self.rgw),"radosgw-admin subuser modify --uid=%s --subuser=%s --secret=%s --key-type=swift" % (user, cosconf["username"], cosconf["password"])).communicate()
+                stdout, stderr = common.pdsh(settings.get_topology().target(self.rgw),"radosgw-admin user create --uid='%s' --display-name='%s'" % (user, user)).communicate()
+                stdout, stderr = common.pdsh(settings.get_topology().target(self.rgw),"radosgw-admin subuser create --uid=%s --subuser=%s --access=full" % (user, cosconf["username"])).communicate()
+                stdout, stderr = common.pdsh(settings.get_topology().target(self.rgw),"radosgw-admin key create --uid=%s --subuser=%s --key-type=swift" % (user, cosconf["username"])).communicate()
+                stdout, stderr = common.pdsh(settings.get_topology().target(self.rgw),"radosgw-admin user modify --uid=%s --max-buckets=100000" % (user)).communicate()
+                stdout, stderr = common.pdsh(settings.get_topology().target(self.rgw),"radosgw-admin subuser modify --uid=%s --subuser=%s --secret=%s --key-type=swift" % (user, cosconf["username"], cosconf["password"])).communicate()
 
-            stdout, stderr = common.pdsh("%s@%s" % (self.user, self.config["controller"]),"curl -D - -H 'X-Auth-User: %s' -H 'X-Auth-Key: %s' %s" % (cosconf["username"], cosconf["password"], cosconf["url"])).communicate()
+            stdout, stderr = common.pdsh(settings.get_topology().target(self.config["controller"]),"curl -D - -H 'X-Auth-User: %s' -H 'X-Auth-Key: %s' %s" % (cosconf["username"], cosconf["password"], cosconf["url"])).communicate()
 
         else:
             logger.error("Auth Configuration in Yaml file is not in correct format")
@@ -70,14 +71,14 @@ class Cosbench(Benchmark):
         #3. check if container and obj created
         target_name = "%s-%s-%s" % (self.config["obj_size"], self.config["mode"], self.config["objects_max"])
         container_count = 0
-        stdout, stderr = common.pdsh("%s@%s" % (self.user, self.rgw),"swift -A %s -U %s -K %s list" % (cosconf["url"], cosconf["username"], cosconf["password"])).communicate()
-        if stderr != "":
+        proc = common.pdsh(settings.get_topology().target(self.rgw),"swift -A %s -U %s -K %s list" % (cosconf["url"], cosconf["username"], cosconf["password"]))
+        for host, container_name in proc.stream():
+            if target_name in container_name:
+                container_count += 1
+        if proc.stderr_tail:
             self.container_prepared = False
             return
 
-        for container_name in stdout.split('\n'):
-            if target_name in container_name:
-                container_count += 1
         if container_count >= int(self.config["containers_max"]):
             self.container_prepared = True
         else:
@@ -161,10 +162,7 @@ class Cosbench(Benchmark):
         self.cluster.check_scrub()
         monitoring.stop()
 
-        logger.debug('Pausing for 60s for idle monitoring.')
-        monitoring.start("%s/idle_monitoring" % self.run_dir)
-        time.sleep(60)
-        monitoring.stop()
+        self.idle_monitoring()
 
         common.sync_files('%s' % self.run_dir, self.out_dir)
 
@@ -234,7 +232,7 @@ class Cosbench(Benchmark):
         except KeyboardInterrupt:
             logger.warning("accept keyboard interrupt, cancel this run")
             conf = self.config
-            stdout, stderr = common.pdsh("%s@%s" % (self.user, conf["controller"]),'sh %s/cli.sh cancel %s' % (conf["cosbench_dir"], self.runid)).communicate()
+            stdout, stderr = common.pdsh(settings.get_topology().target(conf["controller"]),'sh %s/cli.sh cancel %s' % (conf["cosbench_dir"], self.runid)).communicate()
             logger.info("%s", stdout)
 
         self.check_workload_status()
@@ -252,7 +250,7 @@ class Cosbench(Benchmark):
         except:
             wait = False
         while wait:
-            stdout, stderr = common.pdsh("%s@%s" % (self.user, self.config["controller"]),"sh %s/cli.sh info | grep %s | awk '{print $8}'" % (self.config["cosbench_dir"], self.runid)).communicate()
+            stdout, stderr = common.pdsh(settings.get_topology().target(self.config["controller"]),"sh %s/cli.sh info | grep %s | awk '{print $8}'" % (self.config["cosbench_dir"], self.runid)).communicate()
             if stderr:
                 logger.info("Cosbench Deamon is not running on %s", self.config["controller"])
                 return False
@@ -263,7 +261,7 @@ class Cosbench(Benchmark):
             except:
                 wait = False
             time.sleep(1)
-        stdout, stderr = common.pdsh("%s@%s" % (self.user, self.config["controller"]),"sh %s/cli.sh info " % (self.config["cosbench_dir"])).communicate()
+        stdout, stderr = common.pdsh(settings.get_topology().target(self.config["controller"]),"sh %s/cli.sh info " % (self.config["cosbench_dir"])).communicate()
         logger.debug(stdout)
         return True
 
@@ -271,7 +269,7 @@ class Cosbench(Benchmark):
         #check res dir
         check_time = 0
         while True:
-            stdout, stderr = common.pdsh("%s@%s" % (self.user, self.config["controller"]), "find %s/archive -maxdepth 1 -name '%s-*'" % (self.config["cosbench_dir"], self.runid)).communicate() 
+            stdout, stderr = common.pdsh(settings.get_topology().target(self.config["controller"]), "find %s/archive -maxdepth 1 -name '%s-*'" % (self.config["cosbench_dir"], self.runid)).communicate() 
             if stdout:
                 return True
             if check_time == 300:
@@ -281,7 +279,8 @@ class Cosbench(Benchmark):
 
     def _run(self):
         conf = self.config
-        stdout, stderr = common.pdsh("%s@%s" % (self.user, conf["controller"]),'sh %s/cli.sh submit %s/%s.xml' % (conf["cosbench_dir"], conf["cosbench_xml_dir"], conf["xml_name"])).communicate()
+        self.sync_start()
+        stdout, stderr = common.pdsh(settings.get_topology().target(conf["controller"]),'sh %s/cli.sh submit %s/%s.xml' % (conf["cosbench_dir"], conf["cosbench_xml_dir"], conf["xml_name"])).communicate()
         m = re.findall('Accepted with ID:\s*(\w+)', stdout )
         if not m:
             logger.error("cosbench start failing with error: %s", stderr)
@@ -292,7 +291,17 @@ class Cosbench(Benchmark):
         logger.info("====== cosbench job: %s started ======", conf["xml_name"])
         logger.info("wait %d secs to finish the test", wait_time)
         logger.info("You can monitor the runtime status and results on http://localhost:19088/controller")
-        time.sleep(wait_time)
+        with tracing.phase('measure', mode=conf["mode"]):
+            time.sleep(wait_time)
+
+    def estimate_initialize(self):
+        return self.estimate_idle(super(Cosbench, self).estimate_initialize())
+
+    def estimate_run(self):
+        conf = self.config
+        return {'dropcaches': self.plan_cost('dropcaches'),
+                'measure': conf["rampup"] + conf["rampdown"] + conf["runtime"],
+                'sync': 2 * self.plan_cost('sync')}
 
     def __str__(self):
         return "%s\n%s\n%s" % (self.run_dir, self.out_dir, super(Cosbench, self).__str__())
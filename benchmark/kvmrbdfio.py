@@ -2,6 +2,7 @@ import subprocess
 import common
 import settings
 import monitoring
+import tracing
 import os
 import time
 import string
@@ -16,7 +17,7 @@ class KvmRbdFio(Benchmark):
     def __init__(self, cluster, config):
         super(KvmRbdFio, self).__init__(cluster, config)
         self.concurrent_procs = config.get('concurrent_procs', 1)
-        self.total_procs = self.concurrent_procs * len(settings.getnodes('clients').split(','))
+        self.total_procs = self.concurrent_procs * len(self.client_names)
 
         self.time =  str(config.get('time', '300'))
         self.ramp = str(config.get('ramp', '0'))
@@ -54,9 +55,9 @@ class KvmRbdFio(Benchmark):
         super(KvmRbdFio, self).initialize()
         for i in xrange(1):
              letter = string.ascii_lowercase[i+1]
-             common.pdsh(settings.getnodes('clients'), 'sudo mkfs.ext4 /dev/vd%s' % letter).communicate()
-             common.pdsh(settings.getnodes('clients'), 'sudo mkdir /srv/rbdfio-`hostname -s`-%d' % i).communicate()
-             common.pdsh(settings.getnodes('clients'), 'sudo mount -t ext4 -o noatime /dev/vd%s /srv/rbdfio-`hostname -s`-%d' %(letter, i)).communicate()
+             common.pdsh(self.clients, 'sudo mkfs.ext4 /dev/vd%s' % letter).communicate()
+             common.pdsh(self.clients, 'sudo mkdir /srv/rbdfio-`hostname -s`-%d' % i).communicate()
+             common.pdsh(self.clients, 'sudo mount -t ext4 -o noatime /dev/vd%s /srv/rbdfio-`hostname -s`-%d' %(letter, i)).communicate()
 
         # Create the run directory
         common.make_remote_dir(self.run_dir)
@@ -64,7 +65,7 @@ class KvmRbdFio(Benchmark):
         # populate the fio files
         logger.info('Attempting to populating fio files...')
         pre_cmd = 'sudo fio --rw=write -ioengine=sync --numjobs=%s --bs=4M --size %dM %s > /dev/null' % (self.numjobs, self.vol_size, self.names)
-        common.pdsh(settings.getnodes('clients'), pre_cmd).communicate()
+        common.pdsh(self.clients, pre_cmd).communicate()
 
 
     def run(self):
@@ -108,23 +109,39 @@ class KvmRbdFio(Benchmark):
             recovery_callback = self.recovery_callback
             self.cluster.create_recovery_test(self.run_dir, recovery_callback)
 
+        self.sync_start()
         logger.info('Running rbd fio %s test.', self.mode)
-        common.pdsh(settings.getnodes('clients'), fio_cmd).communicate()
+        with tracing.phase('measure', mode=self.mode):
+            common.pdsh(self.clients, fio_cmd).communicate()
         monitoring.stop(self.run_dir)
 
         common.sync_files('%s/*' % self.run_dir, self.out_dir)
 
     def cleanup(self):
          super(KvmRbdFio, self).cleanup()
-         common.pdsh(settings.getnodes('clients'), 'sudo umount /srv/*').communicate()
+         common.pdsh(self.clients, 'sudo umount /srv/*').communicate()
 
     def set_client_param(self, param, value):
          cmd = 'find /sys/block/vd* ! -iname vda -exec sudo sh -c "echo %s > {}/queue/%s" \;' % (value, param)
-         common.pdsh(settings.getnodes('clients'), cmd).communicate()
+         common.pdsh(self.clients, cmd).communicate()
 
     def __str__(self):
         return "%s\n%s\n%s" % (self.run_dir, self.out_dir, super(KvmRbdFio, self).__str__())
 
+    def initialize_key(self):
+        return (self.vol_size, self.concurrent_procs, self.numjobs)
+
+    def estimate_initialize(self):
+        phases = super(KvmRbdFio, self).estimate_initialize()
+        phases['prefill'] = self.vol_size / float(self.plan_cost('prefill_mbps'))
+        return phases
+
+    def estimate_run(self):
+        return {'dropcaches': self.plan_cost('dropcaches'),
+                'settle': 5,
+                'measure': self.plan_seconds(self.ramp) + self.plan_seconds(self.time),
+                'sync': self.plan_cost('sync')}
+
     def recovery_callback(self):
-        common.pdsh(settings.getnodes('clients'), 'sudo killall fio').communicate()
+        common.pdsh(self.clients, 'sudo killall fio').communicate()
 
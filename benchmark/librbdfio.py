@@ -1,17 +1,81 @@
+import json
 import subprocess
+import capabilities
 import common
+import executor
 import settings
 import monitoring
+import progress
+import steadystate
+import tracing
+import transport
 import os
 import time
 import threading
 import logging
+import re
 
 from cluster.ceph import Ceph
 from benchmark import Benchmark
 
 logger = logging.getLogger("cbt")
 
+# MB per unit of the fio bandwidth figures
+FIO_BW_UNITS = {'B': 1.0 / 1048576, 'KB': 1.0 / 1024, 'KiB': 1.0 / 1024, 'MB': 1.0, 'MiB': 1.0,
+                'GB': 1024.0, 'GiB': 1024.0}
+FIO_LAT_UNITS = {'nsec': 0.000001, 'usec': 0.001, 'msec': 1.0}
+# fio bandwidth, IOPS and latency logs in the run directory
+FIO_LOGS = 'output.*_*.log'
+# results of the fio client on the head in fio_server mode
+FIO_JSON = 'output.json'
+# outputs of the fio jobs on the clients, but not their logs
+FIO_OUTPUTS = 'output.*[0-9]'
+# a job ended by its steadystate option, in the normal or JSON output
+FIO_ATTAINED = re.compile(r'attained=yes|"attained"\s*:\s*1\b')
+
+
+def parse_fio_output(text):
+    """(bandwidth MB/s summed over jobs, [average latency ms of each job]) of fio's normal output."""
+    bw = 0.0
+    lats = []
+    for m in re.finditer(r'(?:read|write)\s*:\s*(?:io=[^,]*,\s*bw=|IOPS=[^,]*,\s*BW=)([\d.]+)([KMG]?i?B)/s', text):
+        bw += float(m.group(1)) * FIO_BW_UNITS.get(m.group(2), 0)
+    for m in re.finditer(r'^\s+lat \((nsec|usec|msec)\)\s*:.*?avg=\s*([\d.]+)', text, re.M):
+        lats.append(float(m.group(2)) * FIO_LAT_UNITS[m.group(1)])
+    return bw, lats
+
+
+def parse_fio_json(text):
+    """
+    (bandwidth MB/s summed over jobs, [average latency ms of each job]) of
+    fio's JSON output, of every client's jobs in client/server mode.
+    """
+    # the fio client may print a line per server before the JSON, and with
+    # --status-interval the results follow a document per interval
+    decoder = json.JSONDecoder()
+    data = None
+    start = text.find('{')
+    while start >= 0:
+        data, end = decoder.raw_decode(text, start)
+        start = text.find('{', end)
+    if data is None:
+        return 0.0, []
+    bw = 0.0
+    lats = []
+    for job in data.get('client_stats', data.get('jobs', [])):
+        if job.get('jobname') == 'All clients':
+            continue
+        for direction in ('read', 'write'):
+            stats = job.get(direction, {})
+            # KiB/s
+            bw += stats.get('bw', 0) / 1024.0
+            if not stats.get('iops'):
+                continue
+            lat = progress.fio_lat_ms(stats)
+            if lat is not None:
+                lats.append(lat)
+    return bw, lats
+
 
 class LibrbdFio(Benchmark):
 
@@ -21,8 +85,9 @@ class LibrbdFio(Benchmark):
         # FIXME there are too many permutations, need to put results in SQLITE3 
         self.cmd_path = config.get('cmd_path', '/usr/bin/fio')
         self.pool_profile = config.get('pool_profile', 'default')
-        self.time =  str(config.get('time', None))
-        self.ramp = str(config.get('ramp', None))
+        # None leaves the runtime and ramp_time to fio
+        self.time = config.get('time', None)
+        self.ramp = config.get('ramp', None)
         self.iodepth = config.get('iodepth', 16)
         self.numjobs = config.get('numjobs', 1)
         self.end_fsync = str(config.get('end_fsync', 0))
@@ -39,10 +104,18 @@ class LibrbdFio(Benchmark):
         self.procs_per_volume = config.get('procs_per_volume', 1)
         self.random_distribution = config.get('random_distribution', None)
         self.rate_iops = config.get('rate_iops', None)
-        self.poolname = "cbt-librbdfio"
+        self.poolname = self.pool_name("cbt-librbdfio")
         self.use_existing_volumes = config.get('use_existing_volumes', False)
+        # drive fio servers on the clients from the head with job files
+        self.fio_server = config.get('fio_server', False)
+        self.job_file = '%s/librbdfio.fio' % settings.cluster.get('tmp_dir')
+        self.server_cmd = '%s --server --daemonize=%s/fio-server.pid' % (self.cmd_path, settings.cluster.get('tmp_dir'))
+        # fio prints its status every second for the live progress
+        self.live = config.get('live', settings.cluster.get('live', False))
+        # steady state detector of a stop_after fio ends itself, see steady_stop()
+        self.steady_stop = None
 
-	self.total_procs = self.procs_per_volume * self.volumes_per_client * len(settings.getnodes('clients').split(','))
+	self.total_procs = self.procs_per_volume * self.volumes_per_client * len(self.client_names)
         self.run_dir = '%s/osd_ra-%08d/op_size-%08d/concurrent_procs-%03d/iodepth-%03d/%s' % (self.run_dir, int(self.osd_ra), int(self.op_size), int(self.total_procs), int(self.iodepth), self.mode)
         self.out_dir = '%s/osd_ra-%08d/op_size-%08d/concurrent_procs-%03d/iodepth-%03d/%s' % (self.archive_dir, int(self.osd_ra), int(self.op_size), int(self.total_procs), int(self.iodepth), self.mode)
 
@@ -60,15 +133,15 @@ class LibrbdFio(Benchmark):
     def initialize(self): 
         super(LibrbdFio, self).initialize()
 
+        if capabilities.has_feature(self.clients, 'fio', 'rbd') is False:
+            logger.warning('fio on %s lacks the rbd ioengine, the tests will fail.', self.clients)
+
         logger.info('Running scrub monitoring.')
         monitoring.start("%s/scrub_monitoring" % self.run_dir)
         self.cluster.check_scrub()
         monitoring.stop()
 
-        logger.info('Pausing for 60s for idle monitoring.')
-        monitoring.start("%s/idle_monitoring" % self.run_dir)
-        time.sleep(60)
-        monitoring.stop()
+        self.idle_monitoring()
 
         common.sync_files('%s/*' % self.run_dir, self.out_dir)
 
@@ -78,17 +151,24 @@ class LibrbdFio(Benchmark):
         common.make_remote_dir(self.run_dir)
 
         # populate the fio files
-        ps = []
+        cmds = []
         logger.info('Attempting to populating fio files...')
         if (self.use_existing_volumes == False):
           for i in xrange(self.volumes_per_client):
               pre_cmd = 'sudo %s --ioengine=rbd --clientname=admin --pool=%s --rbdname=cbt-librbdfio-`hostname -s`-%d --invalidate=0  --rw=write --numjobs=%s --bs=4M --size %dM %s > /dev/null' % (self.cmd_path, self.poolname, i, self.numjobs, self.vol_size, self.names)
-              p = common.pdsh(settings.getnodes('clients'), pre_cmd)
-              ps.append(p)
-          for p in ps:
-              p.wait()
+              cmds.extend(executor.fanout(self.clients, pre_cmd))
+          executor.wait(cmds)
+
+        if self.fio_server:
+            logger.info('Starting fio servers on %s.', self.clients)
+            common.pdsh(self.clients, 'sudo %s' % self.server_cmd, continue_if_error=False).communicate()
         return True
 
+    def cleanup(self):
+        if self.fio_server:
+            # the pid file may be gone with the tmp_dir by now
+            common.pdsh(self.clients, "sudo pkill -f '[%s]%s'" % (self.server_cmd[0], self.server_cmd[1:])).communicate()
+
     def run(self):
         super(LibrbdFio, self).run()
 
@@ -107,14 +187,26 @@ class LibrbdFio(Benchmark):
             recovery_callback = self.recovery_callback
             self.cluster.create_recovery_test(self.run_dir, recovery_callback)
 
+        self.steady_stop = self.get_steady_stop()
+        if self.fio_server:
+            self.mkjobfiles()
+        self.sync_start()
         logger.info('Running rbd fio %s test.', self.mode)
-        ps = []
-        for i in xrange(self.volumes_per_client):
-            fio_cmd = self.mkfiocmd(i)
-            p = common.pdsh(settings.getnodes('clients'), fio_cmd)
-            ps.append(p)
-        for p in ps:
-            p.wait()
+        if self.fio_server:
+            cmds = executor.fanout(settings.getnodes('head'), self.mkfioclientcmd(), throttle=False)
+            tail = self.watch_workload(self.run_dir, self.out_dir, FIO_JSON, progress.parse_fio_status, None,
+                                       settings.getnodes('head'), progress.FioStatus)
+        else:
+            cmds = []
+            for i in xrange(self.volumes_per_client):
+                fio_cmd = self.mkfiocmd(i)
+                cmds.extend(executor.fanout(self.clients, fio_cmd, throttle=False))
+            tail = self.watch_workload(self.run_dir, self.out_dir, FIO_OUTPUTS, progress.parse_fio_status, None,
+                                       progress_class=progress.FioStatus)
+        with tracing.phase('measure', mode=self.mode):
+            self.wait_workload(cmds, self.out_dir, self.mkkillcmd())
+        if tail is not None:
+            tail.stop()
         # If we were doing recovery, wait until it's done.
         if 'recovery_test' in self.cluster.config:
             self.cluster.wait_recovery_done()
@@ -123,39 +215,114 @@ class LibrbdFio(Benchmark):
 
         # Finally, get the historic ops
         self.cluster.dump_historic_ops(self.run_dir)
-        common.sync_files('%s/*' % self.run_dir, self.out_dir)
+        nodes = None
+        if self.fio_server:
+            nodes = settings.getnodes('clients', 'osds', 'mons', 'rgws', 'mds', 'head')
+        common.sync_files('%s/*' % self.run_dir, self.out_dir, nodes)
+        stopped_early = self.steady_stop is not None and self.attained()
+        self.write_steady_state(self.out_dir, FIO_LOGS, steadystate.parse_fio_log, stopped_early)
 
-    def mkfiocmd(self, volnum):
-        rbdname = 'cbt-librbdfio-`hostname -s`-%d' % volnum
-        out_file = '%s/output.%d' % (self.run_dir, volnum)
+    def get_steady_stop(self):
+        """
+        Detector of the steady_state setting if it has a stop_after and fio
+        can end the jobs itself once they are steady (its steadystate option,
+        fio 3), else None.
+        """
+        detector = steadystate.get_detector(self.config.get('steady_state', settings.cluster.get('steady_state')))
+        if detector is None or not detector.stop_after:
+            return None
+        fio_major = capabilities.min_major(self.clients, 'fio')
+        if fio_major is None or fio_major < 3:
+            logger.warning('fio %s on %s has no steadystate option, ignoring stop_after',
+                           fio_major or 'of unknown version', self.clients)
+            return None
+        return detector
 
-        fio_cmd = 'sudo %s --ioengine=rbd --clientname=admin --pool=%s --rbdname=%s --invalidate=0' % (self.cmd_path_full, self.poolname, rbdname)
-        fio_cmd += ' --rw=%s' % self.mode
+    def attained(self):
+        """Whether fio ended any job of the archived output on its steady state."""
+        return any(FIO_ATTAINED.search(text) for fn, text in self.outputs())
+
+    def mkkillcmd(self):
+        """
+        Command killing the fio jobs of this test but not the fio servers,
+        on the clients (or on the head with fio_server, where the fio
+        client stops the jobs on the servers when interrupted).
+        """
+        if self.fio_server:
+            return "sudo pkill -INT -f '[-]-remote-config %s'" % self.job_file
+        return "sudo pkill -9 -f '[-]-pool=%s '" % self.poolname
+
+    def fio_options(self):
+        """[(option, value or None)] of the fio jobs, on the command line or in job files."""
+        options = [('rw', self.mode)]
         if (self.mode == 'readwrite' or self.mode == 'randrw'):
-            fio_cmd += ' --rwmixread=%s --rwmixwrite=%s' % (self.rwmixread, self.rwmixwrite)
-#        fio_cmd += ' --ioengine=%s' % self.ioengine
+            options += [('rwmixread', self.rwmixread), ('rwmixwrite', self.rwmixwrite)]
+#        options.append(('ioengine', self.ioengine))
         if self.time is not None:
-            fio_cmd += ' --runtime=%s' % self.time
+            options.append(('runtime', self.time))
         if self.ramp is not None:
-            fio_cmd += ' --ramp_time=%s' % self.ramp
-        fio_cmd += ' --numjobs=%s' % self.numjobs
-        fio_cmd += ' --direct=1'
-        fio_cmd += ' --bs=%dB' % self.op_size
-        fio_cmd += ' --iodepth=%d' % self.iodepth
-        fio_cmd += ' --end_fsync=%s' % self.end_fsync
+            options.append(('ramp_time', self.ramp))
+        options += [('numjobs', self.numjobs), ('direct', 1), ('bs', '%dB' % self.op_size),
+                    ('iodepth', self.iodepth), ('end_fsync', self.end_fsync)]
 #        if self.vol_size:
-#            fio_cmd += ' -- size=%dM' % self.vol_size
-        fio_cmd += ' --write_iops_log=%s' % out_file
-        fio_cmd += ' --write_bw_log=%s' % out_file
-        fio_cmd += ' --write_lat_log=%s' % out_file
-        if 'recovery_test' in self.cluster.config:
-            fio_cmd += ' --time_based'
+#            options.append(('size', '%dM' % self.vol_size))
+        # time_based without a runtime would never end
+        if 'recovery_test' in self.cluster.config and self.time is not None:
+            options.append(('time_based', None))
         if self.random_distribution is not None:
-            fio_cmd += ' --random_distribution=%s' % self.random_distribution
+            options.append(('random_distribution', self.random_distribution))
         if self.log_avg_msec is not None:
-            fio_cmd += ' --log_avg_msec=%s' % self.log_avg_msec
+            options.append(('log_avg_msec', self.log_avg_msec))
         if self.rate_iops is not None:
-            fio_cmd += ' --rate_iops=%s' % self.rate_iops
+            options.append(('rate_iops', self.rate_iops))
+        if self.steady_stop is not None:
+            # bandwidth within cov of its mean for the last stop_after seconds
+            options += [('steadystate', 'bw:%g%%' % (self.steady_stop.cov * 100)),
+                        ('steadystate_duration', self.steady_stop.stop_after)]
+        return options
+
+    def mkjobfile(self):
+        """
+        fio job file of a client with a section per volume (and proc per
+        volume), $(hostname -s) is expanded on the client.
+        """
+        lines = ['[global]', 'ioengine=rbd', 'clientname=admin', 'pool=%s' % self.poolname, 'invalidate=0']
+        lines += [key if value is None else '%s=%s' % (key, value) for key, value in self.fio_options()]
+        for volnum in xrange(self.volumes_per_client):
+            out_file = '%s/output.%d' % (self.run_dir, volnum)
+            for i in xrange(self.procs_per_volume):
+                lines += ['', '[librbdfio-$(hostname -s)-%d-%d]' % (volnum, i),
+                          'rbdname=cbt-librbdfio-$(hostname -s)-%d' % volnum,
+                          'write_iops_log=%s' % out_file, 'write_bw_log=%s' % out_file,
+                          'write_lat_log=%s' % out_file]
+        return '\n'.join(lines) + '\n'
+
+    def mkjobfiles(self):
+        """Writes the job file of every client, a copy lands in the archive."""
+        common.pdsh(self.clients, 'cat > %s << EOF\n%sEOF\ncp %s %s/' % (self.job_file, self.mkjobfile(), self.job_file, self.run_dir),
+                    continue_if_error=False).communicate()
+        # the fio client writes the results and logs on the head
+        common.pdsh(settings.getnodes('head'), 'mkdir -p -m0755 -- %s' % self.run_dir).communicate()
+
+    def mkfioclientcmd(self):
+        """fio client command driving the servers of all clients, run on the head."""
+        servers = ' '.join('--client=%s --remote-config %s' % (transport.hostname(node), self.job_file)
+                           for node in transport.split_nodes(self.clients))
+        status = ' --status-interval=1' if self.live else ''
+        return 'sudo %s %s --output-format=json%s > %s/%s' % (self.cmd_path_full, servers, status, self.run_dir, FIO_JSON)
+
+    def mkfiocmd(self, volnum):
+        rbdname = 'cbt-librbdfio-`hostname -s`-%d' % volnum
+        out_file = '%s/output.%d' % (self.run_dir, volnum)
+
+        fio_cmd = 'sudo %s --ioengine=rbd --clientname=admin --pool=%s --rbdname=%s --invalidate=0' % (self.cmd_path_full, self.poolname, rbdname)
+        for key, value in self.fio_options():
+            fio_cmd += ' --%s' % key if value is None else ' --%s=%s' % (key, value)
+        fio_cmd += ' --write_iops_log=%s' % out_file
+        fio_cmd += ' --write_bw_log=%s' % out_file
+        fio_cmd += ' --write_lat_log=%s' % out_file
+        if self.live:
+            fio_cmd += ' --status-interval=1 --output-format=json'
 
         # End the fio_cmd
         fio_cmd += ' %s > %s' % (self.names, out_file)
@@ -166,15 +333,68 @@ class LibrbdFio(Benchmark):
         if (self.use_existing_volumes == False):
           self.cluster.rmpool(self.poolname, self.pool_profile)
           self.cluster.mkpool(self.poolname, self.pool_profile)
-          for node in settings.getnodes('clients').split(','):
+          for node in self.client_names:
               for volnum in xrange(0, self.volumes_per_client):
-                  node = node.rpartition("@")[2]
 #                  common.pdsh(settings.getnodes('head'), '/usr/bin/rbd create cbt-librbdfio-%s-%d --size %s --pool %s --order %s' % (node, volnum, self.vol_size, self.poolname, self.vol_order)).communicate()
                   self.cluster.mkimage('cbt-librbdfio-%s-%d' % (node,volnum), self.vol_size, self.poolname, self.vol_order)
         monitoring.stop()
 
+    def pools(self):
+        if self.use_existing_volumes:
+            return []
+        return [self.poolname]
+
+    def initialize_key(self):
+        return (self.pool_profile, self.vol_size, self.vol_order, self.volumes_per_client,
+                self.procs_per_volume, self.numjobs, self.use_existing_volumes, self.fio_server)
+
+    def estimate_initialize(self):
+        phases = self.estimate_idle(super(LibrbdFio, self).estimate_initialize())
+        if not self.use_existing_volumes:
+            phases['pool_create'] = self.plan_cost('pool_create')
+            # clients prefill their own volumes in parallel
+            phases['prefill'] = self.vol_size * self.volumes_per_client / float(self.plan_cost('prefill_mbps'))
+        return phases
+
+    def estimate_run(self):
+        return {'dropcaches': self.plan_cost('dropcaches'),
+                'settle': 5,
+                'measure': self.plan_seconds(self.ramp) + self.plan_seconds(self.time),
+                'sync': self.plan_cost('sync')}
+
+    def outputs(self):
+        """[(file name, text)] of the archived fio outputs (not the logs)."""
+        outputs = []
+        if not os.path.isdir(self.out_dir):
+            return outputs
+        for fn in sorted(os.listdir(self.out_dir)):
+            if re.match(r'output\.\d+\.', fn) or fn.startswith(FIO_JSON):
+                with open(os.path.join(self.out_dir, fn)) as f:
+                    outputs.append((fn, f.read()))
+        return outputs
+
+    def summary(self):
+        if not os.path.isdir(self.out_dir):
+            return None
+        bw = 0.0
+        lats = []
+        for fn, text in self.outputs():
+            # JSON status documents with live
+            if fn.startswith(FIO_JSON) or text.startswith('{'):
+                file_bw, file_lats = parse_fio_json(text)
+            else:
+                file_bw, file_lats = parse_fio_output(text)
+            bw += file_bw
+            lats.extend(file_lats)
+        # only the steady state seconds if they are known
+        bw = steadystate.steady_mean(self.out_dir, FIO_LOGS, steadystate.parse_fio_log) or bw
+        if not bw:
+            return None
+        return {'throughput': bw, 'latency': sum(lats) / len(lats) if lats else None}
+
     def recovery_callback(self): 
-        common.pdsh(settings.getnodes('clients'), 'sudo killall -9 fio').communicate()
+        nodes = settings.getnodes('head') if self.fio_server else self.clients
+        common.pdsh(nodes, self.mkkillcmd()).communicate()
 
     def __str__(self):
         return "%s\n%s\n%s" % (self.run_dir, self.out_dir, super(LibrbdFio, self).__str__())
@@ -1,7 +1,12 @@
-import subprocess
+import capabilities
 import common
+import executor
 import settings
 import monitoring
+import objectsets
+import progress
+import steadystate
+import tracing
 import os
 import time
 import threading
@@ -10,6 +15,10 @@ import re
 
 from cluster.ceph import Ceph
 from benchmark import Benchmark
+from parsing import rados_bench
+
+# per process rados bench output in the run directory
+RADOS_OUTPUTS = 'output.[0-9]*'
 
 logger = logging.getLogger("cbt")
 
@@ -31,8 +40,12 @@ class Radosbench(Benchmark):
         self.out_dir = '%s/osd_ra-%08d/op_size-%08d/concurrent_ops-%08d' % (self.archive_dir, int(self.osd_ra), int(self.op_size), int(self.concurrent_ops))
         self.pool_profile = config.get('pool_profile', 'default')
         self.cmd_path = config.get('cmd_path', '/usr/bin/rados')
-        self.pool = config.get('target_pool', 'rados-bench-cbt')
+        self.pool = config.get('target_pool', self.pool_name('rados-bench-cbt'))
         self.readmode = config.get('readmode', 'seq')
+        # keep the written objects for later tests, see objectsets.py
+        self.object_set_objects = None
+        if config.get('object_set') and not self.write_only:
+            self.object_set_objects = int(config['object_set']['objects'])
 
     def exists(self):
         if os.path.exists(self.out_dir):
@@ -49,10 +62,7 @@ class Radosbench(Benchmark):
         self.cluster.check_scrub()
         monitoring.stop()
 
-        logger.info('Pausing for 60s for idle monitoring.')
-        monitoring.start("%s/idle_monitoring" % self.run_dir)
-        time.sleep(60)
-        monitoring.stop()
+        self.idle_monitoring()
 
         common.sync_files('%s/*' % self.run_dir, self.out_dir)
 
@@ -60,12 +70,17 @@ class Radosbench(Benchmark):
 
     def run(self):
         super(Radosbench, self).run()
-        
-        # Remake the pools
-        self.mkpools()
 
-        # Run write test
-        self._run('write', '%s/write' % self.run_dir, '%s/write' % self.out_dir)
+        if self.object_set_objects and objectsets.usable(self.cluster, self.object_set_key(), self.object_set_pools()):
+            logger.info('Reading the object set kept from an earlier test.')
+        else:
+            # Remake the pools
+            self.mkpools()
+
+            # Run write test
+            self._run('write', '%s/write' % self.run_dir, '%s/write' % self.out_dir)
+            if self.object_set_objects:
+                self.record_object_set()
         # Run read test unless write_only
         if self.write_only: return
         self._run(self.readmode, '%s/%s' % (self.run_dir, self.readmode), '%s/%s' % (self.out_dir, self.readmode))
@@ -77,15 +92,18 @@ class Radosbench(Benchmark):
 
         if self.concurrent_ops:
             concurrent_ops_str = '--concurrent-ios %s' % self.concurrent_ops
-        #determine rados version    
-        rados_version_str = subprocess.check_output(["rados", "-v"])
-        m = re.findall("version (\d+)", rados_version_str)
-        rados_version = int(m[0])
+        # reads of rados versions before 9 need the object size, the
+        # oldest rados on the clients decides
+        rados_version = capabilities.min_major(self.clients, 'rados')
+        if rados_version is None:
+            logger.warning('rados version of %s unknown, assuming it is recent.', self.clients)
 
-        if mode in ['write'] or rados_version < 9:
+        if mode in ['write'] or (rados_version is not None and rados_version < 9):
             op_size_str = '-b %s' % self.op_size
         else:
             op_size_str = ''
+        if mode == 'write' and self.object_set_objects:
+            op_size_str += ' --max-objects %d' % self.object_set_objects
 
 
         common.make_remote_dir(run_dir)
@@ -100,8 +118,9 @@ class Radosbench(Benchmark):
 
         # Run rados bench
         monitoring.start(run_dir)
+        self.sync_start()
         logger.info('Running radosbench %s test.' % mode)
-        ps = []
+        cmds = []
         for i in xrange(self.concurrent_procs):
             out_file = '%s/output.%s' % (run_dir, i)
             objecter_log = '%s/objecter.%s.log' % (run_dir, i)
@@ -113,10 +132,14 @@ class Radosbench(Benchmark):
                 run_name = ''
             rados_bench_cmd = '%s -c %s -p %s bench %s %s %s %s %s --no-cleanup 2> %s > %s' % \
                  (self.cmd_path_full, self.tmp_conf, pool_name, op_size_str, self.time, mode, concurrent_ops_str, run_name, objecter_log, out_file)
-            p = common.pdsh(settings.getnodes('clients'), rados_bench_cmd)
-            ps.append(p)
-        for p in ps:
-            p.wait()
+            cmds.extend(executor.fanout(self.clients, rados_bench_cmd, throttle=False))
+        # rados bench has no clean way to stop early
+        tail = self.watch_workload(run_dir, out_dir, RADOS_OUTPUTS, progress.parse_rados_bench,
+                                   steadystate.parse_rados_bench)
+        with tracing.phase('measure', mode=mode):
+            self.wait_workload(cmds, out_dir, 'sudo killall -9 rados')
+        if tail is not None:
+            tail.stop()
         monitoring.stop(run_dir)
 
         # If we were doing recovery, wait until it's done.
@@ -126,22 +149,91 @@ class Radosbench(Benchmark):
         # Finally, get the historic ops
         self.cluster.dump_historic_ops(run_dir)
         common.sync_files('%s/*' % run_dir, out_dir)
+        self.write_steady_state(out_dir, RADOS_OUTPUTS, steadystate.parse_rados_bench)
+        rados_bench.write(out_dir)
+
+    def object_set_key(self):
+        return objectsets.set_key(self.pool_profile, self.op_size, self.object_set_id, self.object_set_objects)
+
+    def object_set_pools(self):
+        """{pool: [run names of the rados bench processes writing to it]}"""
+        pools = {}
+        for i in xrange(self.concurrent_procs):
+            for node in self.client_names:
+                if self.pool_per_proc:
+                    pools['rados-bench-%s-%s' % (node, i)] = ['benchmark_last_metadata']
+                else:
+                    pools.setdefault(self.pool, []).append('%s%s-%s' % (self.object_set_id, node, i))
+        return pools
+
+    def record_object_set(self):
+        pools = self.object_set_pools()
+        counts = objectsets.count_objects(self.cluster, pools)
+        for pool, run_names in pools.items():
+            objectsets.record(pool, self.object_set_key(), run_names, counts[pool])
+
+    def pools(self):
+        if self.pool_per_proc:
+            return ['rados-bench-%s-%s' % (node, i) for i in xrange(self.concurrent_procs) for node in self.client_names]
+        return [self.pool]
 
     def mkpools(self):
+        # the object sets in the pools are gone
+        objectsets.forget(self.object_set_pools().keys() + [self.pool])
         monitoring.start("%s/pool_monitoring" % self.run_dir)
         if self.pool_per_proc: # allow use of a separate storage pool per process
-            for i in xrange(self.concurrent_procs):
-                for node in settings.getnodes('clients').split(','):
-                    node = node.rpartition("@")[2]
-                    self.cluster.rmpool('rados-bench-%s-%s' % (node, i), self.pool_profile)
-                    self.cluster.mkpool('rados-bench-%s-%s' % (node, i), self.pool_profile)
+            pools = self.pools()
+            self.cluster.rmpools(pools, self.pool_profile)
+            self.cluster.mkpools(pools, self.pool_profile)
         else: # the default behavior is to use a single Ceph storage pool for all rados bench processes
-            self.cluster.rmpool('rados-bench-cbt', self.pool_profile)
-            self.cluster.mkpool('rados-bench-cbt', self.pool_profile)
+            self.cluster.rmpool(self.pool, self.pool_profile)
+            self.cluster.mkpool(self.pool, self.pool_profile)
         monitoring.stop()
 
+    def estimate_initialize(self):
+        return self.estimate_idle(super(Radosbench, self).estimate_initialize())
+
+    def estimate_run(self):
+        pools = 1
+        if self.pool_per_proc:
+            pools = self.concurrent_procs * len(self.client_names)
+        modes = 1 if self.write_only else 2
+        return {'pool_create': pools * self.plan_cost('pool_create'),
+                'dropcaches': modes * self.plan_cost('dropcaches'),
+                'measure': modes * self.plan_seconds(self.time),
+                'sync': modes * self.plan_cost('sync')}
+
+    def summary(self):
+        """
+        Bandwidth and latency of the write phase, of the read phase for
+        tests that read a kept object set.
+        """
+        out_dir = '%s/write' % self.out_dir
+        if not os.path.isdir(out_dir):
+            out_dir = '%s/%s' % (self.out_dir, self.readmode)
+        if not os.path.isdir(out_dir):
+            return None
+        bw = 0.0
+        lats = []
+        for fn in os.listdir(out_dir):
+            if not re.match(r'output\.\d+\.', fn):
+                continue
+            with open(os.path.join(out_dir, fn)) as f:
+                text = f.read()
+            m = re.search(r'^Bandwidth \(MB/sec\):\s*([\d.]+)', text, re.M)
+            if m:
+                bw += float(m.group(1))
+            m = re.search(r'^Average Latency(?:\(s\))?:\s*([\d.]+)', text, re.M)
+            if m:
+                lats.append(float(m.group(1)) * 1000)
+        # only the steady state seconds if they are known
+        bw = steadystate.steady_mean(out_dir, RADOS_OUTPUTS, steadystate.parse_rados_bench) or bw
+        if not bw:
+            return None
+        return {'throughput': bw, 'latency': sum(lats) / len(lats) if lats else None}
+
     def recovery_callback(self): 
-        common.pdsh(settings.getnodes('clients'), 'sudo killall -9 rados').communicate()
+        common.pdsh(self.clients, 'sudo killall -9 rados').communicate()
 
     def __str__(self):
         return "%s\n%s\n%s" % (self.run_dir, self.out_dir, super(Radosbench, self).__str__())
@@ -2,6 +2,7 @@ import subprocess
 import common
 import settings
 import monitoring
+import tracing
 import os
 import time
 import logging
@@ -20,7 +21,7 @@ class RbdFio(Benchmark):
         self.pool_profile = config.get('pool_profile', 'default')
 
         self.concurrent_procs = config.get('concurrent_procs', 1)
-        self.total_procs = self.concurrent_procs * len(settings.getnodes('clients').split(','))
+        self.total_procs = self.concurrent_procs * len(self.client_names)
         self.time =  str(config.get('time', None))
         self.ramp = str(config.get('ramp', None))
         self.iodepth = config.get('iodepth', 16)
@@ -39,7 +40,7 @@ class RbdFio(Benchmark):
         self.rbdadd_options = config.get('rbdadd_options', 'share')
         self.client_ra = config.get('client_ra', 128)
         self.direct = config.get('direct', 1)
-        self.poolname = "cbt-kernelrbdfio"
+        self.poolname = self.pool_name("cbt-kernelrbdfio")
 
         self.run_dir = '%s/rbdfio/osd_ra-%08d/client_ra-%08d/op_size-%08d/concurrent_procs-%03d/iodepth-%03d/%s' % (self.run_dir, int(self.osd_ra), int(self.client_ra), int(self.op_size), int(self.concurrent_procs), int(self.iodepth), self.mode)
         self.out_dir = '%s/rbdfio/osd_ra-%08d/client_ra-%08d/op_size-%08d/concurrent_procs-%03d/iodepth-%03d/%s' % (self.archive_dir, int(self.osd_ra), int(self.client_ra), int(self.op_size), int(self.concurrent_procs), int(self.iodepth), self.mode)
@@ -63,10 +64,7 @@ class RbdFio(Benchmark):
         self.cluster.check_scrub()
         monitoring.stop()
 
-        logger.info('Pausing for 60s for idle monitoring.')
-        monitoring.start("%s/idle_monitoring" % self.run_dir)
-        time.sleep(60)
-        monitoring.stop()
+        self.idle_monitoring()
 
         common.sync_files('%s/*' % self.run_dir, self.out_dir)
 
@@ -79,7 +77,7 @@ class RbdFio(Benchmark):
         logger.info('Attempting to populating fio files...')
         size = self.vol_size * 0.9 / self.concurrent_procs
         pre_cmd = 'sudo %s --ioengine=%s --rw=write --numjobs=%s --bs=4M --size %dM %s > /dev/null' % (self.cmd_path, self.ioengine, self.numjobs, size, self.names)
-        common.pdsh(settings.getnodes('clients'), pre_cmd).communicate()
+        common.pdsh(self.clients, pre_cmd).communicate()
 
         return True
 
@@ -127,8 +125,10 @@ class RbdFio(Benchmark):
         fio_cmd += ' %s > %s' % (self.names, out_file)
         if self.log_avg_msec is not None:
             fio_cmd += ' --log_avg_msec=%s' % self.log_avg_msec
+        self.sync_start()
         logger.info('Running rbd fio %s test.', self.mode)
-        common.pdsh(settings.getnodes('clients'), fio_cmd).communicate()
+        with tracing.phase('measure', mode=self.mode):
+            common.pdsh(self.clients, fio_cmd).communicate()
 
         # If we were doing recovery, wait until it's done.
         if 'recovery_test' in self.cluster.config:
@@ -144,7 +144,7 @@ class RbdFio(Benchmark):
         super(RbdFio, self).cleanup()
 
     def set_client_param(self, param, value):
-        common.pdsh(settings.getnodes('clients'), 'find /sys/block/rbd* -exec sudo sh -c "echo %s > {}/queue/%s" \;' % (value, param)).communicate()
+        common.pdsh(self.clients, 'find /sys/block/rbd* -exec sudo sh -c "echo %s > {}/queue/%s" \;' % (value, param)).communicate()
 
     def __str__(self):
         return "%s\n%s\n%s" % (self.run_dir, self.out_dir, super(RbdFio, self).__str__())
@@ -153,12 +153,30 @@ class RbdFio(Benchmark):
         monitoring.start("%s/pool_monitoring" % self.run_dir)
         self.cluster.rmpool(self.poolname, self.pool_profile)
         self.cluster.mkpool(self.poolname, self.pool_profile)
-        common.pdsh(settings.getnodes('clients'), '/usr/bin/rbd create cbt-kernelrbdfio-`hostname -s` --size %s --pool %s' % (self.vol_size, self.poolname)).communicate()
-        common.pdsh(settings.getnodes('clients'), 'sudo rbd map cbt-kernelrbdfio-`hostname -s` --pool %s --id admin' % self.poolname).communicate()
-        common.pdsh(settings.getnodes('clients'), 'sudo mkfs.xfs /dev/rbd/cbt-kernelrbdfio/cbt-kernelrbdfio-`hostname -s`').communicate()
-        common.pdsh(settings.getnodes('clients'), 'sudo mkdir -p -m0755 -- %s/cbt-kernelrbdfio-`hostname -s`' % self.cluster.mnt_dir).communicate()
-        common.pdsh(settings.getnodes('clients'), 'sudo mount -t xfs -o noatime,inode64 /dev/rbd/cbt-kernelrbdfio/cbt-kernelrbdfio-`hostname -s` %s/cbt-kernelrbdfio-`hostname -s`' % self.cluster.mnt_dir).communicate()
+        common.pdsh(self.clients, '/usr/bin/rbd create cbt-kernelrbdfio-`hostname -s` --size %s --pool %s' % (self.vol_size, self.poolname)).communicate()
+        common.pdsh(self.clients, 'sudo rbd map cbt-kernelrbdfio-`hostname -s` --pool %s --id admin' % self.poolname).communicate()
+        common.pdsh(self.clients, 'sudo mkfs.xfs /dev/rbd/cbt-kernelrbdfio/cbt-kernelrbdfio-`hostname -s`').communicate()
+        common.pdsh(self.clients, 'sudo mkdir -p -m0755 -- %s/cbt-kernelrbdfio-`hostname -s`' % self.cluster.mnt_dir).communicate()
+        common.pdsh(self.clients, 'sudo mount -t xfs -o noatime,inode64 /dev/rbd/cbt-kernelrbdfio/cbt-kernelrbdfio-`hostname -s` %s/cbt-kernelrbdfio-`hostname -s`' % self.cluster.mnt_dir).communicate()
         monitoring.stop()
 
+    def pools(self):
+        return [self.poolname]
+
+    def initialize_key(self):
+        return (self.pool_profile, self.vol_size, self.concurrent_procs, self.numjobs, self.ioengine)
+
+    def estimate_initialize(self):
+        phases = self.estimate_idle(super(RbdFio, self).estimate_initialize())
+        phases['pool_create'] = self.plan_cost('pool_create')
+        phases['prefill'] = self.vol_size * 0.9 / float(self.plan_cost('prefill_mbps'))
+        return phases
+
+    def estimate_run(self):
+        return {'dropcaches': self.plan_cost('dropcaches'),
+                'settle': 5,
+                'measure': self.plan_seconds(self.ramp) + self.plan_seconds(self.time),
+                'sync': self.plan_cost('sync')}
+
     def recovery_callback(self): 
-        common.pdsh(settings.getnodes('clients'), 'sudo killall -9 fio').communicate()
+        common.pdsh(self.clients, 'sudo killall -9 fio').communicate()
@@ -1,24 +1,118 @@
 import copy
 import itertools
+import logging
+import os
+import random
 
+import yaml
+
+import adaptive
 import settings
-from benchmark.radosbench import Radosbench
-from benchmark.rbdfio import RbdFio
-from benchmark.kvmrbdfio import KvmRbdFio
-from benchmark.librbdfio import LibrbdFio
-from benchmark.nullbench import Nullbench
-from benchmark.cosbench import Cosbench
-from benchmark.cephtestrados import CephTestRados
+
+logger = logging.getLogger("cbt")
+
+# Benchmarks by the name used in the yaml file.  Modules are only imported
+# when a configuration uses them, so e.g. lxml is only needed for cosbench.
+# Out of tree benchmarks can be added with register() or published by any
+# installed package under the 'cbt.benchmarks' entry point group.
+BENCHMARKS = {
+    'nullbench': 'benchmark.nullbench:Nullbench',
+    'radosbench': 'benchmark.radosbench:Radosbench',
+    'rbdfio': 'benchmark.rbdfio:RbdFio',
+    'kvmrbdfio': 'benchmark.kvmrbdfio:KvmRbdFio',
+    'librbdfio': 'benchmark.librbdfio:LibrbdFio',
+    'cosbench': 'benchmark.cosbench:Cosbench',
+    'cephtestrados': 'benchmark.cephtestrados:CephTestRados',
+}
+ENTRY_POINT_GROUP = 'cbt.benchmarks'
+
+_classes = {}
 
 
 def get_all(cluster, iteration):
+    prev = None
     for benchmark, config in sorted(settings.benchmarks.iteritems()):
         default = {"benchmark": benchmark,
                    "iteration": iteration}
 
-        for current in all_configs(config):
-            current.update(default)
-            yield get_object(cluster, benchmark, current)
+        if config.get('adaptive'):
+            for b in adaptive_configs(cluster, benchmark, config, default):
+                yield b
+            prev = None
+            continue
+
+        objects = (get_object(cluster, benchmark, dict(current, **default)) for current in all_configs(config))
+        if settings.cluster.get('schedule', 'config') == 'greedy':
+            objects = schedule(list(objects), prev)
+        for b in objects:
+            yield b
+            prev = b
+
+
+def schedule(benchmarks, prev=None):
+    """
+    Reorder benchmarks to cut setup time: starting after prev, always run
+    next the test with the lowest transition_cost() from the one before
+    (ties keep the configured order).  Tests that already exist cost nothing
+    and come first.  out_dirs depend only on the config, so archive paths
+    do not change.
+    """
+    pending = []
+    for b in benchmarks:
+        if b.exists():
+            yield b
+        else:
+            pending.append(b)
+    total = 0
+    while pending:
+        costs = [b.transition_cost(prev) for b in pending]
+        i = costs.index(min(costs))
+        total += costs[i]
+        prev = pending.pop(i)
+        yield prev
+    logger.debug('Scheduled tests with an estimated %ds of setup', total)
+
+
+def adaptive_configs(cluster, benchmark, config, default):
+    """
+    Like all_configs, but the adaptive param is swept with an AdaptiveSweep
+    for every combination of the other lists.  Each benchmark object must
+    have been run before the next one is requested, its summary() decides
+    what runs next.  The knees found are written to adaptive.<benchmark>.yaml
+    in the archive directory of the iteration.
+    """
+    options = config['adaptive']
+    param = options['param']
+    values = config.get(param)
+    if not isinstance(values, list):
+        values = [values]
+    fixed = dict(config)
+    fixed[param] = values[0]
+
+    reports = []
+    for current in all_configs(fixed):
+        sweep = adaptive.AdaptiveSweep(values, options.get('threshold', 0.1), options.get('latency_factor'),
+                                       options.get('stride', 1), options.get('window', 3))
+        for value in sweep:
+            bconfig = copy.deepcopy(current)
+            bconfig[param] = value
+            bconfig.update(default)
+            b = get_object(cluster, benchmark, bconfig)
+            yield b
+            sweep.record(value, b.summary())
+
+        report = sweep.report()
+        report['config'] = dict((k, v) for k, v in current.iteritems() if k != param and not isinstance(v, dict))
+        reports.append(report)
+        logger.info('%s: %s saturates at %s (%s), skipped %s', benchmark, param, report['knee'],
+                    report['saturated_by'] or 'not reached', report['skipped'])
+        archive_dir = settings.cluster.get('archive_dir')
+        if archive_dir and any(r['points'] for r in reports):
+            fn = os.path.join(archive_dir, '%08d' % default['iteration'], 'adaptive.%s.yaml' % benchmark)
+            if not os.path.isdir(os.path.dirname(fn)):
+                os.makedirs(os.path.dirname(fn))
+            with open(fn, 'w') as f:
+                yaml.safe_dump({'param': param, 'sweeps': reports}, f, default_flow_style=False)
 
 
 def all_configs(config):
@@ -26,36 +120,172 @@ def all_configs(config):
     return all parameter combinations for config
     config: dict - list of params
     iterate over all top-level lists in config
+
+    The optional 'sweep' setting picks how the lists are combined:
+      sweep: product                  # every combination (default)
+      sweep: {strategy: fractional}   # orthogonal array, covers every level
+                                      # of every list and balances pairs
+      sweep: {strategy: lhs, samples: 20, seed: 1}     # latin hypercube
+      sweep: {strategy: random, samples: 20, seed: 1}  # uniform sample
+    Sampled strategies never run fewer points than the longest list, and
+    every strategy yields configs lazily without repeating a point.
     """
     cycle_over_lists = []
     cycle_over_names = []
     default = {}
 
-    for param, value in config.iteritems():
+    sweep = config.get('sweep', 'product')
+    if not isinstance(sweep, dict):
+        sweep = {'strategy': sweep}
+    strategy = sweep.get('strategy', 'product')
+    if strategy not in STRATEGIES:
+        raise ValueError('Unknown sweep strategy %r, use one of %s' % (strategy, ', '.join(sorted(STRATEGIES))))
+
+    for param, value in sorted(config.iteritems()):
+        if param in ['sweep', 'adaptive']:
+            continue
         if isinstance(value, list):
             cycle_over_lists.append(value)
             cycle_over_names.append(param)
         else:
             default[param] = value
 
-    for permutation in itertools.product(*cycle_over_lists):
+    sizes = [len(values) for values in cycle_over_lists]
+    if 0 in sizes:
+        return
+    rng = random.Random(sweep.get('seed', 0))
+    for point in STRATEGIES[strategy](sizes, sweep.get('samples'), rng):
         current = copy.deepcopy(default)
-        current.update(zip(cycle_over_names, permutation))
+        current.update((name, values[i]) for name, values, i in zip(cycle_over_names, cycle_over_lists, point))
         yield current
 
 
+def product_points(sizes, samples, rng):
+    return itertools.product(*[xrange(size) for size in sizes])
+
+
+def _next_prime(n):
+    n = max(n, 2)
+    while any(n % d == 0 for d in xrange(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+def fractional_points(sizes, samples, rng):
+    """
+    Strength 2 orthogonal array OA(p^2, p + 1, p): for a prime p at least
+    the largest list and one less than the number of lists, column c of row
+    (a, b) is (a + c * b) mod p and the last column is b.  Levels beyond a
+    list's length fold back onto it, so every level of every list is run
+    and every pair of lists is (nearly) balanced in p^2 runs.
+    """
+    if not sizes:
+        yield ()
+        return
+    p = _next_prime(max(max(sizes), len(sizes) - 1))
+    seen = set()
+    for a in xrange(p):
+        for b in xrange(p):
+            columns = [(a + c * b) % p for c in xrange(p)] + [b]
+            point = tuple(columns[i] % size for i, size in enumerate(sizes))
+            if point not in seen:
+                seen.add(point)
+                yield point
+
+
+def lhs_points(sizes, samples, rng):
+    """Latin hypercube: every list's levels spread evenly over the samples."""
+    n = max([samples or 0] + sizes)
+    columns = []
+    for size in sizes:
+        column = [i * size // n for i in xrange(n)]
+        rng.shuffle(column)
+        columns.append(column)
+    seen = set()
+    for row in xrange(n):
+        point = tuple(column[row] for column in columns)
+        if point not in seen:
+            seen.add(point)
+            yield point
+
+
+def _decode(index, sizes):
+    point = []
+    for size in reversed(sizes):
+        index, i = divmod(index, size)
+        point.append(i)
+    return tuple(reversed(point))
+
+
+def random_points(sizes, samples, rng):
+    """
+    Uniform sample of the full product without repetition, topped up with
+    random points for any level the sample missed.
+    """
+    total = 1
+    for size in sizes:
+        total *= size
+    n = min(total, max([samples or 0] + sizes))
+    seen = set()
+    for index in rng.sample(xrange(total), n):
+        point = _decode(index, sizes)
+        seen.add(point)
+        yield point
+    for i, size in enumerate(sizes):
+        covered = set(point[i] for point in seen)
+        for level in xrange(size):
+            if level in covered:
+                continue
+            point = list(_decode(rng.randrange(total), sizes))
+            point[i] = level
+            point = tuple(point)
+            if point not in seen:
+                seen.add(point)
+                yield point
+
+
+STRATEGIES = {
+    'product': product_points,
+    'fractional': fractional_points,
+    'lhs': lhs_points,
+    'random': random_points,
+}
+
+
+def register(name, cls):
+    """Register a benchmark class, or a 'module:Class' path imported on first use."""
+    if isinstance(cls, basestring):
+        BENCHMARKS[name] = cls
+        _classes.pop(name, None)
+    else:
+        _classes[name] = cls
+
+
+def _entry_point(name):
+    try:
+        import pkg_resources
+    except ImportError:
+        return None
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP, name):
+        return entry_point.load()
+    return None
+
+
+def get_class(benchmark):
+    cls = _classes.get(benchmark)
+    if cls is not None:
+        return cls
+    path = BENCHMARKS.get(benchmark)
+    if path is not None:
+        module, _, name = path.partition(':')
+        cls = getattr(__import__(module, fromlist=[name]), name)
+    else:
+        cls = _entry_point(benchmark)
+    if cls is None:
+        raise ValueError('Unknown benchmark %r, known benchmarks are %s' % (benchmark, ', '.join(sorted(BENCHMARKS))))
+    _classes[benchmark] = cls
+    return cls
+
+
 def get_object(cluster, benchmark, bconfig):
-    if benchmark == "nullbench":
-        return Nullbench(cluster, bconfig)
-    if benchmark == "radosbench":
-        return Radosbench(cluster, bconfig)
-    if benchmark == "rbdfio":
-        return RbdFio(cluster, bconfig)
-    if benchmark == "kvmrbdfio":
-        return KvmRbdFio(cluster, bconfig)
-    if benchmark == 'librbdfio':
-        return LibrbdFio(cluster, bconfig)
-    if benchmark == 'cosbench':
-        return Cosbench(cluster, bconfig)
-    if benchmark == 'cephtestrados':
-        return CephTestRados(cluster, bconfig)
+    return get_class(benchmark)(cluster, bconfig)
@@ -0,0 +1,142 @@
+import logging
+import os
+import re
+import threading
+
+import yaml
+
+import common
+import settings
+import transport
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Versions and features of the tools cbt drives, per host.
+
+The tools are probed once per session: every host of a role gets a single
+CommandBatch (one round trip) running the probes below, and the results are
+kept for the rest of the run and written to <archive>/capabilities.yaml.
+Hosts asked about later (e.g. clients of a benchmark that were not in the
+cluster section) are probed on first use.
+
+Benchmarks decide on the tools of the hosts that actually run them, e.g.
+
+  capabilities.min_major(self.clients, 'rados')       # oldest rados, or None
+  capabilities.has_feature(self.clients, 'fio', 'rbd')
+
+A tool that is missing or whose version cannot be parsed is None.
+"""
+
+# tool -> command printing its version
+PROBES = [
+    ('rados', 'rados -v'),
+    ('ceph', 'ceph -v'),
+    ('fio', 'fio --version'),
+    ('collectl', 'collectl -v'),
+    ('perf', 'perf --version'),
+]
+
+# feature probes: (tool, command listing the features)
+FEATURE_PROBES = [
+    ('fio', 'fio --enghelp'),
+]
+
+VERSION = re.compile(r'(\d+(?:\.\d+)*)')
+
+_lock = threading.Lock()
+# host -> {tool: {'version': ..., 'major': ..., 'features': [...]} or None}
+_hosts = {}
+_roles = {}
+
+
+def parse_version(text):
+    """{'version': '14.2.22', 'major': 14} of a version banner, None if there is none."""
+    for line in (text or '').splitlines():
+        m = VERSION.search(line)
+        if m:
+            return {'version': m.group(1), 'major': int(m.group(1).split('.')[0])}
+    return None
+
+
+def parse_features(text):
+    """Names listed one per line (fio --enghelp), without the header line."""
+    return [line.strip() for line in (text or '').splitlines()[1:] if line.strip()]
+
+
+def parse_host(steps):
+    """Capabilities of a host of its BatchSteps, in PROBES + FEATURE_PROBES order."""
+    tools = {}
+    for (tool, command), step in zip(PROBES, steps):
+        tools[tool] = parse_version(step.stdout + step.stderr) if step.returncode == 0 else None
+    for (tool, command), step in zip(FEATURE_PROBES, steps[len(PROBES):]):
+        if tools.get(tool) is not None:
+            tools[tool]['features'] = parse_features(step.stdout) if step.returncode == 0 else []
+    return tools
+
+
+def probe(nodes):
+    """Probes the hosts of nodes that were not probed yet, returns {host: capabilities}."""
+    with _lock:
+        missing = [node for node in transport.split_nodes(nodes) if transport.hostname(node) not in _hosts]
+        if missing:
+            batch = common.CommandBatch(','.join(missing))
+            for tool, command in PROBES + FEATURE_PROBES:
+                batch.add(command)
+            results = batch.run()
+            for node in missing:
+                host = transport.hostname(node)
+                steps = results.get(host)
+                if steps is None or steps[0].returncode is None:
+                    logger.warning('Could not probe the tools of %s.', host)
+                    _hosts[host] = dict((tool, None) for tool, command in PROBES)
+                else:
+                    _hosts[host] = parse_host(steps)
+        return dict((transport.hostname(node), _hosts[transport.hostname(node)])
+                    for node in transport.split_nodes(nodes))
+
+
+def probe_cluster():
+    """Probes the hosts of every role and writes capabilities.yaml."""
+    topology = settings.get_topology()
+    for role in topology.ROLES:
+        _roles[role] = topology.hosts(role)
+    probe(topology.targets(*topology.ROLES))
+    write(settings.cluster.get('archive_dir'))
+
+
+def write(archive_dir):
+    if not archive_dir:
+        return
+    with _lock:
+        report = {'roles': dict((role, hosts) for role, hosts in _roles.items() if hosts), 'hosts': _hosts}
+        common.mkdir_p(archive_dir)
+        with open(os.path.join(archive_dir, 'capabilities.yaml'), 'w') as f:
+            yaml.safe_dump(report, f, default_flow_style=False)
+
+
+def min_major(nodes, tool):
+    """Oldest major version of tool on the hosts of nodes, None if unknown on any of them."""
+    majors = []
+    for host, tools in sorted(probe(nodes).items()):
+        if tools.get(tool) is None:
+            return None
+        majors.append(tools[tool]['major'])
+    return min(majors) if majors else None
+
+
+def has_feature(nodes, tool, feature):
+    """Whether tool has feature on all the hosts of nodes, None if tool is unknown on any of them."""
+    for host, tools in probe(nodes).items():
+        if tools.get(tool) is None:
+            return None
+        if feature not in tools[tool].get('features', []):
+            return False
+    return True
+
+
+def reset():
+    """Forgets the probed hosts (tests)."""
+    with _lock:
+        _hosts.clear()
+        _roles.clear()
@@ -7,6 +7,12 @@ import sys
 
 import settings
 import benchmarkfactory
+import capabilities
+import confidence
+import groups
+import ledger
+import planner
+import tracing
 from cluster.ceph import Ceph
 from log_support import setup_loggers
 
@@ -27,6 +33,12 @@ def parse_args(args):
         help='The ceph.conf file to use.',
         )
 
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Only estimate the tests and their duration, do not run them.',
+        )
+
     parser.add_argument(
         'config_file',
         help='YAML config file.',
@@ -35,10 +47,48 @@ def parse_args(args):
     return parser.parse_args(args[1:])
 
 
+def init_name(b):
+    """Key of the benchmark in global_init, benchmarks on client groups are initialized per group."""
+    if b.client_group:
+        return '%s/%s' % (b.getclass(), b.client_group)
+    return b.getclass()
+
+
+def prepare(b, global_init):
+    """Initializes the benchmark unless an earlier test did, returns whether it did."""
+    key = init_name(b)
+
+    # Initialize again if settings initialize() uses changed.
+    initialized = global_init.get(key)
+    if initialized is not None and initialized.initialize_key() != b.initialize_key():
+        logger.info('Settings of %s initialization changed, initializing again.', key)
+        with tracing.phase('cleanup', benchmark=b.getclass()):
+            initialized.cleanup()
+        del global_init[key]
+
+    # Tell the benchmark to initialize unless it's in the skip list.
+    if key in global_init:
+        return False
+    with tracing.phase('initialize', benchmark=b.getclass()):
+        b.initialize()
+
+    # Skip future initializations unless rebuild requested.
+    if not settings.cluster.get('rebuild_every_test', False):
+        global_init[key] = b
+    return True
+
+
+def finish(b, global_init):
+    if init_name(b) not in global_init:
+        with tracing.phase('cleanup', benchmark=b.getclass()):
+            b.cleanup()
+
+
 def main(argv):
     setup_loggers()
     ctx = parse_args(argv)
     settings.initialize(ctx)
+    tracing.tracer.enabled = settings.cluster.get('trace', True)
 
     iteration = 0
     logger.debug("Settings.cluster:\n    %s",
@@ -49,29 +99,86 @@ def main(argv):
     # FIXME: Create ClusterFactory and parametrically match benchmarks and clusters.
     cluster = Ceph(settings.cluster)
 
+    if ctx.plan:
+        return planner.main(cluster)
+
     # E_OK
     return_code = 0
 
+    # versions of the tools on the hosts, benchmarks choose their flags by them
+    capabilities.probe_cluster()
+
+    tests = ledger.open_ledger()
+    tracker = confidence.get_tracker(settings.cluster)
     try:
         for iteration in range(settings.cluster.get("iterations", 0)):
             benchmarks = benchmarkfactory.get_all(cluster, iteration)
+            grouped = collections.OrderedDict()
+            # tests of this iteration that have results
+            completed = []
             for b in benchmarks:
-                if b.exists():
+                # Stop repeating tests whose results are already precise enough.
+                if tracker is not None and tracker.converged(b):
                     continue
+                if tests.skip(b):
+                    if b.exists():
+                        completed.append(b)
+                    continue
+                completed.append(b)
 
-                # Tell the benchmark to initialize unless it's in the skip list.
-                if b.getclass() not in global_init:
-                    b.initialize()
-
-                    # Skip future initializations unless rebuild requested.
-                    if not settings.cluster.get('rebuild_every_test', False):
-                        global_init[b.getclass()] = b
+                # Tests on client groups run concurrently after the others.
+                if b.client_group:
+                    grouped.setdefault(b.client_group, []).append(b)
+                    continue
 
+                tracing.tracer.start_test(getattr(b, 'out_dir', b.getclass()))
+                tests.start(b)
+                try:
+                    prepare(b, global_init)
+                    try:
+                        with tracing.phase('run', benchmark=b.getclass()):
+                            b.run()
+                        tests.synced(b)
+                    finally:
+                        finish(b, global_init)
+                        tracing.tracer.end_test()
+                    tests.done(b)
+                except BaseException as e:
+                    tests.failed(b, e)
+                    raise
+
+            for index, members in enumerate(groups.rounds(grouped)):
+                name = 'concurrent-%03d' % index
+                tracing.tracer.start_test(name)
+                for b in members:
+                    tests.start(b)
                 try:
-                    b.run()
-                finally:
-                    if b.getclass() not in global_init:
-                        b.cleanup()
+                    try:
+                        groups.check_round(members)
+                        initialized = False
+                        for b in members:
+                            # Only the first initialization of the round may
+                            # clean up or rebuild the cluster.
+                            b.keep_cluster = initialized
+                            initialized = prepare(b, global_init) or initialized
+                        groups.run_concurrent(members,
+                                              '%s/%08d/%s' % (settings.cluster.get('tmp_dir'), iteration, name),
+                                              '%s/%08d/%s' % (settings.cluster.get('archive_dir'), iteration, name),
+                                              tests)
+                    finally:
+                        for b in members:
+                            finish(b, global_init)
+                        tracing.tracer.end_test()
+                    for b in members:
+                        tests.done(b)
+                except BaseException as e:
+                    for b in members:
+                        tests.failed(b, e)
+                    raise
+
+            if tracker is not None:
+                for b in completed:
+                    tracker.add(b)
     except:
         return_code = 1  # FAIL
         logger.exception("During tests")
@@ -82,6 +189,13 @@ def main(argv):
             except:
                 logger.exception("During %s cleanup", k)
                 return_code = 1  # FAIL
+        tracing.tracer.write(settings.cluster.get('archive_dir'))
+        # including hosts the benchmarks probed later
+        capabilities.write(settings.cluster.get('archive_dir'))
+        if tracker is not None and settings.cluster.get('archive_dir'):
+            tracker.write(settings.cluster.get('archive_dir'))
+        logger.info('Ledger: %s', ', '.join('%d %s' % (n, state) for state, n in sorted(tests.summary().items())))
+        tests.close()
 
     return return_code
 
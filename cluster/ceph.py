@@ -1,5 +1,7 @@
 import subprocess
 import common
+import executor
+import idle
 import settings
 import monitoring
 import os
@@ -13,12 +15,6 @@ from cluster import Cluster
 
 logger = logging.getLogger("cbt")
 
-def sshtarget(user, host):
-    h = host
-    if user:
-        h = '%s@%s' % (user, host)
-    return h
-
 # to bring an OSD up, this sequence of steps must be performed in this order
 # but there are no cross-OSD dependencies so we can bring up multiple OSDs
 # in parallel.
@@ -41,7 +37,7 @@ class OsdThread(threading.Thread):
         try:
             key_fn = '%s/keyring'%self.osddir
             ceph_conf = self.cl_obj.tmp_conf
-            phost = sshtarget(settings.cluster.get('user'), self.host)
+            phost = settings.get_topology().target(self.host)
             common.pdsh(phost, 'sudo %s -c %s osd crush add osd.%d 1.0 host=%s rack=localrack root=default' % (self.cl_obj.ceph_cmd, ceph_conf, self.osdnum, self.host)).communicate()
             cmd='ulimit -n 16384 && ulimit -c unlimited && exec %s -c %s -i %d --mkfs --mkkey --osd-uuid %s' % (self.cl_obj.ceph_osd_cmd, ceph_conf, self.osdnum, self.osduuid)
             common.pdsh(phost, 'sudo sh -c "%s"' % cmd).communicate()
@@ -114,6 +110,8 @@ class Ceph(Cluster):
         self.use_existing = config.get('use_existing', True)
         self.stoprequest = threading.Event()
         self.haltrequest = threading.Event()
+        # values set by set_osd_param, so unchanged values are not set again
+        self.osd_params = {}
 
 
     def initialize(self): 
@@ -122,6 +120,7 @@ class Ceph(Cluster):
              raise RuntimeError('initialize was called on an existing cluster! Avoiding touching anything.') 
 
         super(Ceph, self).initialize()
+        self.osd_params = {}
 
         # unmount any kernel rbd volumes
         self.rbd_unmount()
@@ -165,27 +164,43 @@ class Ceph(Cluster):
         self.make_profiles()
 
         # Peform Idle Monitoring
-        if self.idle_duration > 0:
-            monitoring.start("%s/idle_monitoring" % self.monitoring_dir)
-            time.sleep(self.idle_duration)
-            monitoring.stop()
+        self.idle_monitoring()
 
         return True
 
+    def idle_monitoring(self):
+        """
+        Monitors the new cluster until it is quiet with the idle setting (see
+        idle.py), otherwise for idle_duration seconds.
+        """
+        detector = idle.get_detector(settings.cluster)
+        if detector is None and self.idle_duration <= 0:
+            return
+        monitoring.start("%s/idle_monitoring" % self.monitoring_dir)
+        try:
+            if detector is not None:
+                self.wait_idle(detector)
+            else:
+                time.sleep(self.idle_duration)
+        finally:
+            monitoring.stop()
+
     def shutdown(self):
         nodes = settings.getnodes('clients', 'osds', 'mons', 'rgws', 'mds')
 
-        common.pdsh(nodes, 'sudo killall -9 massif-amd64-li').communicate()
-        common.pdsh(nodes, 'sudo killall -9 memcheck-amd64-').communicate()
-        common.pdsh(nodes, 'sudo killall -9 ceph-osd').communicate()
-        common.pdsh(nodes, 'sudo killall -9 ceph-mon').communicate()
-        common.pdsh(nodes, 'sudo killall -9 ceph-mds').communicate()
-        common.pdsh(nodes, 'sudo killall -9 rados').communicate()
-        common.pdsh(nodes, 'sudo killall -9 rest-bench').communicate()
-        common.pdsh(nodes, 'sudo killall -9 radosgw').communicate()
-        common.pdsh(nodes, 'sudo killall -9 radosgw-admin').communicate()
-        common.pdsh(nodes, 'sudo /etc/init.d/apache2 stop').communicate()
-        common.pdsh(nodes, 'sudo killall -9 pdsh').communicate()
+        batch = common.CommandBatch(nodes)
+        batch.add('sudo killall -9 massif-amd64-li')
+        batch.add('sudo killall -9 memcheck-amd64-')
+        batch.add('sudo killall -9 ceph-osd')
+        batch.add('sudo killall -9 ceph-mon')
+        batch.add('sudo killall -9 ceph-mds')
+        batch.add('sudo killall -9 rados')
+        batch.add('sudo killall -9 rest-bench')
+        batch.add('sudo killall -9 radosgw')
+        batch.add('sudo killall -9 radosgw-admin')
+        batch.add('sudo /etc/init.d/apache2 stop')
+        batch.add('sudo killall -9 pdsh')
+        batch.run()
         monitoring.stop()
 
     def cleanup(self):
@@ -253,7 +268,6 @@ class Ceph(Cluster):
         common.pdcp(settings.getnodes('mons', 'osds', 'rgws', 'mds'), '', '%s.tmp' % self.keyring_fn, self.keyring_fn).communicate()
 
         # Build the monmap, retrieve it, and distribute it
-        mons = settings.getnodes('mons').split(',')
         cmd = 'monmaptool --create --clobber'
         monhosts = settings.cluster.get('mons')
         logger.info(monhosts)
@@ -266,10 +280,9 @@ class Ceph(Cluster):
         common.pdcp(settings.getnodes('mons'), '', '%s.tmp' % self.monmap_fn, self.monmap_fn).communicate()
 
         # Build the ceph-mons
-        user = settings.cluster.get('user')
+        topology = settings.get_topology()
         for monhost, mons in monhosts.iteritems():
-            if user:
-                monhost = '%s@%s' % (user, monhost)
+            monhost = topology.target(monhost)
             for mon, addr in mons.iteritems():
                 common.pdsh(monhost, 'sudo rm -rf %s/mon.%s' % (self.tmp_dir, mon)).communicate()
                 common.pdsh(monhost, 'mkdir -p %s/mon.%s' % (self.tmp_dir, mon)).communicate()
@@ -278,8 +291,7 @@ class Ceph(Cluster):
             
         # Start the mons
         for monhost, mons in monhosts.iteritems():
-            if user:
-                monhost = '%s@%s' % (user, monhost)
+            monhost = topology.target(monhost)
             for mon, addr in mons.iteritems():
                 pidfile="%s/%s.pid" % (self.pid_dir, monhost)
                 cmd = 'sudo sh -c "ulimit -n 16384 && ulimit -c unlimited && exec %s -c %s -i %s --keyring=%s --pid-file=%s"' % (self.ceph_mon_cmd, self.tmp_conf, mon, self.keyring_fn, pidfile)
@@ -293,7 +305,7 @@ class Ceph(Cluster):
         osdnum = 0
         osdhosts = settings.cluster.get('osds')
         clusterid = self.config.get('clusterid')
-        user = settings.cluster.get('user')
+        topology = settings.get_topology()
         thread_list = []
 
         # set up degree of OSD creation parallelism
@@ -313,7 +325,7 @@ class Ceph(Cluster):
         threads_finished = 0
         for host in osdhosts:
             for devnumstr in xrange(0, settings.cluster.get('osds_per_node')):            
-                pdshhost = sshtarget(user, host)
+                pdshhost = topology.target(host)
                 # Build the OSD
                 osduuid = str(uuid.uuid4())
 #                osddir='/var/lib/ceph/osd/%s-%d'%(clusterid, osdnum)
@@ -346,10 +358,7 @@ class Ceph(Cluster):
         rgwhosts = settings.cluster.get('rgws', [])
 
         for host in rgwhosts:
-            pdshhost = host
-            user = settings.cluster.get('user')
-            if user:
-                pdshhost = '%s@%s' % (user, host)
+            pdshhost = settings.get_topology().target(host)
             cmd = '%s -c %s -n client.radosgw.gateway --log-file=%s/rgw.log' % (self.ceph_rgw_cmd, self.tmp_conf, self.log_dir)
             if self.rgw_valgrind:
                 cmd = "%s %s" % (common.setup_valgrind(self.rgw_valgrind, 'rgw.%s' % host, self.tmp_dir), cmd)
@@ -385,13 +394,46 @@ class Ceph(Cluster):
     def check_scrub(self):
         logger.info('Waiting until Scrubbing completes...')
         while True:
-            stdout, stderr = common.pdsh(settings.getnodes('head'), '%s -c %s pg dump | cut -f 16 | grep "0.000000" | wc -l' % (self.ceph_cmd, self.tmp_conf)).communicate()
-            if " 0\n" in stdout:
+            proc = common.pdsh(settings.getnodes('head'), '%s -c %s pg dump | cut -f 16 | grep "0.000000" | wc -l' % (self.ceph_cmd, self.tmp_conf))
+            unscrubbed = [int(line) for host, line in proc.stream() if line.strip().isdigit()]
+            if unscrubbed and not any(unscrubbed):
                 break
             else:
-                logger.info(stdout)
+                logger.info('PGs still waiting for scrub: %s', unscrubbed)
             time.sleep(1)
 
+    def wait_idle(self, detector):
+        """
+        Samples the cluster until the detector finds it quiet (see idle.py),
+        returns the seconds waited.  Raises idle.ClusterBusy on timeout.
+        """
+        logger.info('Waiting until the cluster is quiet for %ss...', detector.quiet)
+        start = time.time()
+        prev = prev_time = None
+        status_known = True
+        while True:
+            proc = common.pdsh(settings.getnodes('head'), '%s -c %s status --format json' % (self.ceph_cmd, self.tmp_conf))
+            status = ''.join(line for host, line in proc.stream())
+            try:
+                io = idle.client_io(status)
+            except (ValueError, AttributeError):
+                if status_known:
+                    logger.warning('Cannot parse ceph status, only disk utilization is checked')
+                status_known = False
+                io = None
+            ticks = idle.io_ticks(common.pdsh(settings.getnodes('osds'), 'cat /proc/diskstats').stream())
+            now = time.time()
+            util = None
+            if prev is not None:
+                util = idle.disk_util(prev, ticks, now - prev_time)
+            prev, prev_time = ticks, now
+            if detector.sample(io, util, now):
+                break
+            time.sleep(detector.interval)
+        waited = time.time() - start
+        logger.info('Cluster idle after %.0fs.', waited)
+        return waited
+
     def dump_config(self, run_dir):
         common.pdsh(settings.getnodes('osds'), 'sudo %s -c %s --admin-daemon /var/run/ceph/ceph-osd.0.asok config show > %s/ceph_settings.out' % (self.ceph_cmd, self.tmp_conf, run_dir)).communicate()
 
@@ -399,7 +441,11 @@ class Ceph(Cluster):
         common.pdsh(settings.getnodes('osds'), 'find /var/run/ceph/*.asok -maxdepth 1 -exec sudo %s --admin-daemon {} dump_historic_ops \; > %s/historic_ops.out' % (self.ceph_cmd, run_dir)).communicate()
 
     def set_osd_param(self, param, value):
-        common.pdsh(settings.getnodes('osds'), 'find /dev/disk/by-partlabel/osd-device-*data -exec readlink {} \; | cut -d"/" -f 3 | sed "s/[0-9]$//" | xargs -I{} sudo sh -c "echo %s > /sys/block/\'{}\'/queue/%s"' % (value, param))
+        if self.osd_params.get(param) == value:
+            logger.debug('OSD %s is already %s', param, value)
+            return
+        common.pdsh(settings.getnodes('osds'), 'find /dev/disk/by-partlabel/osd-device-*data -exec readlink {} \; | cut -d"/" -f 3 | sed "s/[0-9]$//" | xargs -I{} sudo sh -c "echo %s > /sys/block/\'{}\'/queue/%s"' % (value, param)).communicate()
+        self.osd_params[param] = value
 
 
     def __str__(self):
@@ -435,19 +481,21 @@ class Ceph(Cluster):
     def make_profiles(self):
         crush_profiles = self.config.get('crush_profiles', {})
         for name,profile in crush_profiles.items():
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd crush add-bucket %s-root root' % (self.ceph_cmd, self.tmp_conf, name)).communicate()
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd crush add-bucket %s-rack rack' % (self.ceph_cmd, self.tmp_conf, name)).communicate()
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd crush move %s-rack root=%s-root' % (self.ceph_cmd, self.tmp_conf, name, name)).communicate()
-            # FIXME: We need to build a dict mapping OSDs to hosts and create a proper hierarchy!
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd crush add-bucket %s-host host' % (self.ceph_cmd, self.tmp_conf, name)).communicate()
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd crush move %s-host rack=%s-rack' % (self.ceph_cmd, self.tmp_conf, name, name)).communicate()
-            
             osds = profile.get('osds', None)
             if not osds:
                 raise Exception("No OSDs defined for crush profile, bailing!")
+
+            batch = common.CommandBatch(settings.getnodes('head'))
+            batch.add('%s -c %s osd crush add-bucket %s-root root' % (self.ceph_cmd, self.tmp_conf, name))
+            batch.add('%s -c %s osd crush add-bucket %s-rack rack' % (self.ceph_cmd, self.tmp_conf, name))
+            batch.add('%s -c %s osd crush move %s-rack root=%s-root' % (self.ceph_cmd, self.tmp_conf, name, name))
+            # FIXME: We need to build a dict mapping OSDs to hosts and create a proper hierarchy!
+            batch.add('%s -c %s osd crush add-bucket %s-host host' % (self.ceph_cmd, self.tmp_conf, name))
+            batch.add('%s -c %s osd crush move %s-host rack=%s-rack' % (self.ceph_cmd, self.tmp_conf, name, name))
             for i in osds:
-                common.pdsh(settings.getnodes('head'), '%s -c %s osd crush set %s 1.0 host=%s-host' % (self.ceph_cmd, self.tmp_conf, i, name)).communicate()
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd crush rule create-simple %s %s-root osd' % (self.ceph_cmd, self.tmp_conf, name, name)).communicate()
+                batch.add('%s -c %s osd crush set %s 1.0 host=%s-host' % (self.ceph_cmd, self.tmp_conf, i, name))
+            batch.add('%s -c %s osd crush rule create-simple %s %s-root osd' % (self.ceph_cmd, self.tmp_conf, name, name))
+            batch.run()
             self.set_ruleset(name)
 
         erasure_profiles = self.config.get('erasure_profiles', {})
@@ -457,7 +505,50 @@ class Ceph(Cluster):
 	    common.pdsh(settings.getnodes('head'), '%s -c %s osd erasure-code-profile set %s ruleset-failure-domain=osd k=%s m=%s' % (self.ceph_cmd, self.tmp_conf, name, k, m)).communicate()
             self.set_ruleset(name)
 
+    def pool_batches(self, commands):
+        """
+        Runs lists of commands on the head, each list as one CommandBatch
+        round trip, with at most pool_parallel (default 4) of them in flight
+        so the monitors are not flooded.
+        """
+        commands = [c for c in commands if c]
+        if not commands:
+            return
+        head = settings.getnodes('head')
+        ex = executor.Executor(max_per_host=self.config.get('pool_parallel', 4))
+        try:
+            batches = []
+            for batch_commands in commands:
+                batch = common.CommandBatch(head)
+                for command in batch_commands:
+                    batch.add(command)
+                batches.append((batch, ex.submit(head, batch.script())))
+            executor.wait([cmd for batch, cmd in batches])
+            for batch, cmd in batches:
+                res = cmd.result()
+                steps = batch.collect(res.host, res.stdout, res.stderr)
+                if not steps:
+                    logger.error('%s: the batch did not run: %s', res.host, res.stderr.strip())
+                for step in steps:
+                    if step.returncode:
+                        logger.warning('%s: %s', res.host, step)
+        finally:
+            ex.shutdown()
+
+    def chunks(self, names):
+        """names in chunks of pool_batch (default 8) pools per round trip."""
+        size = self.config.get('pool_batch', 8)
+        return [names[i:i + size] for i in xrange(0, len(names), size)]
+
     def mkpool(self, name, profile_name, base_name=None):
+        self.mkpools([name], profile_name, base_name and [base_name])
+
+    def mkpools(self, names, profile_name, base_names=None):
+        """
+        Creates the pools of names with the settings of profile_name.  The
+        pools are created in batches, then the health is checked once for
+        all of them.  base_names are the pools they are cache tiers of.
+        """
         pool_profiles = self.config.get('pool_profiles', {'default': {}})
         profile = pool_profiles.get(profile_name, {})
 
@@ -482,19 +573,6 @@ class Ceph(Cluster):
         prefill_object_size = profile.get('prefill_object_size', 0)
         prefill_time = profile.get('prefill_time', 0)
 
-#        common.pdsh(settings.getnodes('head'), 'sudo ceph -c %s osd pool delete %s %s --yes-i-really-really-mean-it' % (self.tmp_conf, name, name)).communicate()
-        common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool create %s %d %d %s' % (self.ceph_cmd, self.tmp_conf, name, pg_size, pgp_size, erasure_profile)).communicate()
-
-        if replication and replication == 'erasure':
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool create %s %d %d erasure %s' % (self.ceph_cmd, self.tmp_conf, name, pg_size, pgp_size, erasure_profile)).communicate()
-        else:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool create %s %d %d' % (self.ceph_cmd, self.tmp_conf, name, pg_size, pgp_size)).communicate()
-
-        if replication and replication.isdigit():
-            pool_repl_size = int(replication)
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s size %s' % (self.ceph_cmd, self.tmp_conf, name, replication)).communicate()
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s min_size %d' % (self.ceph_cmd, self.tmp_conf, name, pool_repl_size-1)).communicate()
-
         if crush_profile:
             try:
               rule_index = int(crush_profile)
@@ -503,61 +581,102 @@ class Ceph(Cluster):
               ruleset = crush_profile
             except ValueError as e:
               ruleset = self.get_ruleset(crush_profile)
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s crush_ruleset %s' % (self.ceph_cmd, self.tmp_conf, name, crush_profile)).communicate()
 
-        logger.info('Checking Healh after pool creation.')
+        # The creation and pool settings are sent to the head in batches
+        batches = []
+        for chunk in self.chunks(names):
+            commands = []
+            for name in chunk:
+#                commands.append('sudo ceph -c %s osd pool delete %s %s --yes-i-really-really-mean-it' % (self.tmp_conf, name, name))
+                commands.append('sudo %s -c %s osd pool create %s %d %d %s' % (self.ceph_cmd, self.tmp_conf, name, pg_size, pgp_size, erasure_profile))
+
+                if replication and replication == 'erasure':
+                    commands.append('sudo %s -c %s osd pool create %s %d %d erasure %s' % (self.ceph_cmd, self.tmp_conf, name, pg_size, pgp_size, erasure_profile))
+                else:
+                    commands.append('sudo %s -c %s osd pool create %s %d %d' % (self.ceph_cmd, self.tmp_conf, name, pg_size, pgp_size))
+
+                if replication and replication.isdigit():
+                    pool_repl_size = int(replication)
+                    commands.append('sudo %s -c %s osd pool set %s size %s' % (self.ceph_cmd, self.tmp_conf, name, replication))
+                    commands.append('sudo %s -c %s osd pool set %s min_size %d' % (self.ceph_cmd, self.tmp_conf, name, pool_repl_size-1))
+
+                if crush_profile:
+                    commands.append('sudo %s -c %s osd pool set %s crush_ruleset %s' % (self.ceph_cmd, self.tmp_conf, name, crush_profile))
+            batches.append(commands)
+        self.pool_batches(batches)
+
+        logger.info('Checking Healh after creating %d pools.', len(names))
         self.check_health()
 
         if prefill_objects > 0 or prefill_time > 0:
-            logger.info('prefilling %s %sbyte objects into pool %s' % (prefill_objects, prefill_object_size, name))
-            common.pdsh(settings.getnodes('head'), 'sudo %s -p %s bench %s write -b %s --max-objects %s --no-cleanup' % (self.rados_cmd, name, prefill_time, prefill_object_size, prefill_objects)).communicate()
+            for name in names:
+                logger.info('prefilling %s %sbyte objects into pool %s' % (prefill_objects, prefill_object_size, name))
+                common.pdsh(settings.getnodes('head'), 'sudo %s -p %s bench %s write -b %s --max-objects %s --no-cleanup' % (self.rados_cmd, name, prefill_time, prefill_object_size, prefill_objects)).communicate()
             self.check_health()
 
-        if base_name and cache_mode:
-            logger.info("Adding %s as cache tier for %s.", name, base_name)
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd tier add %s %s' % (self.ceph_cmd, self.tmp_conf, base_name, name)).communicate()
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd tier cache-mode %s %s' % (self.ceph_cmd, self.tmp_conf, name, cache_mode)).communicate()
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd tier set-overlay %s %s' % (self.ceph_cmd, self.tmp_conf, base_name, name)).communicate()
-
-        if hit_set_type:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s hit_set_type %s' % (self.ceph_cmd, self.tmp_conf, name, hit_set_type)).communicate()
-        if hit_set_count:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s hit_set_count %s' % (self.ceph_cmd, self.tmp_conf, name, hit_set_count)).communicate()
-        if hit_set_period:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s hit_set_period %s' % (self.ceph_cmd, self.tmp_conf, name, hit_set_period)).communicate()
-        if target_max_objects:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s target_max_objects %s' % (self.ceph_cmd, self.tmp_conf, name, target_max_objects)).communicate()
-        if target_max_bytes:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s target_max_bytes %s' % (self.ceph_cmd, self.tmp_conf, name, target_max_bytes)).communicate()
-        if min_read_recency_for_promote:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s min_read_recency_for_promote %s' % (self.ceph_cmd, self.tmp_conf, name, min_read_recency_for_promote)).communicate()
-        if min_write_recency_for_promote:
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool set %s min_write_recency_for_promote %s' % (self.ceph_cmd, self.tmp_conf, name, min_write_recency_for_promote)).communicate()
+        # Tiering and cache settings, again in batches
+        batches = []
+        for chunk in self.chunks(range(len(names))):
+            commands = []
+            for i in chunk:
+                name = names[i]
+                base_name = base_names and base_names[i]
+                if base_name and cache_mode:
+                    logger.info("Adding %s as cache tier for %s.", name, base_name)
+                    commands.append('sudo %s -c %s osd tier add %s %s' % (self.ceph_cmd, self.tmp_conf, base_name, name))
+                    commands.append('sudo %s -c %s osd tier cache-mode %s %s' % (self.ceph_cmd, self.tmp_conf, name, cache_mode))
+                    commands.append('sudo %s -c %s osd tier set-overlay %s %s' % (self.ceph_cmd, self.tmp_conf, base_name, name))
+
+                if hit_set_type:
+                    commands.append('sudo %s -c %s osd pool set %s hit_set_type %s' % (self.ceph_cmd, self.tmp_conf, name, hit_set_type))
+                if hit_set_count:
+                    commands.append('sudo %s -c %s osd pool set %s hit_set_count %s' % (self.ceph_cmd, self.tmp_conf, name, hit_set_count))
+                if hit_set_period:
+                    commands.append('sudo %s -c %s osd pool set %s hit_set_period %s' % (self.ceph_cmd, self.tmp_conf, name, hit_set_period))
+                if target_max_objects:
+                    commands.append('sudo %s -c %s osd pool set %s target_max_objects %s' % (self.ceph_cmd, self.tmp_conf, name, target_max_objects))
+                if target_max_bytes:
+                    commands.append('sudo %s -c %s osd pool set %s target_max_bytes %s' % (self.ceph_cmd, self.tmp_conf, name, target_max_bytes))
+                if min_read_recency_for_promote:
+                    commands.append('sudo %s -c %s osd pool set %s min_read_recency_for_promote %s' % (self.ceph_cmd, self.tmp_conf, name, min_read_recency_for_promote))
+                if min_write_recency_for_promote:
+                    commands.append('sudo %s -c %s osd pool set %s min_write_recency_for_promote %s' % (self.ceph_cmd, self.tmp_conf, name, min_write_recency_for_promote))
+            batches.append(commands)
+        self.pool_batches(batches)
 
         logger.info('Final Pool Health Check.')
         self.check_health()
 
-        # If there is a cache profile assigned, make a cache pool
+        # If there is a cache profile assigned, make the cache pools
         if cache_profile:
-            cache_name = '%s-cache' % name
-            self.mkpool(cache_name, cache_profile, name)
+            self.mkpools(['%s-cache' % name for name in names], cache_profile, names)
 
     def rmpool(self, name, profile_name):
+        self.rmpools([name], profile_name)
+
+    def rmpools(self, names, profile_name):
+        """Deletes the pools of names (and their cache pools) in batches."""
         pool_profiles = self.config.get('pool_profiles', {'default': {}})
         profile = pool_profiles.get(profile_name, {})
         cache_profile = profile.get('cache_profile', None)
         if cache_profile:
-            cache_name = '%s-cache' % name
-
             # flush and remove the overlay and such
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd tier cache-mode %s forward' % (self.ceph_cmd, self.tmp_conf, cache_name)).communicate()
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s -p %s cache-flush-evict-all' % (self.rados_cmd, self.tmp_conf, cache_name)).communicate()
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd tier remove-overlay %s' % (self.ceph_cmd, self.tmp_conf, name)).communicate()
-            common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd tier remove %s %s' % (self.ceph_cmd, self.tmp_conf, name, cache_name)).communicate()
-
-            # delete the cache pool
-            self.rmpool(cache_name, cache_profile)
-        common.pdsh(settings.getnodes('head'), 'sudo %s -c %s osd pool delete %s %s --yes-i-really-really-mean-it' % (self.ceph_cmd, self.tmp_conf, name, name)).communicate()
+            batches = []
+            for chunk in self.chunks(names):
+                commands = []
+                for name in chunk:
+                    cache_name = '%s-cache' % name
+                    commands.append('sudo %s -c %s osd tier cache-mode %s forward' % (self.ceph_cmd, self.tmp_conf, cache_name))
+                    commands.append('sudo %s -c %s -p %s cache-flush-evict-all' % (self.rados_cmd, self.tmp_conf, cache_name))
+                    commands.append('sudo %s -c %s osd tier remove-overlay %s' % (self.ceph_cmd, self.tmp_conf, name))
+                    commands.append('sudo %s -c %s osd tier remove %s %s' % (self.ceph_cmd, self.tmp_conf, name, cache_name))
+                batches.append(commands)
+            self.pool_batches(batches)
+
+            # delete the cache pools
+            self.rmpools(['%s-cache' % name for name in names], cache_profile)
+        self.pool_batches([['sudo %s -c %s osd pool delete %s %s --yes-i-really-really-mean-it' % (self.ceph_cmd, self.tmp_conf, name, name)
+                            for name in chunk] for chunk in self.chunks(names)])
 
     def rbd_unmount(self):
         common.pdsh(settings.getnodes('clients'), 'sudo find /dev/rbd* -maxdepth 0 -type b -exec umount \'{}\' \;').communicate()
@@ -595,12 +714,14 @@ class RecoveryTestThread(threading.Thread):
         self.state = 'markdown'
 
     def markdown(self):
+        batch = common.CommandBatch(settings.getnodes('head'))
         for osdnum in self.config.get('osds'):
             lcmd = self.logcmd("Marking OSD %s down." % osdnum)
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd down %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd)).communicate()
+            batch.add('%s -c %s osd down %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd))
             lcmd = self.logcmd("Marking OSD %s out." % osdnum)
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd out %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd)).communicate()
-        common.pdsh(settings.getnodes('head'), self.logcmd('Waiting for the cluster to break and heal')).communicate()
+            batch.add('%s -c %s osd out %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd))
+        batch.add(self.logcmd('Waiting for the cluster to break and heal'))
+        batch.run()
 
         self.state = 'osdout'
 
@@ -617,13 +738,15 @@ class RecoveryTestThread(threading.Thread):
         else:
             common.pdsh(settings.getnodes('head'), self.logcmd('Cluster appears to have healed.')).communicate()
 
+        batch = common.CommandBatch(settings.getnodes('head'))
         lcmd = self.logcmd("Unsetting the ceph osd noup flag")
-        common.pdsh(settings.getnodes('head'), '%s -c %s osd unset noup;%s' % (self.ceph_cmd, self.cluster.tmp_conf, lcmd)).communicate()
+        batch.add('%s -c %s osd unset noup;%s' % (self.ceph_cmd, self.cluster.tmp_conf, lcmd))
         for osdnum in self.config.get('osds'):
             lcmd = self.logcmd("Marking OSD %s up." % osdnum)
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd up %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd)).communicate()
+            batch.add('%s -c %s osd up %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd))
             lcmd = self.logcmd("Marking OSD %s in." % osdnum)
-            common.pdsh(settings.getnodes('head'), '%s -c %s osd in %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd)).communicate()
+            batch.add('%s -c %s osd in %s;%s' % (self.ceph_cmd, self.cluster.tmp_conf, osdnum, lcmd))
+        batch.run()
 
         self.state = "osdin"
 
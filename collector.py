@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+
+import settings
+import tracing
+import transport
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Incremental result collection, used by common.sync_files instead of rpdcp.
+
+For every host a manifest (top level entry, size, mtime and optionally an
+md5 hash) of the files matching the remote glob is built remotely.  It is
+compared with the manifest saved by the previous sync into the same local
+directory, and only new or changed files are pulled, as one gzipped tar
+stream per host.  All hosts are collected in parallel (sync_parallel, 16 by
+default) and the total transfer rate can be capped with sync_bwlimit
+(KB/s).  Files land where rpdcp -r would put them: each top level entry
+gets the host name appended, e.g. output.0.<host> or collectl.<host>/...
+"""
+
+MANIFEST = '.cbt_sync_manifest'
+
+
+class RateLimiter(object):
+    """Token bucket shared by every transfer of a collection."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.allowance = self.rate
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        with self.lock:
+            now = time.time()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= nbytes
+            delay = -self.allowance / self.rate if self.allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class ThrottledReader(object):
+    def __init__(self, fileobj, limiter):
+        self.fileobj = fileobj
+        self.limiter = limiter
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.nbytes += len(data)
+        if self.limiter is not None:
+            self.limiter.consume(len(data))
+        return data
+
+
+class Collector(object):
+    def __init__(self, nodes, bwlimit=None, parallel=None, use_hash=None, trans=None):
+        self.nodes = transport.split_nodes(nodes)
+        if bwlimit is None:
+            bwlimit = settings.cluster.get('sync_bwlimit')
+        if parallel is None:
+            parallel = settings.cluster.get('sync_parallel', 16)
+        if use_hash is None:
+            use_hash = settings.cluster.get('sync_hash', False)
+        self.limiter = RateLimiter(bwlimit * 1024) if bwlimit else None
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.use_hash = use_hash
+        self.transport = trans
+        self.user = settings.cluster.get('user')
+
+    def _get_transport(self):
+        if self.transport is not None:
+            return self.transport
+        return transport.get_transport()
+
+    def manifest_cmd(self, remote_glob):
+        printf = '"$top\\t%s\\t%T@\\t-\\t%p\\n"'
+        # the manifest of an earlier collection into a remote directory is not a result
+        cmd = ('for top in %s; do [ -e "$top" ] || continue; find "$top" -type f ! -name %s -printf %s; done'
+               % (remote_glob, MANIFEST, printf))
+        if self.use_hash:
+            cmd += (' | while IFS="$(printf \'\\t\')" read top size mtime hash path; do'
+                    ' printf "%s\\t%s\\t%s\\t%s\\t%s\\n" "$top" "$size" "$mtime"'
+                    ' "$(md5sum < "$path" | cut -c1-32)" "$path"; done')
+        if self.user:
+            cmd = 'sudo chown -R {0}.{0} {1}; {2}'.format(self.user, remote_glob, cmd)
+        return cmd
+
+    def remote_manifest(self, node, remote_glob):
+        args, proc = self._get_transport().host_popen(node, self.manifest_cmd(remote_glob))
+        stdout, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise Exception('manifest of %s on %s failed with %d:\n%s' % (remote_glob, node, proc.returncode, stderr))
+        manifest = {}
+        for line in stdout.splitlines():
+            fields = line.split('\t', 4)
+            if len(fields) != 5:
+                continue
+            top, size, mtime, digest, path = fields
+            manifest[path] = [top, size, mtime, digest]
+        return manifest
+
+    def destination(self, local_dir, host, top, path):
+        top = top.rstrip('/')
+        return os.path.join(local_dir, '%s.%s%s' % (os.path.basename(top), host, path[len(top):]))
+
+    def pull(self, node, paths, dests):
+        """Pull paths in one compressed tar stream, returns the bytes transferred."""
+        args, proc = self._get_transport().host_popen(node, 'tar czf - -C / --null -T -', stdin=subprocess.PIPE)
+
+        def feed():
+            try:
+                proc.stdin.write(''.join(path.lstrip('/') + '\0' for path in paths))
+            finally:
+                proc.stdin.close()
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        # read concurrently, tar blocks once the stderr pipe is full
+        errors = []
+        stderr_reader = threading.Thread(target=lambda: errors.append(proc.stderr.read()))
+        stderr_reader.start()
+
+        reader = ThrottledReader(proc.stdout, self.limiter)
+        tar = tarfile.open(fileobj=reader, mode='r|gz')
+        for member in tar:
+            dest = dests.get('/' + member.name)
+            if dest is None or not member.isfile():
+                continue
+            dest_dir = os.path.dirname(dest)
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir)
+            src = tar.extractfile(member)
+            with open(dest, 'wb') as f:
+                shutil.copyfileobj(src, f)
+            os.utime(dest, (member.mtime, member.mtime))
+        tar.close()
+        feeder.join()
+        stderr_reader.join()
+        if proc.wait() != 0:
+            raise Exception('pulling from %s failed with %d:\n%s' % (node, proc.returncode, ''.join(errors)[-4096:]))
+        return reader.nbytes
+
+    def collect_host(self, node, remote_glob, local_dir, old, new, stats):
+        host = transport.hostname(node)
+        with self.slots:
+            start = time.time()
+            manifest = self.remote_manifest(node, remote_glob)
+            previous = old.get(host, {})
+            changed = [path for path, entry in manifest.items() if previous.get(path) != entry]
+            dests = {}
+            for path in changed:
+                top = manifest[path][0]
+                dests[path] = self.destination(local_dir, host, top, path)
+            nbytes = 0
+            if changed:
+                nbytes = self.pull(node, sorted(changed), dests)
+            new[host] = manifest
+            stats[host] = {'files': len(manifest), 'transferred': len(changed),
+                           'bytes': nbytes, 'duration': time.time() - start}
+            tracing.tracer.complete('collect', 'command', start, time.time(), transport='collector',
+                                    hosts=host, command=remote_glob, returncode=0, bytes=nbytes)
+            logger.debug('%s: pulled %d of %d files (%d bytes) in %.2fs', host, len(changed),
+                         len(manifest), nbytes, stats[host]['duration'])
+
+    def collect(self, remote_glob, local_dir):
+        """Collect remote_glob from every node into local_dir, returns per host stats."""
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+        manifest_fn = os.path.join(local_dir, MANIFEST)
+        old = {}
+        if os.path.exists(manifest_fn):
+            with open(manifest_fn) as f:
+                old = json.load(f)
+        # only the hosts collected this time are replaced
+        new = dict(old)
+        stats = {}
+        errors = []
+
+        def run(node):
+            try:
+                self.collect_host(node, remote_glob, local_dir, old, new, stats)
+            except Exception as e:
+                errors.append((node, e))
+
+        threads = [threading.Thread(target=run, args=(node,)) for node in self.nodes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with open(manifest_fn, 'w') as f:
+            json.dump(new, f)
+        if errors:
+            raise Exception('sync of %s failed on %s' % (remote_glob, ', '.join('%s (%s)' % e for e in errors)))
+        return stats
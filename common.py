@@ -1,9 +1,15 @@
+import collections
 import errno
 import logging
 import os
+import Queue
 import subprocess
+import threading
 
+import collector
 import settings
+import tracing
+import transport
 
 logger = logging.getLogger("cbt")
 
@@ -13,11 +19,14 @@ logger = logging.getLogger("cbt")
 class CheckedPopen:
     UNINIT=-720
     OK=0
-    def __init__(self, args, continue_if_error=False):
+    def __init__(self, args, continue_if_error=False, popen_obj=None):
         self.args = args[:]
         self.myrtncode = self.UNINIT
         self.continue_if_error = continue_if_error
-        self.popen_obj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+        if popen_obj is None:
+            popen_obj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+        self.popen_obj = popen_obj
+        self.trace = tracing.command_start(args[0], '', ' '.join(args))
         logger.debug('CheckedPopen continue_if_error=%s args=%s'%(str(continue_if_error), ' '.join(args)))
 
     def __str__(self):
@@ -28,28 +37,213 @@ class CheckedPopen:
     def communicate(self, input=None, continue_if_error=True):
         (stdoutdata, stderrdata) = self.popen_obj.communicate(input=input)
         self.myrtncode = self.popen_obj.returncode  # THIS is the thing we couldn't do before
+        tracing.command_end(self.trace, self.myrtncode, len(stdoutdata or '') + len(stderrdata or ''))
+        self.trace = None
+        self._check(stdoutdata, stderrdata)
+        return (stdoutdata, stderrdata)
+
+    def _check(self, stdoutdata, stderrdata):
         if self.myrtncode != self.OK:
             if not self.continue_if_error:
                 raise Exception(str(self)+'\nstdout:\n'+stdoutdata+'\nstderr\n'+stderrdata)
             else:
                 logger.warning(' '.join(self.args))
                 logger.warning('error %d seen, continuing anyway...'%self.myrtncode)
-        return (stdoutdata, stderrdata)
 
     def wait(self):
         self.communicate(continue_if_error=True)
         return self.myrtncode
 
+    # stream() is the alternative to communicate() for large or long running
+    # output: stdout lines are yielded as (host, line) as soon as they arrive
+    # instead of being buffered until the slowest host is done.  At most
+    # max_queued lines are held in memory, readers block (and so do the
+    # remote commands, through the pipes) until the consumer catches up.
+    # Lines can also be spooled to spool_dir/<host>.out and .err and handed
+    # to callback(host, line) or to the per host host_callbacks[host](line).
+    # Only the last STDERR_TAIL stderr lines are kept, for error reporting.
+    # Leaving the loop early kills the command.
+
+    STDERR_TAIL = 100
+
+    def stream(self, callback=None, host_callbacks=None, spool_dir=None, max_queued=1024):
+        if hasattr(self.popen_obj, 'stream_sources'):
+            sources = self.popen_obj.stream_sources()
+        else:
+            sources = [(None, 'out', self.popen_obj.stdout), (None, 'err', self.popen_obj.stderr)]
+
+        queue = Queue.Queue(max_queued)
+
+        def reader(host, name, fileobj):
+            for line in iter(fileobj.readline, ''):
+                queue.put((host, name, line))
+            queue.put(None)
+
+        for host, name, fileobj in sources:
+            t = threading.Thread(target=reader, args=(host, name, fileobj))
+            t.daemon = True
+            t.start()
+
+        spools = {}
+        nbytes = 0
+        self.stderr_tail = collections.deque(maxlen=self.STDERR_TAIL)
+        pending = len(sources)
+        try:
+            while pending:
+                item = queue.get()
+                if item is None:
+                    pending -= 1
+                    continue
+                host, name, line = item
+                nbytes += len(line)
+                if host is None:
+                    host, sep, line = line.partition(': ')
+                    if not sep:
+                        host, line = '', host
+                line = line.rstrip('\n')
+                if spool_dir:
+                    key = (host, name)
+                    if key not in spools:
+                        mkdir_p(spool_dir)
+                        spools[key] = open(os.path.join(spool_dir, '%s.%s' % (host, name)), 'w')
+                    spools[key].write(line + '\n')
+                if name == 'err':
+                    self.stderr_tail.append('%s: %s' % (host, line))
+                    continue
+                if callback:
+                    callback(host, line)
+                if host_callbacks and host in host_callbacks:
+                    host_callbacks[host](line)
+                yield host, line
+        finally:
+            for f in spools.values():
+                f.close()
+            if pending:
+                self.popen_obj.kill()
+                while pending:
+                    if queue.get() is None:
+                        pending -= 1
+        self.myrtncode = self.popen_obj.wait()
+        tracing.command_end(self.trace, self.myrtncode, nbytes)
+        self.trace = None
+        self._check('(streamed)', '\n'.join(self.stderr_tail))
+
 # by default, do NOT abort if pdsh returns error status
 # this policy results in minimal code change to CBT while allowing
 # us to strengthen error checking where it's needed.
 
+# the command is sent through the transport selected in the cluster
+# section (see transport.py), pdsh unless configured otherwise.
+
 def pdsh(nodes, command, continue_if_error=True):
-    args = ['pdsh', '-R', 'ssh', '-w', nodes, command]
-    # -S means pdsh fails if any host fails 
-    if not continue_if_error: args.insert(1, '-S')
-    return CheckedPopen(args,continue_if_error=continue_if_error)
- 
+    args, popen_obj = transport.get_transport().popen(nodes, command, continue_if_error)
+    p = CheckedPopen(args, continue_if_error=continue_if_error, popen_obj=popen_obj)
+    p.trace.update(hosts=nodes, command=command)
+    return p
+
+
+class BatchStep:
+    def __init__(self, command):
+        self.command = command
+        self.returncode = None  # None means the step never ran
+        self.stdout = ''
+        self.stderr = ''
+
+    def __str__(self):
+        return 'batch step rtncode=%s command=%s' % (self.returncode, self.command)
+
+# CommandBatch sends an ordered list of commands to the nodes as a single
+# script, i.e. one pdsh round trip instead of one per command.  Every step
+# is framed by marker lines on stdout and stderr so the output and exit
+# status of each step can be recovered per host.  If continue_if_error is
+# False the script stops at the first failing step and run() raises.
+
+class CommandBatch:
+    MARKER = '@@cbt-batch'
+
+    def __init__(self, nodes, continue_if_error=True):
+        self.nodes = nodes
+        self.continue_if_error = continue_if_error
+        self.commands = []
+
+    def add(self, command):
+        self.commands.append(command)
+        return self
+
+    def __len__(self):
+        return len(self.commands)
+
+    def script(self):
+        steps = []
+        for i, command in enumerate(self.commands):
+            begin = '%s-begin %d' % (self.MARKER, i)
+            end = '%s-end %d $rc' % (self.MARKER, i)
+            step = 'echo "%s"; echo "%s" >&2; ( %s ); rc=$?; echo "%s"; echo "%s" >&2' % (begin, begin, command, end, end)
+            if not self.continue_if_error:
+                step += '; [ $rc -eq 0 ] || exit $rc'
+            steps.append(step)
+        return '; '.join(steps)
+
+    def _parse(self, results, data, stream):
+        current = {}
+        for line in data.splitlines(True):
+            host, sep, text = line.partition(': ')
+            if not sep:
+                continue
+            idx = text.find(self.MARKER)
+            if idx >= 0 and host not in results:
+                results[host] = [BatchStep(command) for command in self.commands]
+            if idx < 0:
+                if host in current:
+                    step = results[host][current[host]]
+                    setattr(step, stream, getattr(step, stream) + text)
+                continue
+            if idx > 0 and host in current:
+                # the step output did not end with a newline
+                step = results[host][current[host]]
+                setattr(step, stream, getattr(step, stream) + text[:idx])
+            fields = text[idx:].split()
+            if fields[0] == '%s-begin' % self.MARKER:
+                current[host] = int(fields[1])
+            elif fields[0] == '%s-end' % self.MARKER:
+                results[host][int(fields[1])].returncode = int(fields[2])
+                current.pop(host, None)
+
+    def collect(self, host, stdout, stderr):
+        """BatchSteps of the script() output of a single host, e.g. run through executor.py."""
+        results = {}
+        self._parse(results, transport.prefix_lines(host, stdout), 'stdout')
+        self._parse(results, transport.prefix_lines(host, stderr), 'stderr')
+        return results.get(host, [])
+
+    def run(self):
+        """
+        Returns a dict of host -> list of BatchStep, one per command, for
+        every node; the steps of a host the batch did not run on have no
+        returncode.
+        """
+        results = {}
+        if not self.commands:
+            return results
+        stdout, stderr = pdsh(self.nodes, self.script()).communicate()
+        self._parse(results, stdout, 'stdout')
+        self._parse(results, stderr, 'stderr')
+        for node in transport.split_nodes(self.nodes):
+            host = transport.hostname(node)
+            if host not in results:
+                # unreachable, or the shell failed before the first step
+                logger.error('%s: the batch did not run', host)
+                results[host] = [BatchStep(command) for command in self.commands]
+                if not self.continue_if_error:
+                    raise Exception('%s: the batch did not run\nstderr\n%s' % (host, stderr))
+        for host, steps in sorted(results.items()):
+            for step in steps:
+                if step.returncode:
+                    logger.warning('%s: %s', host, step)
+                    if not self.continue_if_error:
+                        raise Exception('%s: %s\nstdout:\n%s\nstderr\n%s' % (host, step, step.stdout, step.stderr))
+        return results
+
 
 def pdcp(nodes, flags, localfile, remotefile):
     args = ['pdcp', '-f', '1', '-R', 'ssh', '-w', nodes]
@@ -68,12 +262,14 @@ def rpdcp(nodes, flags, remotefile, localfile):
 
 
 def scp(node, localfile, remotefile):
-    return CheckedPopen(['scp', localfile, '%s:%s' % (node, remotefile)], 
+    opts = transport.get_transport().ssh_options()
+    return CheckedPopen(['scp'] + opts + [localfile, '%s:%s' % (node, remotefile)],
                         continue_if_error=False)
 
 
 def rscp(node, remotefile, localfile):
-    return CheckedPopen(['scp', '%s:%s' % (node, remotefile), localfile],
+    opts = transport.get_transport().ssh_options()
+    return CheckedPopen(['scp'] + opts + ['%s:%s' % (node, remotefile), localfile],
                         continue_if_error=False)
 
 
@@ -83,17 +279,28 @@ def make_remote_dir(remote_dir):
          continue_if_error=False).communicate()
 
 
-def sync_files(remote_dir, local_dir):
-    nodes = settings.getnodes('clients', 'osds', 'mons', 'rgws', 'mds')
+# sync_method 'collector' (the default) only pulls new or changed files,
+# compressed and from all hosts in parallel, see collector.py.  'rpdcp',
+# the default before the collector, copies the whole tree again one host
+# at a time.
+
+def sync_files(remote_dir, local_dir, nodes=None):
+    if nodes is None:
+        nodes = settings.getnodes('clients', 'osds', 'mons', 'rgws', 'mds')
 
     if not os.path.exists(local_dir):
         os.makedirs(local_dir)
 
-    if 'user' in settings.cluster:
-        pdsh(nodes, 
-             'sudo chown -R {0}.{0} {1}'.format(settings.cluster['user'], remote_dir),
-             continue_if_error=False).communicate()
-    rpdcp(nodes, '-r', remote_dir, local_dir).communicate()
+    with tracing.phase('sync_files', remote_dir=remote_dir):
+        if settings.cluster.get('sync_method', 'collector') == 'collector':
+            collector.Collector(nodes).collect(remote_dir, local_dir)
+            return
+
+        if 'user' in settings.cluster:
+            pdsh(nodes, 
+                 'sudo chown -R {0}.{0} {1}'.format(settings.cluster['user'], remote_dir),
+                 continue_if_error=False).communicate()
+        rpdcp(nodes, '-r', remote_dir, local_dir).communicate()
 
 
 def mkdir_p(path):
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import os
+
+import yaml
+
+import statistic
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Confidence driven number of iterations.
+
+By default every test is repeated cluster.iterations times.  With
+
+  cluster:
+    iterations: 10           # the cap
+    confidence:
+      target: 0.05           # relative half-width of the confidence interval
+      level: 0.95
+      min_iterations: 3
+      metric: throughput     # key of the benchmark's summary()
+
+the result of each test (its summary()) is collected after every iteration
+and statistic.data_property computes the confidence interval of its mean
+over the iterations so far.  Once the half-width of the interval divided by
+the mean falls below target the test is not repeated in later iterations,
+noisy tests are repeated up to the cap.  Tests are identified across
+iterations by their config without the iteration.  The achieved confidence
+of every test is written to <archive>/confidence.yaml.
+
+The interval is the Student t interval of the mean.  Its critical value
+comes from scipy when it is installed, otherwise from statistic.T_TABLE,
+which only has the 0.90, 0.95 and 0.99 levels.
+"""
+
+
+def test_key(config):
+    """Identity of a test across iterations."""
+    config = dict((k, v) for k, v in config.items() if k != 'iteration')
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str)).hexdigest()
+
+
+class ConfidenceTracker(object):
+    def __init__(self, target, level=0.95, min_iterations=3, metric='throughput'):
+        self.target = target
+        self.level = level
+        self.min_iterations = max(2, min_iterations)
+        self.metric = metric
+        self.tests = {}
+        if statistic.no_numpy:
+            if level not in statistic.T_TABLE:
+                raise ValueError('confidence level %s needs scipy, without it the level must be one of %s' %
+                                 (level, ', '.join(str(l) for l in sorted(statistic.T_TABLE))))
+            logger.info('scipy is not installed, confidence intervals use the t table for level %s', level)
+
+    def _entry(self, b):
+        key = test_key(b.config)
+        entry = self.tests.get(key)
+        if entry is None:
+            config = dict((k, v) for k, v in b.config.items() if k != 'iteration')
+            entry = self.tests[key] = {'benchmark': b.getclass(), 'config': config, 'iterations': 0, 'samples': []}
+        return entry
+
+    def add(self, b):
+        """Records the result of the test that was run (or found in the archive)."""
+        summary = b.summary()
+        entry = self._entry(b)
+        entry['iterations'] += 1
+        if not summary or summary.get(self.metric) is None:
+            logger.warning('No %s result for %s test %s, it is repeated every iteration',
+                           self.metric, b.getclass(), getattr(b, 'out_dir', ''))
+            return
+        entry['samples'].append(float(summary[self.metric]))
+
+    def interval(self, samples):
+        """(mean, half-width, relative half-width) of the confidence interval."""
+        prop = statistic.data_property(samples, self.level)
+        mean, half_width = float(prop.average), prop.confidence
+        if half_width is None:
+            return mean, None, None
+        if not mean:
+            return mean, half_width, None
+        return mean, half_width, abs(half_width / mean)
+
+    def _converged(self, entry):
+        if len(entry['samples']) < self.min_iterations:
+            return False
+        relative = self.interval(entry['samples'])[2]
+        return relative is not None and relative <= self.target
+
+    def converged(self, b):
+        """Whether the test needs no more iterations."""
+        entry = self.tests.get(test_key(b.config))
+        return entry is not None and self._converged(entry)
+
+    def report(self):
+        tests = []
+        for entry in self.tests.values():
+            test = {'benchmark': entry['benchmark'], 'config': entry['config'],
+                    'iterations': entry['iterations'], 'samples': entry['samples']}
+            if entry['samples']:
+                mean, half_width, relative = self.interval(entry['samples'])
+                test.update({'mean': mean, 'confidence_interval': half_width,
+                             'relative_interval': relative, 'converged': self._converged(entry)})
+            tests.append(test)
+        tests.sort(key=lambda t: (t['benchmark'], sorted(t['config'].items())))
+        return {'metric': self.metric, 'level': self.level, 'target': self.target, 'tests': tests}
+
+    def write(self, archive_dir):
+        report = self.report()
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        with open(os.path.join(archive_dir, 'confidence.yaml'), 'w') as f:
+            yaml.safe_dump(report, f, default_flow_style=False)
+        converged = len([t for t in report['tests'] if t.get('converged')])
+        logger.info('%d of %d tests reached a %s confidence interval within %s%% of the mean',
+                    converged, len(report['tests']), self.level, self.target * 100)
+
+
+def get_tracker(cluster):
+    """ConfidenceTracker of the confidence cluster setting, None if not set."""
+    conf = cluster.get('confidence')
+    if not conf:
+        return None
+    return ConfidenceTracker(conf.get('target', 0.05), conf.get('level', 0.95),
+                             conf.get('min_iterations', 3), conf.get('metric', 'throughput'))
@@ -0,0 +1,370 @@
+import collections
+import logging
+import threading
+import time
+
+import settings
+import tracing
+import transport
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Thread based executor for remote commands.
+
+Unlike common.pdsh, which starts one process for a whole node list and
+returns the merged output, every command submitted here runs against a
+single host and yields a HostResult with its own exit code, stdout, stderr
+and duration. The number of commands in flight is bounded globally
+(executor_workers, default 64) and per host (executor_per_host, default 8)
+so hundreds of operations can be queued without exhausting processes or
+file descriptors on the head node.
+
+Benchmark workloads that must all start together are submitted with
+throttle=False (see Executor.launch): they start right away, whatever the
+limits, so all procs and volumes of a workload run concurrently.  They
+still count as running on their hosts, so queued commands wait for them.
+With the pdsh transport the commands of a launch are run by a single pdsh
+process, as common.pdsh would.
+"""
+
+# seconds wait() gives a killed command to exit
+KILL_WAIT = 10
+
+
+class HostResult(object):
+    def __init__(self, host, command):
+        self.host = host
+        self.command = command
+        self.returncode = None
+        self.stdout = ''
+        self.stderr = ''
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    def __str__(self):
+        return 'host=%s rtncode=%s duration=%s command=%s' % (self.host, self.returncode, self.duration, self.command)
+
+
+class RemoteCommand(object):
+    """Handle for a command submitted to an Executor."""
+
+    def __init__(self, node, command, throttle=True):
+        self.node = node
+        self.host = transport.hostname(node)
+        self.command = command
+        self.throttle = throttle
+        self.proc = None
+        self.cancelled = False
+        self._result = HostResult(self.host, command)
+        self._started = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done()
+
+    def wait_started(self):
+        """Start time of the command, once it was started (or given up)."""
+        self._started.wait()
+        return self._result.start
+
+    def result(self, timeout=None):
+        """HostResult of the command, None if it did not finish within timeout."""
+        if not self.wait(timeout):
+            return None
+        return self._result
+
+    def kill(self):
+        """Cancel the command if it is still queued, kill it if it is running."""
+        with self._lock:
+            self.cancelled = True
+            if self.proc is not None and self.proc.poll() is None:
+                self.proc.kill()
+
+    def _run(self, trans):
+        res = self._result
+        self._set_start(time.time())
+        try:
+            with self._lock:
+                if self.cancelled:
+                    raise RuntimeError('cancelled before start')
+                args, self.proc = trans.host_popen(self.node, self.command)
+            res.stdout, res.stderr = self.proc.communicate()
+            res.returncode = self.proc.returncode
+        except Exception as e:
+            res.returncode = -1
+            res.stderr = str(e)
+        finally:
+            self._finish('executor')
+
+    def _set_start(self, start):
+        self._result.start = start
+        self._started.set()
+
+    def _finish(self, name):
+        res = self._result
+        res.end = time.time()
+        tracing.tracer.complete(tracing.command_class(self.command), 'command', res.start, res.end,
+                                transport=name, hosts=self.host, command=self.command,
+                                returncode=res.returncode, bytes=len(res.stdout) + len(res.stderr))
+        self._done.set()
+
+
+class PdshLaunch(object):
+    """
+    Runs the RemoteCommands of a launch with a single pdsh process.  The
+    command prints an exit status marker on stdout and stderr when it is
+    done, so the merged output of pdsh can be split per host and every
+    RemoteCommand completes on its own.  Killing one of them kills the
+    pdsh process, i.e. the commands of all hosts still running.
+    """
+    MARKER = '@@cbt-rc'
+
+    def __init__(self, cmds, release):
+        self.cmds = dict((cmd.host, cmd) for cmd in cmds)
+        if len(self.cmds) != len(cmds):
+            # pdsh output only tells the hosts apart
+            raise ValueError('a pdsh launch runs one command per host: %s' % ','.join(cmd.node for cmd in cmds))
+        self.release = release
+        self.markers = collections.defaultdict(int)
+        self.lock = threading.Lock()
+
+    def script(self, command):
+        return '( %s ); rc=$?; echo "%s $rc" >&2; echo "%s $rc"' % (command, self.MARKER, self.MARKER)
+
+    def start(self, trans, command):
+        cmds = self.cmds.values()
+        nodes = ','.join(cmd.node for cmd in cmds)
+        start = time.time()
+        try:
+            args, proc = trans.popen(nodes, self.script(command))
+        except Exception as e:
+            for cmd in cmds:
+                cmd._set_start(start)
+                self._done(cmd, -1, str(e))
+            return
+        for cmd in cmds:
+            cmd._set_start(start)
+            cmd.proc = proc
+        readers = [threading.Thread(target=self._read, args=(proc.stdout, 'stdout')),
+                   threading.Thread(target=self._read, args=(proc.stderr, 'stderr'))]
+        for t in readers:
+            t.daemon = True
+            t.start()
+        t = threading.Thread(target=self._wait, args=(proc, readers))
+        t.daemon = True
+        t.start()
+
+    def _read(self, fileobj, stream):
+        for line in iter(fileobj.readline, ''):
+            host, sep, text = line.partition(': ')
+            with self.lock:
+                cmd = self.cmds.get(host)
+            if cmd is None or cmd.done():
+                continue
+            res = cmd._result
+            idx = text.find(self.MARKER)
+            if idx < 0:
+                setattr(res, stream, getattr(res, stream) + text)
+                continue
+            # the output may not end with a newline
+            setattr(res, stream, getattr(res, stream) + text[:idx])
+            with self.lock:
+                self.markers[host] += 1
+                finished = self.markers[host] == 2
+            if finished:
+                self._done(cmd, int(text[idx:].split()[1]))
+
+    def _wait(self, proc, readers):
+        if proc.wait() >= 0:
+            # the output of the last hosts may still be in the pipes, ssh
+            # processes of a killed pdsh may keep them open though
+            for t in readers:
+                t.join()
+        for cmd in self.cmds.values():
+            if not cmd.done():
+                # never got to run, or killed
+                self._done(cmd, proc.returncode or 255)
+
+    def _done(self, cmd, returncode, stderr=''):
+        with self.lock:
+            if cmd.done():
+                return
+            cmd._result.returncode = returncode
+            cmd._result.stderr += stderr
+            cmd._finish('pdsh')
+        self.release(cmd.host)
+
+
+class Executor(object):
+    def __init__(self, max_workers=None, max_per_host=None, trans=None):
+        if max_workers is None:
+            max_workers = settings.cluster.get('executor_workers', 64)
+        if max_per_host is None:
+            max_per_host = settings.cluster.get('executor_per_host', 8)
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.transport = trans
+        self.queue = []
+        self.running = collections.defaultdict(int)
+        self.workers = []
+        self.cond = threading.Condition()
+        self.stopping = False
+
+    def _get_transport(self):
+        if self.transport is not None:
+            return self.transport
+        return transport.get_transport()
+
+    def submit(self, node, command, throttle=True):
+        if not throttle:
+            return self.launch([node], command)[0]
+
+        cmd = RemoteCommand(node, command, throttle)
+        with self.cond:
+            if self.stopping:
+                raise RuntimeError('executor is shut down')
+            self.queue.append(cmd)
+            if len(self.workers) < min(self.max_workers, len(self.queue) + sum(self.running.values())):
+                t = threading.Thread(target=self._worker, name='Executor-%d' % len(self.workers))
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
+            self.cond.notify()
+        return cmd
+
+    def fanout(self, nodes, command, throttle=True):
+        """Submit command once per node of a comma separated node list."""
+        if not throttle:
+            return self.launch(transport.split_nodes(nodes), command)
+        return [self.submit(node, command) for node in transport.split_nodes(nodes)]
+
+    def launch(self, nodes, command):
+        """
+        Starts command on all nodes at once, without waiting for free
+        slots.  Returns the RemoteCommands, which count as running on their
+        hosts until they are done.
+        """
+        cmds = [RemoteCommand(node, command, throttle=False) for node in nodes]
+        hosts = [cmd.host for cmd in cmds]
+        self._reserve(hosts)
+        trans = self._get_transport()
+        if trans.multi_host and len(set(hosts)) == len(hosts):
+            PdshLaunch(cmds, self._release).start(trans, command)
+            return cmds
+        for cmd in cmds:
+            t = threading.Thread(target=self._run_launched, args=(cmd, trans))
+            t.daemon = True
+            t.start()
+        return cmds
+
+    def _run_launched(self, cmd, trans):
+        try:
+            cmd._run(trans)
+        finally:
+            self._release(cmd.host)
+
+    def _reserve(self, hosts):
+        # workloads may go past max_per_host, queued commands wait for them
+        with self.cond:
+            if self.stopping:
+                raise RuntimeError('executor is shut down')
+            for host in hosts:
+                self.running[host] += 1
+
+    def _release(self, host):
+        with self.cond:
+            self.running[host] -= 1
+            self.cond.notify_all()
+
+    def _next(self):
+        # called with self.cond held
+        if sum(self.running.values()) >= self.max_workers:
+            # launched workloads hold slots too
+            return None
+        for i, cmd in enumerate(self.queue):
+            if self.running[cmd.host] < self.max_per_host:
+                del self.queue[i]
+                self.running[cmd.host] += 1
+                return cmd
+        return None
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                cmd = self._next()
+                while cmd is None:
+                    if self.stopping and not self.queue:
+                        return
+                    self.cond.wait()
+                    cmd = self._next()
+            try:
+                cmd._run(self._get_transport())
+            finally:
+                self._release(cmd.host)
+
+    def shutdown(self, wait=True):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if wait:
+            for t in self.workers:
+                t.join()
+
+
+def wait(commands, timeout=None, kill=False):
+    """
+    Wait until every command is done or has run for timeout seconds, a
+    command still queued is given its timeout once it starts.  Returns
+    (done, not_done) lists. Failed commands are logged per host, commands
+    still running at their deadline are logged and, with kill=True, killed.
+    """
+    done = []
+    not_done = []
+    for cmd in commands:
+        remaining = None
+        if timeout is not None:
+            remaining = max(0, cmd.wait_started() + timeout - time.time())
+        if cmd.wait(remaining):
+            done.append(cmd)
+            res = cmd.result()
+            if res.returncode != 0:
+                logger.warning('%s: error %s seen running %s', res.host, res.returncode, res.command)
+                logger.debug('%s: stderr:\n%s', res.host, res.stderr)
+        else:
+            not_done.append(cmd)
+            logger.warning('%s: still running %s after %ss', cmd.host, cmd.command, timeout)
+    if kill:
+        for cmd in not_done:
+            cmd.kill()
+        for cmd in not_done:
+            if not cmd.wait(KILL_WAIT):
+                logger.error('%s: could not kill %s', cmd.host, cmd.command)
+    return done, not_done
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = Executor()
+        return _executor
+
+
+def fanout(nodes, command, throttle=True):
+    return get_executor().fanout(nodes, command, throttle)
@@ -0,0 +1,165 @@
+import collections
+import logging
+import threading
+
+import common
+import monitoring
+import settings
+import tracing
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Concurrent benchmarks on disjoint client groups.
+
+The clients can be partitioned into named groups:
+
+  cluster:
+    clients: [client1, client2, client3, client4]
+    client_groups:
+      a: [client1, client2]
+      b: [client3, client4]
+
+and a benchmark given client_group: a only runs on the clients of group a.
+The tests of grouped benchmarks are run after the ungrouped ones of the same
+iteration, in rounds: the k-th test of every group runs in round k, all of
+them at the same time.  Each benchmark waits on a Barrier right before each
+of its workload phases starts (Benchmark.sync_start()), so that the k-th
+phase of every benchmark, e.g. the write and then the read phase of
+radosbench, starts together.  A benchmark that has fewer phases or is done
+leaves the barrier, the later phases of the others then start without it.
+The OSD caches are dropped once for the round, and the cluster is monitored
+once into <archive>/<iteration>/concurrent-<round> instead of per benchmark.
+The pools grouped benchmarks create get the group name appended (e.g.
+cbt-librbdfio-a), so two groups can run the same benchmark.  The groups of
+a round must not share hosts or pools, and must not set an OSD parameter
+(osd_ra) to different values, see check_round().
+"""
+
+
+class Barrier(object):
+    """
+    Start gate of each phase for parties threads: wait(phase) blocks until
+    every party that has not left() is waiting for that phase, after which
+    that phase's gate stays open.
+    """
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = collections.Counter()
+        self.released = set()
+        self.cond = threading.Condition()
+
+    def _check(self):
+        for phase, arrived in self.arrived.items():
+            if phase not in self.released and arrived >= self.parties:
+                self.released.add(phase)
+                self.cond.notify_all()
+
+    def wait(self, phase=0):
+        with self.cond:
+            if phase in self.released:
+                return
+            self.arrived[phase] += 1
+            self._check()
+            while phase not in self.released:
+                self.cond.wait()
+
+    def leave(self):
+        """A party that will not (or no longer) wait, e.g. because it failed or is done."""
+        with self.cond:
+            self.parties -= 1
+            self._check()
+
+
+def check_disjoint(names):
+    """Raises ValueError if the client groups share hosts or are not clients."""
+    topology = settings.get_topology()
+    clients = set(topology.hosts('clients'))
+    owner = {}
+    for name in names:
+        for host in topology.group(name):
+            if host not in clients:
+                raise ValueError('Host %s of client group %s is not one of the clients' % (host, name))
+            if owner.get(host, name) != name:
+                raise ValueError('Host %s is in both client groups %s and %s' % (host, owner[host], name))
+            owner[host] = name
+
+
+def check_round(benchmarks):
+    """
+    Raises ValueError if the benchmarks of a round cannot run at the same
+    time: their client groups overlap, they recreate the same pool or set
+    an OSD parameter to different values.
+    """
+    check_disjoint([b.client_group for b in benchmarks])
+    pools = {}
+    params = {}
+    for b in benchmarks:
+        for pool in b.pools():
+            if pool in pools:
+                raise ValueError('Pool %s is recreated by %s on client group %s and %s on client group %s'
+                                 % (pool, pools[pool].getclass(), pools[pool].client_group, b.getclass(), b.client_group))
+            pools[pool] = b
+        for name, value in b.osd_params().items():
+            other, first = params.setdefault(name, (value, b))
+            if str(other) != str(value):
+                raise ValueError('%s on client group %s sets %s to %s, %s on client group %s to %s'
+                                 % (first.getclass(), first.client_group, name, other, b.getclass(), b.client_group, value))
+
+
+def rounds(grouped):
+    """[[k-th test of every group] for k] from an OrderedDict of group -> tests."""
+    queues = [list(tests) for tests in grouped.values()]
+    while any(queues):
+        yield [queue.pop(0) for queue in queues if queue]
+
+
+def dropcaches():
+    nodes = settings.getnodes('osds')
+    with tracing.phase('dropcaches'):
+        common.pdsh(nodes, 'sync').communicate()
+        common.pdsh(nodes, 'echo 3 | sudo tee /proc/sys/vm/drop_caches').communicate()
+
+
+def run_concurrent(benchmarks, run_dir, archive_dir, ledger=None):
+    """
+    Runs the (initialized) benchmarks at the same time, re-raises the first
+    failure.  The outcome of each benchmark is recorded in the ledger.
+    """
+    barrier = Barrier(len(benchmarks))
+    errors = []
+
+    def run(b):
+        try:
+            with tracing.phase('run', benchmark=b.getclass(), client_group=b.client_group):
+                b.run()
+            if ledger is not None:
+                ledger.synced(b)
+        except Exception as e:
+            logger.exception('%s on client group %s failed', b.getclass(), b.client_group)
+            errors.append(e)
+            if ledger is not None:
+                ledger.failed(b, e)
+        finally:
+            barrier.leave()
+
+    for b in benchmarks:
+        b.barrier = barrier
+        b.barrier_phase = 0
+    dropcaches()
+    common.make_remote_dir(run_dir)
+    logger.info('Running %s concurrently', ', '.join('%s on %s' % (b.getclass(), b.client_group)
+                                                     for b in benchmarks))
+    with monitoring.shared(run_dir):
+        threads = [threading.Thread(target=run, args=(b,), name='%s-%s' % (b.client_group, b.getclass()))
+                   for b in benchmarks]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    common.sync_files(run_dir, archive_dir)
+    if errors:
+        raise errors[0]
+
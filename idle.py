@@ -0,0 +1,127 @@
+import json
+import logging
+import time
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Quiescence detection for idle monitoring.
+
+Instead of sleeping a fixed time before the first test, the idle window can
+end as soon as the cluster has been quiet for a while:
+
+  cluster:
+    idle:
+      quiet: 10              # seconds the cluster has to stay quiet
+      timeout: 600           # give up (and fail) if it is not quiet by then
+      interval: 2            # seconds between samples
+      max_client_mbps: 1     # client IO of `ceph status`
+      max_client_iops: 10
+      max_recovery_mbps: 0   # recovery IO of `ceph status`
+      max_disk_util: 5       # % busy of the busiest OSD disk (/proc/diskstats)
+
+Each sample takes the client and recovery rates of `ceph status` and the
+utilization of every OSD disk over the interval; see Ceph.wait_idle().
+Without the idle setting benchmarks keep pausing 60s for idle monitoring.
+"""
+
+# device name prefixes of /proc/diskstats that are not OSD disks
+IGNORED_DEVICES = ('loop', 'ram', 'zram', 'sr', 'md', 'dm-')
+
+
+class ClusterBusy(Exception):
+    pass
+
+
+def client_io(status):
+    """(client MB/s, client IOPS, recovery MB/s) of `ceph status --format json` output."""
+    pgmap = json.loads(status).get('pgmap', {})
+    mbps = (pgmap.get('read_bytes_sec', 0) + pgmap.get('write_bytes_sec', 0)) / 1048576.0
+    iops = pgmap.get('read_op_per_sec', 0) + pgmap.get('write_op_per_sec', 0)
+    recovery = pgmap.get('recovering_bytes_per_sec', 0) / 1048576.0
+    return mbps, iops, recovery
+
+
+def io_ticks(lines):
+    """{(host, device): ms spent doing IO} of (host, /proc/diskstats line) pairs."""
+    ticks = {}
+    for host, line in lines:
+        fields = line.split()
+        if len(fields) < 13 or fields[2].startswith(IGNORED_DEVICES):
+            continue
+        try:
+            ticks[(host, fields[2])] = int(fields[12])
+        except ValueError:
+            continue
+    return ticks
+
+
+def disk_util(prev, cur, elapsed):
+    """Highest % utilization of any disk between two io_ticks() samples elapsed seconds apart."""
+    if elapsed <= 0:
+        return 0.0
+    utils = [100.0 * (cur[key] - prev[key]) / (elapsed * 1000.0) for key in cur if key in prev]
+    return max(utils or [0.0])
+
+
+class IdleDetector(object):
+    def __init__(self, quiet=10, timeout=600, interval=2, max_client_mbps=1, max_client_iops=10,
+                 max_recovery_mbps=0, max_disk_util=5):
+        self.quiet = quiet
+        self.timeout = timeout
+        self.interval = interval
+        self.max_client_mbps = max_client_mbps
+        self.max_client_iops = max_client_iops
+        self.max_recovery_mbps = max_recovery_mbps
+        self.max_disk_util = max_disk_util
+        self.start = None
+        self.quiet_since = None
+        self.samples = []
+
+    def busy(self, io, util):
+        """Reasons the sample is not quiet, io is client_io() or None if unknown."""
+        reasons = []
+        if io is not None:
+            mbps, iops, recovery = io
+            if mbps > self.max_client_mbps:
+                reasons.append('client IO %.1f MB/s' % mbps)
+            if iops > self.max_client_iops:
+                reasons.append('client IO %d op/s' % iops)
+            if recovery > self.max_recovery_mbps:
+                reasons.append('recovery %.1f MB/s' % recovery)
+        if util is not None and util > self.max_disk_util:
+            reasons.append('disk %.0f%% busy' % util)
+        return reasons
+
+    def sample(self, io, util, now=None):
+        """
+        Records a sample, returns True once the cluster has been quiet for
+        quiet seconds.  Raises ClusterBusy past the timeout.
+        """
+        if now is None:
+            now = time.time()
+        if self.start is None:
+            self.start = now
+        reasons = self.busy(io, util)
+        self.samples.append({'time': now - self.start, 'io': io, 'disk_util': util, 'busy': reasons})
+        if reasons:
+            self.quiet_since = None
+            logger.debug('Cluster not idle: %s', ', '.join(reasons))
+        elif self.quiet_since is None:
+            self.quiet_since = now
+        if self.quiet_since is not None and now - self.quiet_since >= self.quiet:
+            return True
+        if now - self.start >= self.timeout:
+            raise ClusterBusy('Cluster not quiet for %ss within %ss (%s)'
+                              % (self.quiet, self.timeout, ', '.join(reasons) or 'quiet too briefly'))
+        return False
+
+
+def get_detector(cluster):
+    """IdleDetector of the idle cluster setting, None if not set."""
+    conf = cluster.get('idle')
+    if not conf:
+        return None
+    if conf is True:
+        conf = {}
+    return IdleDetector(**conf)
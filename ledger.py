@@ -0,0 +1,239 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import settings
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Record of every test of an archive directory, used to resume interrupted runs.
+
+Each test is keyed on a hash of its full benchmark config (which includes
+the iteration) and of the cluster settings that change its results
+(RESULT_SETTINGS: the hosts, how the cluster and its pools are built,
+recovery tests), so tests that only differ in settings not encoded in their
+out_dir are told apart.  Settings of the harness itself (transport, sync,
+executor, deadlines, monitoring, ...) can be changed when resuming.  The ledger lives in
+<archive>/ledger.db (sqlite) and records the state of each test with its
+timings:
+
+  planned  the test was expanded but not started yet
+  running  the test is initializing or running
+  synced   the test ran and its results are in the archive
+  done     the test was cleaned up as well
+  failed   the test raised, see the error column
+
+Tests that are synced or done are skipped when cbt.py is run again on the
+same archive.  Tests left running (the run was interrupted) or failed are
+run again, their partial out_dir is moved aside to <out_dir>.incomplete
+first.  An existing out_dir without a ledger entry (archives of older cbt
+versions) is skipped like before.  A test whose out_dir holds the results
+of a different config raises OutDirCollision instead of being skipped
+(cbt.py --plan reports it beforehand).  Set ledger: False in the cluster
+section to disable it.
+"""
+
+PLANNED = 'planned'
+RUNNING = 'running'
+SYNCED = 'synced'
+DONE = 'done'
+FAILED = 'failed'
+COMPLETE = (SYNCED, DONE)
+
+
+
+class OutDirCollision(Exception):
+    pass
+
+
+# cluster settings that change the results of a test
+RESULT_SETTINGS = (
+    # hosts
+    'head', 'clients', 'osds', 'mons', 'rgws', 'mds', 'client_groups',
+    # cluster build
+    'clusterid', 'conf_file', 'use_existing', 'rebuild_every_test', 'osds_per_node', 'fs', 'mkfs_opts',
+    'mount_opts', 'newstore_block', 'tiering', 'osd_valgrind', 'mon_valgrind', 'rgw_valgrind',
+    'ceph-osd_cmd', 'ceph-mon_cmd', 'ceph-run_cmd', 'ceph-rgw_cmd', 'ceph_cmd', 'rados_cmd', 'rbd_cmd',
+    # pools
+    'pool_profiles', 'erasure_profiles', 'crush_profiles',
+    # during the workload
+    'recovery_test',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    key TEXT PRIMARY KEY,
+    benchmark TEXT,
+    iteration INTEGER,
+    out_dir TEXT,
+    config TEXT,
+    state TEXT,
+    attempts INTEGER DEFAULT 0,
+    planned REAL,
+    started REAL,
+    synced REAL,
+    finished REAL,
+    error TEXT
+)
+"""
+
+
+def canonical(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def test_key(config, cluster=None):
+    """Hash of a benchmark config and the cluster settings that matter."""
+    if cluster is None:
+        cluster = settings.cluster
+    cluster = dict((k, v) for k, v in cluster.items() if k in RESULT_SETTINGS)
+    if isinstance(cluster.get('recovery_test'), dict):
+        # the cluster adds the run_dir of the running test
+        cluster['recovery_test'] = dict((k, v) for k, v in cluster['recovery_test'].items() if k != 'run_dir')
+    return hashlib.sha1(canonical({'config': config, 'cluster': cluster})).hexdigest()
+
+
+class Ledger(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # concurrent benchmarks (groups.py) record from their own threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def key(self, b):
+        # computed once, some benchmarks add to their config while running
+        if getattr(b, 'ledger_key', None) is None:
+            b.ledger_key = test_key(b.config)
+        return b.ledger_key
+
+    def _update(self, b, **columns):
+        names = sorted(columns)
+        with self.lock:
+            self.db.execute('UPDATE tests SET %s WHERE key = ?' % ', '.join('%s = ?' % n for n in names),
+                            [columns[n] for n in names] + [self.key(b)])
+            self.db.commit()
+
+    def record(self, b):
+        """The ledger entry of the test as a dict, or None."""
+        with self.lock:
+            cursor = self.db.execute('SELECT * FROM tests WHERE key = ?', (self.key(b),))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([d[0] for d in cursor.description], row))
+
+    def state(self, b):
+        entry = self.record(b)
+        return entry and entry['state']
+
+    def owner(self, out_dir):
+        """Key of the test that wrote out_dir, if the ledger knows it."""
+        with self.lock:
+            row = self.db.execute('SELECT key FROM tests WHERE out_dir = ? AND state IN (?, ?)',
+                                  (out_dir,) + COMPLETE).fetchone()
+        return row and row[0]
+
+    def skip(self, b):
+        """
+        Whether the test can be skipped: it completed before, or it has no
+        entry and its out_dir exists.  Otherwise the test is planned, and a
+        partial out_dir of an earlier attempt is moved aside.
+        """
+        state = self.state(b)
+        out_dir = getattr(b, 'out_dir', None)
+        if state in COMPLETE:
+            logger.info('Skipping %s test in %s, it is %s in the ledger.', b.getclass(), out_dir, state)
+            return True
+        if state is not None and out_dir and os.path.exists(out_dir):
+            logger.info('Moving aside partial results of the %s attempt in %s.', state, out_dir)
+            shutil.rmtree(out_dir + '.incomplete', ignore_errors=True)
+            os.rename(out_dir, out_dir + '.incomplete')
+        if b.exists():
+            if out_dir and self.owner(out_dir):
+                raise OutDirCollision('%s test in %s has the out_dir of a different config, it would not run.'
+                                      % (b.getclass(), out_dir))
+            return True
+        if state is None:
+            with self.lock:
+                self.db.execute('INSERT INTO tests (key, benchmark, iteration, out_dir, config, state, planned) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (self.key(b), b.getclass(), b.config.get('iteration'), out_dir,
+                                 canonical(b.config), PLANNED, time.time()))
+                self.db.commit()
+        else:
+            self._update(b, state=PLANNED)
+        return False
+
+    def start(self, b):
+        entry = self.record(b)
+        self._update(b, state=RUNNING, started=time.time(), attempts=(entry['attempts'] or 0) + 1,
+                     synced=None, finished=None, error=None)
+
+    def synced(self, b):
+        self._update(b, state=SYNCED, synced=time.time())
+
+    def done(self, b):
+        if self.state(b) == SYNCED:
+            self._update(b, state=DONE, finished=time.time())
+
+    def failed(self, b, error):
+        error = str(error) or error.__class__.__name__
+        if self.state(b) == SYNCED:
+            # only the cleanup failed, the results are complete
+            self._update(b, error=error)
+        else:
+            self._update(b, state=FAILED, finished=time.time(), error=error)
+
+    def summary(self):
+        with self.lock:
+            return dict(self.db.execute('SELECT state, COUNT(*) FROM tests GROUP BY state').fetchall())
+
+
+class NullLedger(object):
+    """Ledger used when it is disabled, skips tests whose out_dir exists."""
+    def state(self, b):
+        return None
+
+    def owner(self, out_dir):
+        return None
+
+    def skip(self, b):
+        return b.exists()
+
+    def start(self, b):
+        pass
+
+    synced = done = start
+
+    def failed(self, b, error):
+        pass
+
+    def summary(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def open_ledger(create=True):
+    """Ledger of the archive directory, only an existing one unless create is set."""
+    archive_dir = settings.cluster.get('archive_dir')
+    if not archive_dir or not settings.cluster.get('ledger', True):
+        return NullLedger()
+    path = os.path.join(archive_dir, 'ledger.db')
+    if not create and not os.path.exists(path):
+        return NullLedger()
+    if not os.path.isdir(archive_dir):
+        os.makedirs(archive_dir)
+    return Ledger(path)
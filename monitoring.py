@@ -1,8 +1,35 @@
+import contextlib
+import logging
+
 import common
 import settings
 
+logger = logging.getLogger('cbt')
+
+# directory of the monitoring shared by concurrently running benchmarks
+_shared = None
+
+
+@contextlib.contextmanager
+def shared(directory):
+    """
+    Monitor into directory for the duration of the block, start() and stop()
+    of the benchmarks running meanwhile do nothing.
+    """
+    global _shared
+    start(directory)
+    _shared = directory
+    try:
+        yield
+    finally:
+        _shared = None
+        stop(directory)
+
 
 def start(directory):
+    if _shared is not None:
+        logger.debug('Monitoring is shared in %s, not starting it for %s', _shared, directory)
+        return
     nodes = settings.getnodes('clients', 'osds', 'mons', 'rgws')
     collectl_dir = '%s/collectl' % directory
     # perf_dir = '%s/perf' % directory
@@ -25,6 +52,8 @@ def start(directory):
 
 
 def stop(directory=None):
+    if _shared is not None:
+        return
     nodes = settings.getnodes('clients', 'osds', 'mons', 'rgws')
 
     common.pdsh(nodes, 'pkill -SIGINT -f collectl').communicate()
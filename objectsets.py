@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import random
+import threading
+
+import common
+import settings
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Registry of the prefilled object sets radosbench reads from.
+
+Normally every radosbench test recreates its pools and writes a new object
+set before the read phase.  With
+
+  radosbench:
+    object_set:
+      objects: 10000         # objects written by every rados bench process
+
+the object set is kept across tests instead.  It is keyed by the pool
+profile, op_size, object_set_id and object count; a test whose key matches
+the set in its pools only runs the read phase, provided the set has the
+objects of every process (client and proc) the test reads with.  Otherwise
+the pools are recreated and the write phase writes a new set of objects
+per process.
+
+A set is validated before it is reused, in one round trip to the head: the
+object count of each pool (`rados df`) must not have changed since the set
+was written, and the metadata objects of a sample of the processes must
+exist (`rados stat`).  The registry is kept in <archive>/object_sets.json so
+sets survive interrupted runs on existing clusters.
+"""
+
+FILENAME = 'object_sets.json'
+
+# processes whose metadata object is checked per validation
+SAMPLES = 2
+
+_lock = threading.Lock()
+# pool -> {'key': ..., 'run_names': [...], 'num_objects': ...}
+_pools = None
+
+
+def set_key(pool_profile, op_size, object_set_id, objects):
+    return [pool_profile, int(op_size), object_set_id, int(objects)]
+
+
+def _path():
+    archive_dir = settings.cluster.get('archive_dir')
+    return archive_dir and os.path.join(archive_dir, FILENAME)
+
+
+def _load():
+    # called with _lock held
+    global _pools
+    if _pools is None:
+        _pools = {}
+        path = _path()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                _pools = json.load(f)
+    return _pools
+
+
+def _save():
+    # called with _lock held
+    path = _path()
+    if path:
+        common.mkdir_p(os.path.dirname(path))
+        with open(path, 'w') as f:
+            json.dump(_pools, f, indent=2, sort_keys=True)
+
+
+def lookup(pool):
+    with _lock:
+        return _load().get(pool)
+
+
+def record(pool, key, run_names, num_objects):
+    with _lock:
+        _load()[pool] = {'key': key, 'run_names': sorted(run_names), 'num_objects': num_objects}
+        _save()
+
+
+def forget(pools):
+    """Drops the sets of pools that are recreated or rewritten."""
+    with _lock:
+        entries = _load()
+        if any(pool in entries for pool in pools):
+            for pool in pools:
+                entries.pop(pool, None)
+            _save()
+
+
+def reset():
+    """Forgets the loaded registry (tests)."""
+    global _pools
+    with _lock:
+        _pools = None
+
+
+def object_counts(df_json):
+    """{pool: number of objects} of `rados df --format json` output."""
+    try:
+        pools = json.loads(df_json).get('pools', [])
+    except ValueError:
+        return {}
+    return dict((p.get('name'), p.get('num_objects')) for p in pools)
+
+
+def count_objects(cluster, pools):
+    """{pool: number of objects} of the pools, from one `rados df`."""
+    out, err = common.pdsh(settings.getnodes('head'), 'sudo %s -c %s df --format json' % (cluster.rados_cmd, cluster.tmp_conf)).communicate()
+    counts = object_counts(''.join(line.partition(': ')[2] for line in out.splitlines(True)))
+    return dict((pool, counts.get(pool)) for pool in pools)
+
+
+def usable(cluster, key, wanted):
+    """
+    Whether the object sets of the pools are of key, have the objects of
+    the processes wanted ({pool: [run names]}) and are still intact.
+    """
+    entries = dict((pool, lookup(pool)) for pool in wanted)
+    for pool, run_names in wanted.items():
+        entry = entries[pool]
+        if entry is None or entry['key'] != key:
+            return False
+        missing = set(run_names) - set(entry['run_names'])
+        if missing:
+            logger.info('Object set in %s lacks the objects of %s.', pool, ', '.join(sorted(missing)))
+            return False
+
+    batch = common.CommandBatch(settings.getnodes('head'))
+    batch.add('sudo %s -c %s df --format json' % (cluster.rados_cmd, cluster.tmp_conf))
+    samples = []
+    for pool, run_names in sorted(wanted.items()):
+        for run_name in random.sample(run_names, min(SAMPLES, len(run_names))):
+            batch.add('sudo %s -c %s -p %s stat %s' % (cluster.rados_cmd, cluster.tmp_conf, pool, run_name))
+            samples.append((pool, run_name))
+    results = batch.run()
+    if not results:
+        return False
+    steps = results.values()[0]
+    counts = object_counts(steps[0].stdout)
+    for pool in wanted:
+        if counts.get(pool) != entries[pool]['num_objects']:
+            logger.info('Object set in %s has %s objects, %s were written.', pool, counts.get(pool),
+                        entries[pool]['num_objects'])
+            return False
+    for (pool, run_name), step in zip(samples, steps[1:]):
+        if step.returncode != 0:
+            logger.info('Object set in %s lacks the metadata object %s.', pool, run_name)
+            return False
+    return True
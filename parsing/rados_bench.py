@@ -0,0 +1,263 @@
+#!/usr/bin/python
+import argparse
+import calendar
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+try:
+    import numpy
+    no_numpy = False
+except ImportError:
+    no_numpy = True
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Columnar parser of rados bench output.
+
+Radosbench leaves an output.<proc>.<host> file per rados bench process.
+parse() reads the per second table of such a file (sec, cur ops, started,
+finished, avg MB/s, cur MB/s, last lat, avg lat) into numpy arrays and the
+final summary (bandwidth, IOPS, average/max/min latency) into a dict.
+
+aggregate() aligns the per second series of all processes: on wall clock
+time if every file has the timestamp lines rados bench prints every 20
+seconds, on the start of each process otherwise (the processes of a test
+are started together).  It sums them into the cluster throughput and IOPS
+per second and rates the fairness between the processes with Jain's index
+(1 when all processes got the same bandwidth, 1/n when one got all of it).
+If the test has a steady_state.json (see steadystate.py) the cluster
+throughput is also averaged over the steady state seconds.
+
+write() stores the result next to the raw files: rados_bench.json (the
+summaries) and rados_bench.npz (the aligned per second arrays).  Radosbench
+calls it after every mode; run as a script it (re)processes every test
+directory of an archive:
+
+  parsing/rados_bench.py <archive_dir>
+"""
+
+OUTPUTS = 'output.[0-9]*'
+SUMMARY_FILE = 'rados_bench.json'
+ARRAYS_FILE = 'rados_bench.npz'
+
+TIMESTAMP = re.compile(r'^(\d{4}-\d\d-\d\d)[ T](\d\d:\d\d:\d\d)(\.\d+)?')
+
+# summary line -> (key, scale)
+SUMMARY = [
+    (re.compile(r'^Total time run:\s*([\d.]+)'), 'total_time_s', 1),
+    (re.compile(r'^Total (?:writes|reads) made:\s*(\d+)'), 'ops', 1),
+    (re.compile(r'^(?:Write|Read) size:\s*(\d+)'), 'op_size', 1),
+    (re.compile(r'^Bandwidth \(MB/sec\):\s*([\d.]+)'), 'bandwidth_mbps', 1),
+    (re.compile(r'^Stddev Bandwidth:\s*([\d.]+)'), 'stddev_mbps', 1),
+    (re.compile(r'^Average IOPS:\s*([\d.]+)'), 'iops', 1),
+    (re.compile(r'^Stddev IOPS:\s*([\d.]+)'), 'stddev_iops', 1),
+    (re.compile(r'^Average Latency(?:\(s\))?:\s*([\d.]+)'), 'avg_lat_ms', 1000),
+    (re.compile(r'^Stddev Latency(?:\(s\))?:\s*([\d.]+)'), 'stddev_lat_ms', 1000),
+    (re.compile(r'^Max latency(?:\(s\))?:\s*([\d.]+)', re.I), 'max_lat_ms', 1000),
+    (re.compile(r'^Min latency(?:\(s\))?:\s*([\d.]+)', re.I), 'min_lat_ms', 1000),
+]
+
+COLUMNS = ['cur_ops', 'started', 'finished', 'avg_mbps', 'cur_mbps', 'last_lat_ms', 'avg_lat_ms']
+
+
+def _float(field):
+    # rados bench prints '-' before the first op completed
+    try:
+        return float(field)
+    except ValueError:
+        return float('nan')
+
+
+def parse_timestamp(line):
+    """Seconds since the epoch of a rados bench timestamp line, None if it is none."""
+    m = TIMESTAMP.match(line)
+    if m is None:
+        return None
+    stamp = calendar.timegm(time.strptime('%s %s' % (m.group(1), m.group(2)), '%Y-%m-%d %H:%M:%S'))
+    return stamp + float(m.group(3) or 0)
+
+
+def parse(path):
+    """
+    {'seconds': array, <COLUMNS>: arrays, 'start': wall clock time of
+    second 0 or None, 'summary': dict} of a rados bench output file.
+    """
+    rows = []
+    start = None
+    stamp = None
+    summary = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 8 and fields[0].isdigit():
+                sec = int(fields[0])
+                rows.append([sec] + [_float(v) for v in fields[1:]])
+                if stamp is not None and start is None:
+                    # printed just before the line of second sec
+                    start = stamp - sec
+                stamp = None
+                continue
+            ts = parse_timestamp(line)
+            if ts is not None:
+                stamp = ts
+                continue
+            for regex, key, scale in SUMMARY:
+                m = regex.match(line.strip())
+                if m:
+                    summary[key] = float(m.group(1)) * scale
+                    break
+    if 'iops' not in summary and summary.get('total_time_s') and 'ops' in summary:
+        # older rados versions do not print it
+        summary['iops'] = summary['ops'] / summary['total_time_s']
+
+    table = numpy.array(rows, dtype=float).reshape(-1, len(COLUMNS) + 1)
+    result = {'seconds': table[:, 0].astype(int), 'start': start, 'summary': summary}
+    for i, column in enumerate(COLUMNS):
+        result[column] = table[:, i + 1]
+    for column in ('last_lat_ms', 'avg_lat_ms'):
+        result[column] = result[column] * 1000
+    return result
+
+
+def jain(values):
+    """Jain's fairness index of values, None without any."""
+    values = numpy.asarray(values, dtype=float)
+    if not len(values) or not (values ** 2).sum():
+        return None
+    return float(values.sum() ** 2 / (len(values) * (values ** 2).sum()))
+
+
+def aggregate(runs, window=None):
+    """
+    Aligned per second arrays and summaries of {process name: parse()}.
+    window is the (first, last) steady state second, if known.
+    """
+    names = sorted(runs)
+    starts = [runs[name]['start'] for name in names]
+    aligned = bool(names) and None not in starts
+    offsets = [0] * len(names)
+    if aligned:
+        first = min(starts)
+        offsets = [int(round(s - first)) for s in starts]
+    length = int(max([offset + (runs[name]['seconds'].max() + 1 if len(runs[name]['seconds']) else 0)
+                      for name, offset in zip(names, offsets)] or [0]))
+
+    mbps = numpy.full((len(names), length), numpy.nan)
+    iops = numpy.full((len(names), length), numpy.nan)
+    lat = numpy.full((len(names), length), numpy.nan)
+    for row, (name, offset) in enumerate(zip(names, offsets)):
+        run = runs[name]
+        columns = run['seconds'] + offset
+        mbps[row, columns] = run['cur_mbps']
+        # ops completed in each second
+        iops[row, columns] = numpy.diff(numpy.concatenate(([0.0], run['finished'])))
+        lat[row, columns] = run['last_lat_ms']
+
+    reporting = (~numpy.isnan(mbps)).sum(axis=0)
+    cluster_mbps = numpy.nansum(mbps, axis=0)
+    cluster_iops = numpy.nansum(iops, axis=0)
+    arrays = {'seconds': numpy.arange(length), 'processes': numpy.array(names), 'offsets': numpy.array(offsets),
+              'mbps': mbps, 'iops': iops, 'last_lat_ms': lat, 'reporting': reporting,
+              'cluster_mbps': cluster_mbps, 'cluster_iops': cluster_iops}
+
+    processes = {}
+    for name in names:
+        run = runs[name]
+        summary = dict(run['summary'])
+        if len(run['cur_mbps']):
+            summary['mean_mbps'] = float(numpy.nanmean(run['cur_mbps']))
+        processes[name] = summary
+    bandwidths = [processes[name].get('bandwidth_mbps', processes[name].get('mean_mbps', 0.0)) for name in names]
+
+    cluster = {'processes': len(names), 'seconds': length, 'aligned_on': 'wall_clock' if aligned else 'start',
+               'bandwidth_mbps': float(sum(bandwidths)),
+               'iops': float(sum(p.get('iops', 0.0) for p in processes.values()))}
+    # seconds every process reported
+    full = reporting == len(names)
+    if names and full.any():
+        cluster['peak_mbps'] = float(cluster_mbps[full].max())
+        cluster['mean_mbps'] = float(cluster_mbps[full].mean())
+    lats = [(p['avg_lat_ms'], p.get('ops', 1)) for p in processes.values() if 'avg_lat_ms' in p]
+    if lats:
+        cluster['avg_lat_ms'] = sum(l * n for l, n in lats) / sum(n for l, n in lats)
+    maxes = [p['max_lat_ms'] for p in processes.values() if 'max_lat_ms' in p]
+    if maxes:
+        cluster['max_lat_ms'] = max(maxes)
+    if window is not None:
+        first, last = window
+        steady = cluster_mbps[first:last + 1][full[first:last + 1]]
+        if len(steady):
+            cluster['steady_mbps'] = float(steady.mean())
+            cluster['steady_window'] = [first, last]
+
+    fairness = {'jain': jain(bandwidths)}
+    if bandwidths and max(bandwidths):
+        fairness['min_max_ratio'] = min(bandwidths) / max(bandwidths)
+        mean = numpy.mean(bandwidths)
+        fairness['cov'] = float(numpy.std(bandwidths) / mean) if mean else None
+    return {'cluster': cluster, 'fairness': fairness, 'processes': processes}, arrays
+
+
+def steady_window(out_dir):
+    """(first, last) second of the steady_state.json of out_dir, or None."""
+    fn = os.path.join(out_dir, 'steady_state.json')
+    if not os.path.exists(fn):
+        return None
+    with open(fn) as f:
+        result = json.load(f)
+    if not result.get('steady'):
+        return None
+    return result['start'], result['end']
+
+
+def process_name(fn):
+    """output.0.client1 -> 0.client1"""
+    return os.path.basename(fn)[len('output.'):]
+
+
+def write(out_dir):
+    """Parses the rados bench outputs of out_dir and writes the summary JSON and arrays, returns the summary."""
+    if no_numpy:
+        logger.warning('numpy not found, not parsing the rados bench output in %s', out_dir)
+        return None
+    files = sorted(glob.glob(os.path.join(out_dir, OUTPUTS)))
+    if not files:
+        return None
+    runs = dict((process_name(fn), parse(fn)) for fn in files)
+    summary, arrays = aggregate(runs, steady_window(out_dir))
+    with open(os.path.join(out_dir, SUMMARY_FILE), 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    numpy.savez_compressed(os.path.join(out_dir, ARRAYS_FILE), **arrays)
+    return summary
+
+
+def load(out_dir):
+    """The rados_bench.json of out_dir, None if there is none."""
+    fn = os.path.join(out_dir, SUMMARY_FILE)
+    if not os.path.exists(fn):
+        return None
+    with open(fn) as f:
+        return json.load(f)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Parse the rados bench output of an archive.')
+    parser.add_argument('archive_dir', help='Directory to search.')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    ctx = parse_args(sys.argv[1:])
+    for root, dirs, files in os.walk(ctx.archive_dir):
+        # fio leaves output.N files too
+        if 'Radosbench' in root.split(os.sep) and glob.glob(os.path.join(root, OUTPUTS)):
+            summary = write(root)
+            if summary is not None:
+                print '%s: %.1f MB/s, fairness %s' % (root, summary['cluster']['bandwidth_mbps'],
+                                                      summary['fairness']['jain'])
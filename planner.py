@@ -0,0 +1,135 @@
+import collections
+import logging
+
+import benchmarkfactory
+import ledger
+import settings
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Dry run of a cbt configuration, used by cbt.py --plan.
+
+The benchmark matrix is expanded exactly as a real run would expand it, but
+no benchmark is initialized or run and no command is sent to the cluster.  Every test is costed with the
+estimate_initialize()/estimate_run() methods of its benchmark: the time and
+ramp of the workload plus the fixed costs of idle monitoring, scrub checks,
+pool creation, prefill, cache drops and result collection (see PLAN_COSTS in
+benchmark/benchmark.py, overridable through the plan_costs cluster setting).
+Like cbt.py, initialize is only counted for the first test of each benchmark
+and when its initialize_key() changes, unless rebuild_every_test is set.
+Tests the ledger of the archive records as complete and tests without a
+ledger entry whose out_dir already exists are reported as skipped, as cbt.py
+would skip them.  Tests that repeat the out_dir of an earlier test of the
+plan, or whose out_dir the ledger records for a different config, are
+reported as errors (cbt.py raises ledger.OutDirCollision for them) and
+--plan exits with 1.
+"""
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return '%dd %02d:%02d:%02d' % (days, hours, minutes, seconds)
+    return '%02d:%02d:%02d' % (hours, minutes, seconds)
+
+
+class Planner(object):
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.ledger = ledger.open_ledger(create=False)
+        self.tests = []
+        self.warnings = []
+        self.errors = []
+
+    def _duplicate(self, test, first):
+        differs = sorted(key for key in set(test['config']) | set(first['config'])
+                         if test['config'].get(key) != first['config'].get(key))
+        self.errors.append('%s test %d repeats out_dir %s of test %d '
+                           '(differs in: %s)' % (test['benchmark'], test['index'], test['out_dir'],
+                                                 first['index'], ', '.join(differs) or 'nothing'))
+
+    def plan(self):
+        """Expand and cost every test, returns the list of planned tests."""
+        rebuild = settings.cluster.get('rebuild_every_test', False)
+        initialized = {}
+        seen = {}
+        for iteration in range(settings.cluster.get("iterations", 0)):
+            for b in benchmarkfactory.get_all(self.cluster, iteration):
+                test = {'index': len(self.tests),
+                        'benchmark': b.config.get('benchmark', b.getclass()),
+                        'iteration': iteration,
+                        'out_dir': getattr(b, 'out_dir', None),
+                        'config': b.config,
+                        'skip': None,
+                        'phases': {}}
+                self.tests.append(test)
+
+                if test['out_dir'] is not None and test['out_dir'] in seen:
+                    test['skip'] = 'duplicate'
+                    self._duplicate(test, seen[test['out_dir']])
+                    continue
+                seen[test['out_dir']] = test
+                state = self.ledger.state(b)
+                if state is None and b.exists() and self.ledger.owner(test['out_dir']):
+                    test['skip'] = 'collision'
+                    self.errors.append('%s test %d has out_dir %s, which holds the results of a different '
+                                       'config' % (test['benchmark'], test['index'], test['out_dir']))
+                    continue
+                if state in ledger.COMPLETE or (state is None and b.exists()):
+                    test['skip'] = 'exists'
+                    continue
+
+                phases = collections.defaultdict(float)
+                if initialized.get(b.getclass()) != b.initialize_key():
+                    for phase, seconds in b.estimate_initialize().items():
+                        phases[phase] += seconds
+                    if not rebuild:
+                        initialized[b.getclass()] = b.initialize_key()
+                for phase, seconds in b.estimate_run().items():
+                    phases[phase] += seconds
+                test['phases'] = dict(phases)
+                if phases.get('measure') == 0:
+                    self.warnings.append('%s test %d has no time limit, its measurement is not estimated'
+                                         % (test['benchmark'], test['index']))
+        return self.tests
+
+    def summary(self):
+        """Per benchmark test counts and phase totals, and the overall total."""
+        benchmarks = collections.OrderedDict()
+        for test in self.tests:
+            entry = benchmarks.setdefault(test['benchmark'], {'tests': 0, 'skipped': 0, 'duplicates': 0,
+                                                              'phases': collections.defaultdict(float)})
+            entry['tests'] += 1
+            if test['skip'] == 'exists':
+                entry['skipped'] += 1
+            elif test['skip'] in ('duplicate', 'collision'):
+                entry['duplicates'] += 1
+            for phase, seconds in test['phases'].items():
+                entry['phases'][phase] += seconds
+        total = sum(sum(entry['phases'].values()) for entry in benchmarks.values())
+        return benchmarks, total
+
+    def report(self):
+        benchmarks, total = self.summary()
+        for name, entry in benchmarks.items():
+            logger.info('%s: %d tests (%d already run, %d colliding out_dirs), estimated %s',
+                        name, entry['tests'], entry['skipped'], entry['duplicates'],
+                        format_duration(sum(entry['phases'].values())))
+            for phase, seconds in sorted(entry['phases'].items(), key=lambda x: -x[1]):
+                logger.info('    %-16s %s', phase, format_duration(seconds))
+        for warning in self.warnings:
+            logger.warning(warning)
+        for error in self.errors:
+            logger.error(error)
+        logger.info('Total: %d tests, estimated %s', len(self.tests), format_duration(total))
+
+
+def main(cluster):
+    planner = Planner(cluster)
+    planner.plan()
+    planner.report()
+    return 1 if planner.errors else 0
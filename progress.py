@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import re
+import threading
+
+import common
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Live view of a running workload.
+
+LiveTail runs `tail -F` on the per second output of the workload on every
+client (the per second lines of rados bench) and hands each line, with its
+host and file, to consumers: the steady state watcher (steadystate.py) and
+Progress.  fio keeps its bandwidth, IOPS and latency logs in memory and
+writes them when the jobs end (parse_fio_log reads them afterwards), so
+with live: True librbdfio runs fio with --status-interval=1 and JSON
+output instead, and FioStatus turns the totals of every job in the
+documents fio prints each second into per second samples.
+
+With live: True in a benchmark (or the cluster section) Progress sums the
+bandwidth and IOPS of all clients per second and averages their latency,
+logs a line per second on the console and appends it to live.jsonl in the
+test's out_dir, so a misbehaving run can be spotted (and interrupted)
+within seconds instead of after sync_files.  A second is reported once
+every file being tailed has moved past it.
+"""
+
+# ms per unit of the fio latency logs by fio major version, newer ones log nsec
+FIO_LAT_LOG_MS = {2: 0.001}
+
+RADOS_LINE = re.compile(r'^\s*(\d+)\s+\d+\s+\d+\s+(\d+)\s+[\d.e+-]+\s+([\d.e+-]+)\s+([\d.e+-]+)')
+
+
+def parse_rados_bench(path, line):
+    """Sample of a per second line of rados bench: second, MB/s, completed ops, last latency."""
+    m = RADOS_LINE.match(line)
+    if m is None:
+        return None
+    try:
+        return {'t': int(m.group(1)), 'ops_total': int(m.group(2)),
+                'mbps': float(m.group(3)), 'lat_ms': float(m.group(4)) * 1000}
+    except ValueError:
+        # no latency yet in the first second
+        return None
+
+
+def parse_fio_log(path, line, fio_major=None):
+    """
+    Sample of a line of a fio bandwidth, IOPS or latency log, fio_major
+    (see capabilities.min_major) picks the latency unit, fio 3 if unknown.
+    """
+    fields = line.split(',')
+    if len(fields) < 2:
+        return None
+    try:
+        t, value = int(fields[0]) / 1000.0, int(fields[1])
+    except ValueError:
+        return None
+    name = os.path.basename(path or '')
+    if '_bw' in name:
+        return {'t': t, 'mbps': value / 1024.0}
+    if '_iops' in name:
+        return {'t': t, 'iops': value}
+    if '_lat' in name:
+        return {'t': t, 'lat_ms': value * FIO_LAT_LOG_MS.get(fio_major, 0.000001)}
+    return None
+
+
+def fio_lat_ms(stats):
+    """Mean latency (ms) of the read or write stats of a job in fio's JSON output, None if unknown."""
+    if 'lat_ns' in stats:
+        return stats['lat_ns'].get('mean', 0) / 1000000.0
+    if 'lat' in stats:
+        return stats['lat'].get('mean', 0) / 1000.0
+    return None
+
+
+def parse_fio_status(path, doc):
+    """
+    Totals of the jobs of a fio JSON document (of every client's jobs in
+    client/server mode): {job: (runtime ms, bytes, ios, ios * latency ms)}.
+    """
+    totals = {}
+    for job in doc.get('client_stats', doc.get('jobs', [])):
+        if job.get('jobname') == 'All clients':
+            continue
+        io_bytes = ios = lat_total = 0
+        runtime = job.get('job_runtime', 0)
+        for direction in ('read', 'write'):
+            stats = job.get(direction, {})
+            io_bytes += stats.get('io_bytes', 0)
+            ios += stats.get('total_ios', 0)
+            runtime = runtime or stats.get('runtime', 0)
+            lat = fio_lat_ms(stats)
+            if lat is not None:
+                lat_total += stats.get('total_ios', 0) * lat
+        name = (job.get('hostname'), job.get('jobname'), job.get('groupid'))
+        totals[name] = (runtime, io_bytes, ios, lat_total)
+    return totals
+
+
+class LiveTail(object):
+    """
+    Tails the files matching pattern in run_dir on the nodes while the
+    workload runs, consumer.feed(host, path, line) is called for every line
+    and consumer.close() once the tail is stopped.
+    """
+    def __init__(self, nodes, run_dir, pattern, consumers):
+        self.nodes = nodes
+        self.run_dir = run_dir
+        self.pattern = pattern
+        self.consumers = consumers
+        self.proc = None
+        self.thread = threading.Thread(target=self._run, name='live-tail')
+        self.thread.daemon = True
+
+    def start(self):
+        files = '%s/%s' % (self.run_dir, self.pattern)
+        # the files only exist once the workload started
+        self.proc = common.pdsh(self.nodes, 'while ! ls %s >/dev/null 2>&1; do sleep 1; done; '
+                                            'exec tail -v -n +1 -F %s' % (files, files))
+        self.thread.start()
+        return self
+
+    def _run(self):
+        current = {}
+        try:
+            for host, line in self.proc.stream():
+                m = re.match(r'==> (.*) <==$', line)
+                if m:
+                    current[host] = m.group(1)
+                    continue
+                for consumer in self.consumers:
+                    consumer.feed(host, current.get(host), line)
+        except Exception:
+            logger.exception('Tailing %s/%s failed', self.run_dir, self.pattern)
+
+    def stop(self):
+        common.pdsh(self.nodes, "pkill -f '[t]ail -v -n +1 -F %s/'" % self.run_dir).communicate()
+        if self.thread.is_alive():
+            try:
+                self.proc.popen_obj.kill()
+            except OSError:
+                pass
+        self.thread.join(10)
+        for consumer in self.consumers:
+            consumer.close()
+
+
+class Progress(object):
+    """
+    Consumer of a LiveTail summing the samples parse() returns over the
+    sources (host and file) per second.
+    """
+    def __init__(self, parse, out_file=None, label=''):
+        self.parse = parse
+        self.out_file = out_file
+        self.label = label
+        self.out = None
+        # source -> {second: {metric: [sum, count]}}
+        self.series = {}
+        self.ops_total = {}
+        self.reported = -1
+        self.lines = []
+
+    def feed(self, host, path, line):
+        sample = self.parse(path, line)
+        if sample is None:
+            return
+        self.add((host, path), sample)
+
+    def add(self, source, sample):
+        second = int(sample.pop('t'))
+        if 'ops_total' in sample:
+            total = sample.pop('ops_total')
+            sample['iops'] = total - self.ops_total.get(source, 0)
+            self.ops_total[source] = total
+        buckets = self.series.setdefault(source, {}).setdefault(second, {})
+        for metric, value in sample.items():
+            bucket = buckets.setdefault(metric, [0.0, 0])
+            bucket[0] += value
+            bucket[1] += 1
+        self.report(min(max(seconds) for seconds in self.series.values()))
+
+    def aggregate(self, second):
+        """Bandwidth and IOPS summed over the sources, latency averaged."""
+        sums = {}
+        lats = []
+        for seconds in self.series.values():
+            for metric, (total, count) in seconds.pop(second, {}).items():
+                if metric == 'lat_ms':
+                    lats.append(total / count)
+                else:
+                    sums[metric] = sums.get(metric, 0.0) + total / count
+        entry = {'second': second}
+        entry.update(sums)
+        if lats:
+            entry['lat_ms'] = sum(lats) / len(lats)
+        return entry
+
+    def report(self, until):
+        """Reports the seconds before until."""
+        seconds = sorted(set(s for series in self.series.values() for s in series if s < until))
+        for second in seconds:
+            if second <= self.reported:
+                continue
+            entry = self.aggregate(second)
+            self.reported = second
+            self.lines.append(entry)
+            logger.info('%s %4ds: %8.1f MB/s %8.0f IOPS %s', self.label, second, entry.get('mbps', 0),
+                        entry.get('iops', 0), '%.2f ms' % entry['lat_ms'] if 'lat_ms' in entry else '')
+            if self.out_file:
+                if self.out is None:
+                    common.mkdir_p(os.path.dirname(self.out_file))
+                    self.out = open(self.out_file, 'a')
+                self.out.write(json.dumps(entry, sort_keys=True) + '\n')
+                self.out.flush()
+
+    def close(self):
+        if any(self.series.values()):
+            self.report(max(max(seconds) for seconds in self.series.values() if seconds) + 1)
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+
+class FioStatus(Progress):
+    """
+    Progress of fio's JSON status output (--status-interval=1
+    --output-format=json): the documents are collected line by line per
+    source, parse() (parse_fio_status) returns the totals of their jobs and
+    every job is a source of samples of the IO since the previous document.
+    """
+    def __init__(self, parse, out_file=None, label=''):
+        super(FioStatus, self).__init__(parse, out_file, label)
+        self.pending = {}
+        self.totals = {}
+
+    def feed(self, host, path, line):
+        lines = self.pending.setdefault((host, path), [])
+        # the fio client prints a line per server before the first document
+        if not lines and not line.startswith('{'):
+            return
+        lines.append(line)
+        # only the closing brace of a document is not indented
+        if line.rstrip() != '}':
+            return
+        del self.pending[(host, path)]
+        try:
+            doc = json.loads('\n'.join(lines))
+        except ValueError:
+            logger.warning('Unreadable fio status in %s:%s', host, path)
+            return
+        for job, totals in sorted(self.parse(path, doc).items()):
+            source = (host, path) + job
+            runtime, io_bytes, ios, lat_total = [now - before for now, before in
+                                                 zip(totals, self.totals.get(source, (0, 0, 0, 0)))]
+            if runtime <= 0:
+                continue
+            self.totals[source] = totals
+            sample = {'t': totals[0] / 1000.0, 'mbps': io_bytes / 1048576.0 / (runtime / 1000.0),
+                      'iops': ios / (runtime / 1000.0)}
+            if ios:
+                sample['lat_ms'] = lat_total / ios
+            self.add(source, sample)
@@ -44,34 +44,128 @@ def initialize(ctx):
         cluster['archive_dir'] = ctx.archive
 
 
-def getnodes(*nodelists):
-    nodes = []
-
-    for nodelist in nodelists:
-        cur = cluster.get(nodelist, [])
-        if isinstance(cur, str):
-            nodes.append(cur)
+class Topology(object):
+    """
+    Node lists of the cluster section, parsed once.
+
+    Every host is kept in the order it first appears (head, clients, osds,
+    mons, rgws, mds, then any other role asked for) which gives it a stable
+    index.  Role queries return ssh targets, bare host names or short host
+    names, matching what `hostname -s` prints remotely.  The ssh target of
+    a host listed as user@host keeps that user, bare hosts get the user of
+    the cluster section, if any.
+    """
+    ROLES = ['head', 'clients', 'osds', 'mons', 'rgws', 'mds']
+
+    def __init__(self, config):
+        self.config = config
+        self.user = config.get('user')
+        # host -> user it was listed with
+        self.users = {}
+        self.roles = {}
+        self.order = {}
+        self.joined = {}
+        for role in self.ROLES:
+            self.role_hosts(role)
+
+    def _parse(self, role, cur):
+        if isinstance(cur, basestring):
+            cur = cur.split(',')
         elif isinstance(cur, dict):
-            nodes.extend(cur.keys())
-        elif isinstance(cur, list):
-            nodes.extend(cur)
-        else:
-            raise ValueError("Can't process nodes of type %s - unknown set type: %r",
-                             nodelist, cur)
-
-    str_nodes = ','.join(uniquenodes(nodes))
-    logger.debug("Nodes : %s", str_nodes)
-    return str_nodes
-
+            cur = cur.keys()
+        elif not isinstance(cur, list):
+            raise ValueError("Can't process nodes of type %s - unknown set type: %r" % (role, cur))
+        hosts = []
+        for node in cur:
+            user, sep, host = str(node).strip().rpartition('@')
+            if user:
+                self.users.setdefault(host, user)
+            if host and host not in hosts:
+                hosts.append(host)
+        return hosts
+
+    def role_hosts(self, role):
+        hosts = self.roles.get(role)
+        if hosts is None:
+            hosts = self._parse(role, self.config.get(role, []))
+            self.roles[role] = hosts
+            for host in hosts:
+                self.order.setdefault(host, len(self.order))
+        return hosts
+
+    def hosts(self, *roles):
+        """Host names of the roles, without duplicates, in index order."""
+        hosts = set()
+        for role in roles:
+            hosts.update(self.role_hosts(role))
+        return sorted(hosts, key=self.order.get)
+
+    def group(self, name):
+        """Hosts of a client group defined in the client_groups setting."""
+        key = 'client_groups.%s' % name
+        hosts = self.roles.get(key)
+        if hosts is None:
+            groups = self.config.get('client_groups', {})
+            if name not in groups:
+                raise ValueError('Unknown client group %r, known groups are %s' % (name, ', '.join(sorted(groups))))
+            hosts = self._parse(key, groups[name])
+            self.roles[key] = hosts
+            for host in hosts:
+                self.order.setdefault(host, len(self.order))
+        return hosts
+
+    def group_nodes(self, name):
+        """Comma separated targets of a client group."""
+        return ','.join(self.target(host) for host in self.group(name))
+
+    def target(self, host):
+        """ssh/pdsh target of a host."""
+        user = self.users.get(host, self.user)
+        if user is None or '@' in host:
+            return host
+        return '%s@%s' % (user, host)
+
+    def targets(self, *roles):
+        return [self.target(host) for host in self.hosts(*roles)]
+
+    def nodes(self, *roles):
+        """Comma separated targets of the roles, as passed to common.pdsh."""
+        joined = self.joined.get(roles)
+        if joined is None:
+            joined = ','.join(self.targets(*roles))
+            self.joined[roles] = joined
+        return joined
+
+    def short(self, node):
+        """user@host.domain -> host, the way `hostname -s` would print it."""
+        host = node.rpartition('@')[2]
+        if host.replace('.', '').isdigit():
+            return host
+        return host.split('.')[0]
+
+    def shortnames(self, *roles):
+        return [self.short(host) for host in self.hosts(*roles)]
+
+    def index(self, node):
+        """Stable index of a host, None for hosts not in the cluster section."""
+        return self.order.get(node.rpartition('@')[2])
+
+
+_topology = None
+
+
+def get_topology():
+    """Topology of the current cluster section, rebuilt when it is replaced."""
+    global _topology
+    if _topology is None or _topology.config is not cluster:
+        _topology = Topology(cluster)
+    return _topology
 
-def uniquenodes(nodes):
-    ret = [node for node in nodes if node]
 
-    user = cluster.get('user')
-    if user is not None:
-        ret = ['%s@%s' % (user, node) for node in ret]
-
-    return set(ret)
+def getnodes(*nodelists):
+    str_nodes = get_topology().nodes(*nodelists)
+    logger.debug("Nodes : %s", str_nodes)
+    return str_nodes
 
 
 def shutdown(message):
@@ -14,13 +14,34 @@ This module contains functions for processing test results.
 Main function is data_property.
 """
 
+# two-sided Student t critical values by degrees of freedom 1..30, larger
+# degrees of freedom use the (slightly conservative) value for 30
+T_TABLE = {
+    0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+           1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+           1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697],
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750],
+}
+
+
+def t_value(level, df, table=None):
+    """Two-sided Student t critical value, from scipy unless table is given."""
+    if table is None and not no_numpy:
+        return float(stats.t.ppf((1 + level) / 2.0, df))
+    return (table or T_TABLE)[level][min(df, 30) - 1]
+
 
 def average(data):
-    return sum(data) / len(data)
+    return sum(data) / float(len(data))
 
 
 def mediana(vals):
-    return sum(vals) / len(vals)
+    return sum(vals) / float(len(vals))
 
 
 def deviation(vals):
@@ -30,7 +51,7 @@ def deviation(vals):
 
 
 def round_3_digit(val):
-    return round_val_and_deviation((val, val / 10.0))[0]
+    return round_val_and_deviation(val, val / 10.0)[0]
 
 
 def round_val_and_deviation(val, dev):
@@ -186,24 +207,23 @@ def data_property(data, confidence=0.95):
         return res
 
     data = sorted(data)
-    res.average, res.deviation = round_val_and_deviation(data)
+    res.average = average(data)
+    res.deviation = deviation(data)
     res.max = data[-1]
     res.min = data[0]
 
     ln = len(data)
     if ln % 2 == 0:
-        res.mediana = (data[ln / 2] + data[ln / 2 - 1]) / 2
+        res.mediana = (data[ln / 2] + data[ln / 2 - 1]) / 2.0
     else:
         res.mediana = data[ln / 2]
 
     res.perc_95 = data[int((ln - 1) * 0.95)]
     res.perc_05 = data[int((ln - 1) * 0.05)]
 
-    if not no_numpy and ln >= 3:
-        res.confidence = stats.sem(data) * \
-                         stats.t.ppf((1 + confidence) / 2, ln - 1)
-    else:
-        res.confidence = res.deviation
+    # half-width of the Student t interval of the mean, None for one value
+    if ln >= 2:
+        res.confidence = t_value(confidence, ln - 1) * res.deviation / (ln - 1) ** 0.5
 
     res.raw = data[:]
     return res
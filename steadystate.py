@@ -0,0 +1,188 @@
+import glob
+import json
+import logging
+import os
+
+import progress
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Steady state detection of the workload throughput.
+
+With
+
+  steady_state:
+    window: 10        # seconds that must vary less than cov
+    cov: 0.05         # coefficient of variation (stddev / mean)
+    stop_after: 60    # optional: let fio end the jobs after 60 steady seconds
+
+in a benchmark (or the cluster section) the per second throughput the
+workload logs (the per second lines of rados bench) is tailed from the
+clients while it runs (see progress.LiveTail).  The seconds every client has
+reported are summed over the clients, and the steady state starts at the
+first second from which the coefficient of variation of window seconds is
+below cov; it lasts as long as the whole span since then stays below cov.
+With stop_after librbdfio passes fio 3 its own steadystate options, so that
+fio ends each job once its bandwidth has stayed within cov of the mean for
+stop_after seconds, and stopped_early in steady_state.json records whether
+it did.  rados bench has no clean stop, so stop_after is ignored with a
+warning for radosbench (and for fio older than 3).
+
+After the run the steady state window is determined again from the archived
+logs and stored in steady_state.json in the out_dir, so that the parsers
+aggregate only the steady state seconds (see steady_mean()).
+"""
+
+FILENAME = 'steady_state.json'
+
+
+def parse_fio_log(path, line):
+    """(seconds, MB/s) of a line of a fio bandwidth log, or None."""
+    sample = progress.parse_fio_log(path, line)
+    if sample is None or 'mbps' not in sample:
+        return None
+    return sample['t'], sample['mbps']
+
+
+def parse_rados_bench(path, line):
+    """(seconds, current MB/s) of a per second line of rados bench, or None."""
+    sample = progress.parse_rados_bench(path, line)
+    if sample is None:
+        return None
+    return sample['t'], sample['mbps']
+
+
+def cov(values):
+    """Coefficient of variation of values, None if the mean is 0."""
+    mean = sum(values) / float(len(values))
+    if mean <= 0:
+        return None
+    return (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5 / mean
+
+
+class SteadyStateDetector(object):
+    def __init__(self, window=10, cov=0.05, stop_after=None):
+        self.window = window
+        self.cov = cov
+        self.stop_after = stop_after
+        # source -> {second: [sum, count]}
+        self.series = {}
+
+    def add(self, source, t, value):
+        bucket = self.series.setdefault(source, {}).setdefault(int(t), [0.0, 0])
+        bucket[0] += value
+        bucket[1] += 1
+
+    def points(self, final=False):
+        """
+        [(second, throughput summed over the sources)] of the seconds every
+        source has moved past, or of every second if final.
+        """
+        if not self.series:
+            return []
+        last = min(max(buckets) for buckets in self.series.values())
+        seconds = sorted(set(s for buckets in self.series.values() for s in buckets if final or s < last))
+        return [(s, sum(b[s][0] / b[s][1] for b in self.series.values() if s in b)) for s in seconds]
+
+    def steady(self, points):
+        """(first, last) index of the steady state span in points, or None."""
+        values = [v for s, v in points]
+        for first in xrange(len(values) - self.window + 1):
+            c = cov(values[first:first + self.window])
+            if c is not None and c <= self.cov:
+                last = first + self.window - 1
+                while last + 1 < len(values):
+                    c = cov(values[first:last + 2])
+                    if c is None or c > self.cov:
+                        break
+                    last += 1
+                return first, last
+        return None
+
+    def result(self, final=True):
+        points = self.points(final)
+        result = {'window': self.window, 'cov': self.cov, 'seconds': len(points), 'steady': False}
+        span = self.steady(points)
+        if span is not None:
+            first, last = span
+            values = [v for s, v in points[first:last + 1]]
+            result.update({'steady': True, 'start': points[first][0], 'end': points[last][0],
+                           'steady_seconds': points[last][0] - points[first][0] + 1,
+                           'mean': sum(values) / len(values), 'span_cov': cov(values)})
+        return result
+
+
+def get_detector(config):
+    """SteadyStateDetector of a steady_state setting, None if not set."""
+    if not config:
+        return None
+    if config is True:
+        config = {}
+    return SteadyStateDetector(config.get('window', 10), config.get('cov', 0.05), config.get('stop_after'))
+
+
+class SteadyStateWatcher(object):
+    """
+    Consumer of a progress.LiveTail feeding the lines parse() understands to
+    the detector.
+    """
+    def __init__(self, parse, detector):
+        self.parse = parse
+        self.detector = detector
+
+    def feed(self, host, path, line):
+        sample = self.parse(path, line)
+        if sample is None:
+            return
+        self.detector.add((host, path), *sample)
+
+    def close(self):
+        pass
+
+
+def archived_series(out_dir, pattern, parse, detector):
+    """Feeds the archived files matching pattern (with any host suffix) to the detector."""
+    for fn in sorted(glob.glob(os.path.join(out_dir, pattern + '*'))):
+        with open(fn) as f:
+            for line in f:
+                sample = parse(fn, line)
+                if sample is not None:
+                    detector.add(fn, *sample)
+    return detector
+
+
+def write(out_dir, pattern, parse, detector, stopped_early=False):
+    """Determines the steady state from the archived files and writes steady_state.json."""
+    fresh = SteadyStateDetector(detector.window, detector.cov, detector.stop_after)
+    result = archived_series(out_dir, pattern, parse, fresh).result()
+    result['stopped_early'] = stopped_early
+    if result['steady']:
+        logger.info('Steady state from second %s to %s in %s', result['start'], result['end'], out_dir)
+    else:
+        logger.warning('No steady state found in %s', out_dir)
+    with open(os.path.join(out_dir, FILENAME), 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    return result
+
+
+def load(out_dir):
+    """The steady_state.json of out_dir, None if there is none or no steady state was found."""
+    fn = os.path.join(out_dir, FILENAME)
+    if not os.path.exists(fn):
+        return None
+    with open(fn) as f:
+        result = json.load(f)
+    return result if result.get('steady') else None
+
+
+def steady_mean(out_dir, pattern, parse):
+    """Mean summed throughput over the steady state seconds of out_dir, None if unknown."""
+    window = load(out_dir)
+    if window is None:
+        return None
+    points = archived_series(out_dir, pattern, parse, SteadyStateDetector()).points(final=True)
+    values = [v for s, v in points if window['start'] <= s <= window['end']]
+    if not values:
+        return None
+    return sum(values) / len(values)
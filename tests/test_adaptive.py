@@ -0,0 +1,59 @@
+import unittest
+
+import adaptive
+import statistic
+
+
+def knee_at(knee):
+    """throughput grows linearly up to knee and is flat after it."""
+    return lambda x: {'throughput': 100.0 * min(x, knee), 'latency': float(x)}
+
+
+class TestAdaptiveSweep(unittest.TestCase):
+    def run_sweep(self, sweep, result):
+        for value in sweep:
+            sweep.record(value, result(value))
+        return sweep.report()
+
+    def test_stops_at_knee(self):
+        sweep = adaptive.AdaptiveSweep([64, 1, 2, 4, 8, 16, 32, 128], window=2)
+        report = self.run_sweep(sweep, knee_at(8))
+        self.assertEqual(report['knee'], 8)
+        self.assertEqual(report['saturated_by'], 'throughput')
+        self.assertEqual(report['skipped'], [32, 64, 128])
+
+    def test_bisect(self):
+        values = range(1, 33)
+        sweep = adaptive.AdaptiveSweep(values, stride=8, window=2)
+        report = self.run_sweep(sweep, knee_at(20))
+        self.assertEqual(report['knee'], 20)
+        self.assertTrue(len(sweep.ran) < 10)
+
+    def test_latency(self):
+        sweep = adaptive.AdaptiveSweep([1, 2, 4, 8, 16], latency_factor=3, window=2)
+        report = self.run_sweep(sweep, knee_at(100))
+        self.assertEqual(report['knee'], 2)
+        self.assertEqual(report['saturated_by'], 'latency')
+
+    @unittest.skipIf(statistic.no_numpy, 'needs numpy and scipy')
+    def test_default_window(self):
+        # one point that barely grew, the fitted line rides over it
+        stall = {1: 100, 2: 200, 3: 300, 4: 305, 5: 500, 6: 600, 7: 700, 8: 800}
+        result = lambda x: {'throughput': float(stall.get(x, 800)), 'latency': 1.0}
+        sweep = adaptive.AdaptiveSweep(range(1, 13))
+        self.assertEqual(sweep.window, 3)
+        report = self.run_sweep(sweep, result)
+        self.assertEqual(report['knee'], 9)
+        self.assertEqual(report['skipped'], [11, 12])
+        # without the smoothing the stall looks like the knee
+        report = self.run_sweep(adaptive.AdaptiveSweep(range(1, 13), window=2), result)
+        self.assertEqual(report['knee'], 3)
+
+    def test_no_results(self):
+        sweep = adaptive.AdaptiveSweep([1, 2, 4])
+        report = self.run_sweep(sweep, lambda x: None)
+        self.assertEqual(sweep.ran, [1, 2, 4])
+        self.assertEqual(report['knee'], None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+import executor
+import settings
+import steadystate
+import transport
+from benchmark.benchmark import Benchmark
+from benchmark.librbdfio import LibrbdFio, parse_fio_json, parse_fio_output
+
+
+class TestBenchmarkDeadline(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        self.archive = tempfile.mkdtemp()
+        settings.cluster = {'transport': 'local', 'archive_dir': self.archive, 'tmp_dir': '/tmp/cbt'}
+
+    def tearDown(self):
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.archive)
+
+    def mkbenchmark(self, **config):
+        config.update({'iteration': 0, 'osd_ra': 128})
+        return Benchmark(None, config)
+
+    def test_deadline(self):
+        b = self.mkbenchmark()
+        self.assertEqual(b.deadline(), None)
+        b.time = '60'
+        b.ramp = 'None'
+        self.assertEqual(b.deadline(), 360)
+        b.ramp = 10
+        b.config['deadline_grace'] = 5
+        self.assertEqual(b.deadline(), 75)
+        b.config['deadline'] = 1
+        self.assertEqual(b.deadline(), 1)
+
+    def test_partial(self):
+        b = self.mkbenchmark(deadline=0.3, kill_stragglers=True)
+        cmds = executor.fanout('a,b', 'test $CBT_HOST = a || exec sleep 5', throttle=False)
+        done, late = b.wait_workload(cmds, self.archive, 'true')
+        self.assertEqual([cmd.host for cmd in late], ['b'])
+        self.assertTrue(b.partial)
+        with open(os.path.join(self.archive, 'partial.yaml')) as f:
+            partial = yaml.safe_load(f)
+        self.assertEqual(partial['late_hosts'], ['b'])
+        self.assertEqual(partial['completed_hosts'], ['a'])
+        self.assertTrue(partial['killed'])
+
+
+class TestFioOutput(unittest.TestCase):
+    def test_fio2(self):
+        bw, lats = parse_fio_output(
+            "job: (groupid=0, jobs=1): err= 0: pid=1\n"
+            "  write: io=1024.0MB, bw=102400KB/s, iops=25, runt= 10001msec\n"
+            "    clat (msec): min=1, max=10, avg= 5.12, stdev= 1.0\n"
+            "     lat (msec): min=1, max=10, avg= 5.20, stdev= 1.0\n")
+        self.assertEqual(bw, 100.0)
+        self.assertEqual(lats, [5.2])
+
+    def test_fio3(self):
+        bw, lats = parse_fio_output(
+            "  read: IOPS=25, BW=50.0MiB/s (52.4MB/s)(500MiB/10001msec)\n"
+            "     lat (usec): min=10, max=100, avg=2500.00, stdev=1.0\n"
+            "  lat (usec)   : 250=0.01%, 500=0.02%\n"
+            "  write: IOPS=25, BW=1GiB/s (1074MB/s)(10GiB/10001msec)\n")
+        self.assertEqual(bw, 1074.0)
+        self.assertEqual(lats, [2.5])
+
+
+class TestFioJson(unittest.TestCase):
+    def test_client_stats(self):
+        bw, lats = parse_fio_json(
+            '<client1> fio: server started\n'
+            '{"client_stats": ['
+            '{"jobname": "librbdfio-client1-0-0", "read": {"bw": 51200, "iops": 12.5, "lat_ns": {"mean": 2500000}},'
+            ' "write": {"bw": 0, "iops": 0, "lat_ns": {"mean": 0}}},'
+            '{"jobname": "librbdfio-client2-0-0", "read": {"bw": 102400, "iops": 25, "lat_ns": {"mean": 1500000}}},'
+            '{"jobname": "All clients", "read": {"bw": 153600, "iops": 37.5, "lat_ns": {"mean": 2000000}}}]}\n')
+        self.assertEqual(bw, 150.0)
+        self.assertEqual(lats, [2.5, 1.5])
+
+    def test_jobs(self):
+        bw, lats = parse_fio_json('{"jobs": [{"jobname": "j", "write": {"bw": 1024, "iops": 1, "lat": {"mean": 500}}}]}')
+        self.assertEqual(bw, 1.0)
+        self.assertEqual(lats, [0.5])
+        self.assertEqual(parse_fio_json('fio: connect: Connection refused\n'), (0.0, []))
+
+    def test_status_stream(self):
+        # the status of every interval with live, the results last
+        bw, lats = parse_fio_json('{"jobs": [{"jobname": "j", "write": {"bw": 512, "iops": 1, "lat": {"mean": 100}}}]}\n'
+                                  '{"jobs": [{"jobname": "j", "write": {"bw": 1024, "iops": 1, "lat": {"mean": 500}}}]}\n')
+        self.assertEqual((bw, lats), (1.0, [0.5]))
+
+
+class TestFioServer(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'clients': ['client1', 'client2'], 'head': 'head1', 'archive_dir': '/tmp/archive',
+                            'tmp_dir': '/tmp/cbt'}
+
+    def tearDown(self):
+        settings.cluster = self.old_cluster
+
+    def mkbenchmark(self, **config):
+        config.setdefault('fio_server', True)
+        config.update({'iteration': 0, 'osd_ra': 128})
+        cluster = type('Cluster', (object,), {'config': {}})()
+        return LibrbdFio(cluster, config)
+
+    def test_job_file(self):
+        b = self.mkbenchmark(volumes_per_client=2, procs_per_volume=2, time=60, mode='randread')
+        sections = b.mkjobfile().split('\n\n')
+        self.assertEqual(len(sections), 5)
+        self.assertIn('pool=cbt-librbdfio\n', sections[0])
+        self.assertIn('rw=randread\n', sections[0])
+        self.assertIn('runtime=60\n', sections[0])
+        self.assertIn('direct=1\n', sections[0])
+        self.assertEqual(sections[4].splitlines()[:2],
+                         ['[librbdfio-$(hostname -s)-1-1]', 'rbdname=cbt-librbdfio-$(hostname -s)-1'])
+        self.assertIn('write_bw_log=%s/output.1' % b.run_dir, sections[4])
+
+    def test_unset_time(self):
+        b = self.mkbenchmark()
+        b.cluster.config['recovery_test'] = {'osds': [0]}
+        options = dict(b.fio_options())
+        for option in ('runtime', 'ramp_time', 'time_based'):
+            self.assertNotIn(option, options)
+        self.assertNotIn('None', b.mkjobfile())
+        self.assertNotEqual(b.initialize_key(), self.mkbenchmark(fio_server=False).initialize_key())
+
+    def test_client_cmd(self):
+        b = self.mkbenchmark()
+        b.cmd_path_full = b.cmd_path
+        self.assertEqual(b.mkfioclientcmd(),
+                         'sudo /usr/bin/fio --client=client1 --remote-config /tmp/cbt/librbdfio.fio'
+                         ' --client=client2 --remote-config /tmp/cbt/librbdfio.fio'
+                         ' --output-format=json > %s/output.json' % b.run_dir)
+
+    def test_steady_stop(self):
+        b = self.mkbenchmark(steady_state={'cov': 0.05, 'stop_after': 60})
+        self.assertNotIn('steadystate', dict(b.fio_options()))
+        b.steady_stop = steadystate.get_detector(b.config['steady_state'])
+        options = dict(b.fio_options())
+        self.assertEqual((options['steadystate'], options['steadystate_duration']), ('bw:5%', 60))
+        self.assertIn(' --steadystate=bw:5% --steadystate_duration=60 ', b.mkfiocmd(0))
+
+    def test_attained(self):
+        b = self.mkbenchmark()
+        b.out_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(b.out_dir, 'output.json'), 'w') as f:
+                f.write('{"jobs": [{"jobname": "j", "steadystate": {"attained": 0}}]}')
+            self.assertFalse(b.attained())
+            with open(os.path.join(b.out_dir, 'output.0.client1'), 'w') as f:
+                f.write('  steadystate  : attained=yes, bw=100MiB/s (104857600), iops_mean=25\n')
+            self.assertTrue(b.attained())
+        finally:
+            shutil.rmtree(b.out_dir)
+
+    def test_live_status(self):
+        b = self.mkbenchmark(live=True)
+        b.cmd_path_full = b.cmd_path
+        self.assertTrue(b.mkfioclientcmd().endswith(' --output-format=json --status-interval=1 > %s/output.json' % b.run_dir))
+        b = self.mkbenchmark(fio_server=False, live=True)
+        self.assertIn(' --status-interval=1 --output-format=json ', b.mkfiocmd(0))
+        self.assertNotIn('--status-interval', self.mkbenchmark(fio_server=False).mkfiocmd(0))
+
+    def test_kill_cmd(self):
+        self.assertEqual(self.mkbenchmark().mkkillcmd(), "sudo pkill -INT -f '[-]-remote-config /tmp/cbt/librbdfio.fio'")
+        b = self.mkbenchmark(fio_server=False)
+        # only the jobs of this test's pool, not the fio servers
+        self.assertEqual(b.mkkillcmd(), "sudo pkill -9 -f '[-]-pool=cbt-librbdfio '")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
 import benchmarkfactory
+import settings
 
 
 class TestBenchmarkFactory(unittest.TestCase):
@@ -57,5 +63,98 @@ class TestBenchmarkFactory(unittest.TestCase):
         self.assertEqual(len(cfgs), 1)
         self.assertEqual(cfgs[0], config)
 
+    def sweep_config(self, sweep):
+        return dict(x=12, sweep=sweep, a=[1, 2, 3, 4], b=['r', 'w'], c=[4, 16, 64],
+                    d=[True, False], e=[1, 2, 3], f=[0, 1])
+
+    def check_sampled(self, cfgs, config):
+        points = [tuple(cfg[k] for k in 'abcdef') for cfg in cfgs]
+        self.assertEqual(len(points), len(set(points)))
+        for cfg in cfgs:
+            self.assertEqual(cfg['x'], 12)
+            self.assertNotIn('sweep', cfg)
+        for k in 'abcdef':
+            self.assertEqual(sorted(set(cfg[k] for cfg in cfgs)), sorted(config[k]))
+
+    def test_sweep_product(self):
+        config = self.sweep_config('product')
+        self.assertEqual(len(list(benchmarkfactory.all_configs(config))), 4 * 2 * 3 * 2 * 3 * 2)
+
+    def test_sweep_fractional(self):
+        config = self.sweep_config({'strategy': 'fractional'})
+        cfgs = list(benchmarkfactory.all_configs(config))
+        self.assertTrue(len(cfgs) <= 25)
+        self.check_sampled(cfgs, config)
+
+    def test_sweep_lhs(self):
+        config = self.sweep_config({'strategy': 'lhs', 'samples': 10, 'seed': 3})
+        cfgs = list(benchmarkfactory.all_configs(config))
+        self.assertTrue(len(cfgs) <= 10)
+        self.check_sampled(cfgs, config)
+        self.assertEqual(cfgs, list(benchmarkfactory.all_configs(config)))
+
+    def test_sweep_random(self):
+        config = self.sweep_config({'strategy': 'random', 'samples': 5, 'seed': 1})
+        cfgs = list(benchmarkfactory.all_configs(config))
+        self.assertTrue(len(cfgs) >= 5)
+        self.check_sampled(cfgs, config)
+        self.assertEqual(cfgs, list(benchmarkfactory.all_configs(config)))
+
+    def test_sweep_unknown(self):
+        self.assertRaises(ValueError, list, benchmarkfactory.all_configs({'sweep': 'bogus'}))
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        self.old = settings.cluster, settings.benchmarks
+        self.archive = tempfile.mkdtemp()
+        settings.cluster = {'clients': ['c1'], 'archive_dir': self.archive, 'tmp_dir': '/tmp/cbt'}
+        settings.benchmarks = {'librbdfio': {'time': 10, 'mode': ['read', 'write'],
+                                             'pool_profile': ['a', 'b'], 'osd_ra': [128, 256]}}
+
+    def tearDown(self):
+        settings.cluster, settings.benchmarks = self.old
+        shutil.rmtree(self.archive)
+
+    def test_greedy(self):
+        configured = list(benchmarkfactory.get_all(None, 0))
+        settings.cluster['schedule'] = 'greedy'
+        scheduled = list(benchmarkfactory.get_all(None, 0))
+        self.assertEqual([b.pool_profile for b in scheduled], ['a'] * 4 + ['b'] * 4)
+        self.assertEqual([b.osd_ra for b in scheduled], [128, 128, 256, 256, 256, 256, 128, 128])
+        self.assertEqual(sorted(b.out_dir for b in configured), sorted(b.out_dir for b in scheduled))
+
+        def cost(objects):
+            prev = None
+            total = 0
+            for b in objects:
+                total += b.transition_cost(prev)
+                prev = b
+            return total
+        self.assertTrue(cost(scheduled) < cost(configured))
+
+
+class TestRegistry(unittest.TestCase):
+    def test_lazy_import(self):
+        code = ('import sys, benchmarkfactory; benchmarkfactory.get_class("radosbench"); '
+                'print sorted(m for m in ["lxml", "benchmark.cosbench", "benchmark.radosbench"] if m in sys.modules)')
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(out.strip(), "['benchmark.radosbench']")
+
+    def test_register(self):
+        class Custom(object):
+            def __init__(self, cluster, config):
+                self.config = config
+        benchmarkfactory.register('custom', Custom)
+        try:
+            b = benchmarkfactory.get_object(None, 'custom', {'x': 1})
+            self.assertEqual(b.config, {'x': 1})
+        finally:
+            benchmarkfactory._classes.pop('custom')
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, benchmarkfactory.get_class, 'nosuchbench')
+
 if __name__ == '__main__':
     unittest.main()
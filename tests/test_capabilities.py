@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+import capabilities
+import settings
+import transport
+
+FIO = ('case "$*" in *--version*) echo fio-3.1;; '
+       '*--enghelp*) printf "Available IO engines:\\n\\tsync\\n\\trbd\\n";; esac')
+
+
+class TestParse(unittest.TestCase):
+    def test_version(self):
+        self.assertEqual(capabilities.parse_version('ceph version 14.2.22 (ca74598065096e6fcbd8433c8779a2be0c889351) nautilus (stable)\n'),
+                         {'version': '14.2.22', 'major': 14})
+        self.assertEqual(capabilities.parse_version('fio-3.1\n'), {'version': '3.1', 'major': 3})
+        self.assertEqual(capabilities.parse_version('ceph version 0.94.10 (b1e0532418e4631af01acbc0cedd426f1905f4af)'),
+                         {'version': '0.94.10', 'major': 0})
+        self.assertEqual(capabilities.parse_version(''), None)
+
+    def test_features(self):
+        self.assertEqual(capabilities.parse_features('Available IO engines:\n\tsync\n\trbd\n'), ['sync', 'rbd'])
+
+
+class TestProbe(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        self.archive_dir = tempfile.mkdtemp()
+        settings.cluster = {'transport': 'simulated', 'tmp_dir': '/tmp/cbt', 'head': 'head1',
+                            'clients': ['client1', 'client2'], 'osds': ['osd1'], 'user': 'cbt',
+                            'archive_dir': self.archive_dir, 'simulation': {'commands': {'fio': FIO}}}
+        capabilities.reset()
+
+    def tearDown(self):
+        capabilities.reset()
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.archive_dir)
+
+    def test_probe_cluster(self):
+        capabilities.probe_cluster()
+        with open(os.path.join(self.archive_dir, 'capabilities.yaml')) as f:
+            report = yaml.safe_load(f)
+        self.assertEqual(report['roles']['clients'], ['client1', 'client2'])
+        self.assertEqual(sorted(report['hosts']), ['client1', 'client2', 'head1', 'osd1'])
+        self.assertEqual(report['hosts']['osd1']['ceph']['version'], '10.2.0')
+        # the simulated collectl prints nothing
+        self.assertEqual(report['hosts']['osd1']['collectl'], None)
+
+        self.assertEqual(capabilities.min_major('cbt@client1,cbt@client2', 'rados'), 10)
+        self.assertEqual(capabilities.min_major('cbt@client1', 'collectl'), None)
+        self.assertTrue(capabilities.has_feature('cbt@client1,cbt@client2', 'fio', 'rbd'))
+        self.assertFalse(capabilities.has_feature('cbt@client1', 'fio', 'libaio'))
+
+    def test_probed_once(self):
+        capabilities.probe('cbt@client1')
+        capabilities._hosts['client1']['rados']['major'] = 0
+        self.assertEqual(capabilities.min_major('cbt@client1,cbt@client2', 'rados'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import settings
+import transport
+from cluster.ceph import Ceph
+
+CEPH = ('echo "$*" >> $CBT_SIM_ROOT/../ceph.log; '
+        'case "$*" in *health*) echo HEALTH_OK;; esac')
+
+
+class TestPools(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        self.root = tempfile.mkdtemp()
+        settings.cluster = {'transport': 'simulated', 'tmp_dir': '/tmp/cbt', 'head': 'head1',
+                            'osds': ['osd1'], 'use_existing': True, 'pool_batch': 3,
+                            'pool_profiles': {'rbd': {'pg_size': 64, 'pgp_size': 64, 'replication': 2,
+                                                      'cache_profile': 'cache'},
+                                              'cache': {'pg_size': 8, 'pgp_size': 8, 'cache_mode': 'writeback'}},
+                            'simulation': {'root': self.root, 'commands': {'ceph': CEPH}}}
+
+    def tearDown(self):
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.root)
+
+    def log(self):
+        with open(os.path.join(self.root, 'hosts', 'ceph.log')) as f:
+            return [line.split(' ', 2)[2].strip() for line in f]
+
+    def test_mkpools(self):
+        names = ['p%d' % i for i in range(7)]
+        Ceph(settings.cluster).mkpools(names, 'rbd')
+        log = self.log()
+        for name in names:
+            self.assertIn('osd pool set %s size 2' % name, log)
+            self.assertIn('osd tier add %s %s-cache' % (name, name), log)
+            self.assertIn('osd pool create %s-cache 8 8' % name, log)
+        # once after creating and once after the settings, for the pools and their caches
+        self.assertEqual(len([line for line in log if line == 'health']), 4)
+
+    def test_rmpools(self):
+        names = ['p%d' % i for i in range(4)]
+        Ceph(settings.cluster).rmpools(names, 'rbd')
+        log = self.log()
+        deletes = [line for line in log if 'pool delete' in line]
+        self.assertEqual(len(deletes), 8)
+        # the cache pools go first
+        self.assertTrue(all('-cache' in line for line in deletes[:4]))
+        self.assertIn('osd tier remove p3 p3-cache', log)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import collector
+import settings
+import transport
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {}
+        self.remote = tempfile.mkdtemp()
+        self.local = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.remote, 'collectl'))
+        self.write('output.0', 'rados bench output')
+        self.write('collectl/a.raw.gz', 'x' * 10000)
+        self.collector = collector.Collector('a,user@b', trans=transport.LocalTransport({}))
+
+    def tearDown(self):
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.remote)
+        shutil.rmtree(self.local)
+
+    def write(self, name, data):
+        with open(os.path.join(self.remote, name), 'w') as f:
+            f.write(data)
+
+    def read(self, name):
+        with open(os.path.join(self.local, name)) as f:
+            return f.read()
+
+    def test_layout(self):
+        stats = self.collector.collect('%s/*' % self.remote, self.local)
+        self.assertEqual(stats['a']['transferred'], 2)
+        self.assertEqual(stats['b']['transferred'], 2)
+        for host in ['a', 'b']:
+            self.assertEqual(self.read('output.0.%s' % host), 'rados bench output')
+            self.assertEqual(self.read('collectl.%s/a.raw.gz' % host), 'x' * 10000)
+
+    def test_incremental(self):
+        self.collector.collect('%s/*' % self.remote, self.local)
+        stats = self.collector.collect('%s/*' % self.remote, self.local)
+        self.assertEqual(stats['a']['transferred'], 0)
+
+        # make sure the mtime changes even on coarse grained filesystems
+        time.sleep(0.01)
+        self.write('output.0', 'changed')
+        os.utime(os.path.join(self.remote, 'output.0'), (time.time() + 5, time.time() + 5))
+        stats = self.collector.collect('%s/*' % self.remote, self.local)
+        self.assertEqual(stats['a']['transferred'], 1)
+        self.assertEqual(self.read('output.0.a'), 'changed')
+
+    def test_hash(self):
+        self.collector.use_hash = True
+        self.collector.collect('%s/*' % self.remote, self.local)
+        manifest = self.collector.remote_manifest('a', '%s/*' % self.remote)
+        digests = [entry[3] for entry in manifest.values()]
+        self.assertTrue(all(len(digest) == 32 for digest in digests))
+
+    def test_missing_glob(self):
+        stats = self.collector.collect('%s/nothing*' % self.remote, self.local)
+        self.assertEqual(stats['a']['files'], 0)
+
+    def test_skips_manifest(self):
+        # left by an earlier collection into the remote directory
+        self.write('collectl/%s' % collector.MANIFEST, '{}')
+        stats = self.collector.collect('%s/*' % self.remote, self.local)
+        self.assertFalse(os.path.exists(os.path.join(self.local, 'collectl.a', collector.MANIFEST)))
+        self.assertEqual(stats['a']['files'], 2)
+
+    def test_pull_stderr(self):
+        # tar complains about every missing file on stderr, more than a pipe holds
+        paths = ['%s/missing-%05d' % (self.remote, i) for i in range(5000)]
+        self.assertRaises(Exception, self.collector.pull, 'a', paths, {})
+
+    def test_rate_limiter(self):
+        limiter = collector.RateLimiter(100000)
+        start = time.time()
+        for i in range(3):
+            limiter.consume(50000)
+        self.assertTrue(time.time() - start >= 0.4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+import confidence
+import statistic
+
+
+class FakeBenchmark(object):
+    def __init__(self, result, **config):
+        self.result = result
+        self.config = config
+
+    def getclass(self):
+        return 'Fake'
+
+    def summary(self):
+        if self.result is None:
+            return None
+        return {'throughput': self.result, 'latency': 1.0}
+
+
+class TestDataProperty(unittest.TestCase):
+    def test_data_property(self):
+        prop = statistic.data_property([1, 2, 3, 4])
+        self.assertEqual(prop.average, 2.5)
+        self.assertEqual(prop.mediana, 2.5)
+        self.assertEqual((prop.min, prop.max), (1, 4))
+        self.assertTrue(prop.confidence > 0)
+        self.assertEqual(statistic.round_3_digit(123.456), 123)
+
+
+class TestConfidenceTracker(unittest.TestCase):
+    def test_converges(self):
+        tracker = confidence.ConfidenceTracker(0.05, min_iterations=3)
+        stable = [100.0, 101.0, 100.5]
+        noisy = [100.0, 150.0, 60.0]
+        for i in range(3):
+            self.assertFalse(tracker.converged(FakeBenchmark(None, iteration=i, name='stable')))
+            tracker.add(FakeBenchmark(stable[i], iteration=i, name='stable'))
+            tracker.add(FakeBenchmark(noisy[i], iteration=i, name='noisy'))
+            tracker.add(FakeBenchmark(None, iteration=i, name='unknown'))
+        self.assertTrue(tracker.converged(FakeBenchmark(None, iteration=3, name='stable')))
+        self.assertFalse(tracker.converged(FakeBenchmark(None, iteration=3, name='noisy')))
+        self.assertFalse(tracker.converged(FakeBenchmark(None, iteration=3, name='unknown')))
+
+    def test_write(self):
+        tracker = confidence.get_tracker({'confidence': {'target': 0.1, 'min_iterations': 2}})
+        for i, result in enumerate([10.0, 10.1]):
+            tracker.add(FakeBenchmark(result, iteration=i, name='a'))
+        archive = tempfile.mkdtemp()
+        try:
+            tracker.write(archive)
+            with open('%s/confidence.yaml' % archive) as f:
+                report = yaml.safe_load(f)
+        finally:
+            shutil.rmtree(archive)
+        test, = report['tests']
+        self.assertEqual(test['config'], {'name': 'a'})
+        self.assertEqual(test['iterations'], 2)
+        self.assertAlmostEqual(test['mean'], 10.05)
+        self.assertTrue(test['converged'])
+
+    def test_disabled(self):
+        self.assertEqual(confidence.get_tracker({}), None)
+
+    def test_t_table(self):
+        tracker = confidence.ConfidenceTracker(0.05, level=0.95)
+        mean, half_width, relative = tracker.interval([10.0, 12.0, 14.0])
+        # sem = 2 / sqrt(3), t(0.95, 2) = 4.303
+        self.assertAlmostEqual(mean, 12.0)
+        self.assertAlmostEqual(half_width, 4.303 * 2 / 3 ** 0.5, places=2)
+        self.assertEqual(statistic.t_value(0.99, 100, statistic.T_TABLE), 2.750)
+        self.assertEqual(tracker.interval([10.0]), (10.0, None, None))
+
+    @unittest.skipUnless(statistic.no_numpy, 'scipy is installed')
+    def test_level_needs_scipy(self):
+        self.assertRaises(ValueError, confidence.ConfidenceTracker, 0.05, level=0.8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import subprocess
+import time
+import unittest
+
+import executor
+import transport
+
+
+class MergedTransport(transport.LocalTransport):
+    """Runs the command once per host in one shell, with pdsh's merged "host: " output."""
+    multi_host = True
+
+    def popen(self, nodes, command, continue_if_error=True):
+        hosts = ' '.join(transport.hostname(node) for node in transport.split_nodes(nodes))
+        script = ('for h in %s; do { { CBT_HOST=$h sh -c "$0" 2>&1 1>&3 | sed -u "s/^/$h: /" >&2; } 3>&1 '
+                  '| sed -u "s/^/$h: /"; } & done; wait' % hosts)
+        args = ['sh', '-c', script, command]
+        return args, subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = executor.Executor(max_workers=4, max_per_host=1,
+                                          trans=transport.LocalTransport({}))
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_results_per_host(self):
+        cmds = self.executor.fanout('a,user@b', 'echo $CBT_HOST; test $CBT_HOST = a')
+        done, not_done = executor.wait(cmds)
+        self.assertEqual(len(done), 2)
+        self.assertEqual(not_done, [])
+        results = dict((cmd.host, cmd.result()) for cmd in cmds)
+        self.assertEqual(results['a'].returncode, 0)
+        self.assertEqual(results['a'].stdout, 'a\n')
+        self.assertEqual(results['b'].returncode, 1)
+        self.assertTrue(results['b'].duration >= 0)
+
+    def test_per_host_limit(self):
+        start = time.time()
+        cmds = [self.executor.submit('a', 'sleep 0.2') for i in range(3)]
+        executor.wait(cmds)
+        self.assertTrue(time.time() - start >= 0.6)
+        ends = sorted(cmd.result().end for cmd in cmds)
+        starts = sorted(cmd.result().start for cmd in cmds)
+        self.assertTrue(starts[1] >= ends[0])
+
+    def test_unthrottled(self):
+        start = time.time()
+        cmds = self.executor.fanout('a,b,c', 'sleep 0.3', throttle=False)
+        executor.wait(cmds)
+        self.assertTrue(time.time() - start < 0.8)
+
+    def test_launch_holds_slot(self):
+        workload = self.executor.submit('a', 'sleep 0.3', throttle=False)
+        queued = self.executor.submit('a', 'true')
+        executor.wait([queued])
+        self.assertTrue(queued.result().start >= workload.result().end)
+        # workloads beyond max_per_host still run concurrently
+        start = time.time()
+        cmds = [self.executor.submit('a', 'sleep 0.3', throttle=False) for i in range(3)]
+        executor.wait(cmds)
+        self.assertTrue(time.time() - start < 0.8)
+
+    def test_pdsh_launch(self):
+        ex = executor.Executor(max_workers=4, max_per_host=1, trans=MergedTransport({}))
+        cmds = ex.fanout('a,user@b', 'echo out $CBT_HOST; echo err >&2; test $CBT_HOST = a || exec sleep 5',
+                         throttle=False)
+        done, not_done = executor.wait(cmds, timeout=1, kill=True)
+        self.assertEqual([cmd.host for cmd in done], ['a'])
+        self.assertEqual(cmds[0].result().returncode, 0)
+        self.assertEqual(cmds[0].result().stdout, 'out a\n')
+        self.assertEqual(cmds[0].result().stderr, 'err\n')
+        self.assertEqual(cmds[1].result().stdout, 'out b\n')
+        self.assertNotEqual(cmds[1].result().returncode, 0)
+        self.assertEqual(ex.running['a'] + ex.running['b'], 0)
+        # pdsh cannot tell two commands of a host apart, they run on their own
+        cmds = ex.fanout('a,a', 'echo $CBT_HOST', throttle=False)
+        executor.wait(cmds)
+        self.assertEqual([cmd.result().stdout for cmd in cmds], ['a\n', 'a\n'])
+        self.assertRaises(ValueError, executor.PdshLaunch, cmds, ex._release)
+        ex.shutdown()
+
+    def test_timeout_and_kill(self):
+        cmd = self.executor.submit('a', 'exec sleep 5')
+        done, not_done = executor.wait([cmd], timeout=0.2)
+        self.assertEqual(not_done, [cmd])
+        cmd.kill()
+        self.assertTrue(cmd.wait(5))
+        self.assertNotEqual(cmd.result().returncode, 0)
+
+    def test_timeout_from_start(self):
+        # the second command is queued behind the first on the same host
+        cmds = [self.executor.submit('a', 'sleep 0.3') for i in range(2)]
+        done, not_done = executor.wait(cmds, timeout=0.5)
+        self.assertEqual(not_done, [])
+
+    def test_timeout_kill_late(self):
+        fast = self.executor.submit('a', 'true', throttle=False)
+        slow = self.executor.submit('b', 'exec sleep 5', throttle=False)
+        start = time.time()
+        done, not_done = executor.wait([slow, fast], timeout=0.3, kill=True)
+        self.assertTrue(time.time() - start < 3)
+        self.assertEqual(done, [fast])
+        self.assertEqual(not_done, [slow])
+        self.assertTrue(slow.done())
+        self.assertNotEqual(slow.result().returncode, 0)
+
+if __name__ == '__main__':
+    unittest.main()
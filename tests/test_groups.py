@@ -0,0 +1,106 @@
+import collections
+import threading
+import unittest
+
+import groups
+import settings
+from benchmark.benchmark import Benchmark
+from benchmark.librbdfio import LibrbdFio
+from benchmark.radosbench import Radosbench
+from cluster.ceph import Ceph
+
+
+class TestBarrier(unittest.TestCase):
+    def test_released_when_all_arrive(self):
+        barrier = groups.Barrier(3)
+        passed = []
+
+        def party(name):
+            barrier.wait()
+            passed.append(name)
+
+        threads = [threading.Thread(target=party, args=(name,)) for name in 'ab']
+        for thread in threads:
+            thread.start()
+        threads[0].join(0.2)
+        self.assertEqual(passed, [])
+        # the third party failed before reaching the barrier
+        barrier.leave()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(passed), ['a', 'b'])
+        # the gate stays open
+        barrier.wait()
+
+    def test_phases(self):
+        settings_cluster = settings.cluster
+        settings.cluster = {'archive_dir': '/tmp/archive', 'tmp_dir': '/tmp/cbt'}
+        try:
+            benchmarks = [Benchmark(None, {'iteration': 0}) for i in range(2)]
+        finally:
+            settings.cluster = settings_cluster
+        barrier = groups.Barrier(2)
+        events = []
+        for b in benchmarks:
+            b.barrier = barrier
+
+        def party(b, name, phases):
+            for phase in range(phases):
+                b.sync_start()
+                events.append((phase, name))
+            barrier.leave()
+
+        # a waits for b at its first phase
+        a = threading.Thread(target=party, args=(benchmarks[0], 'a', 3))
+        a.start()
+        a.join(0.2)
+        self.assertEqual(events, [])
+        b = threading.Thread(target=party, args=(benchmarks[1], 'b', 2))
+        b.start()
+        for thread in (a, b):
+            thread.join(5)
+        # every phase starts together, the third of a once b left
+        self.assertEqual(sorted(events[:2]), [(0, 'a'), (0, 'b')])
+        self.assertEqual(sorted(events[2:4]), [(1, 'a'), (1, 'b')])
+        self.assertEqual(events[4], (2, 'a'))
+
+
+class TestRounds(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'clients': ['c1', 'c2', 'c3'], 'tmp_dir': '/tmp/cbt', 'archive_dir': '/tmp/archive',
+                            'client_groups': {'a': ['c1'], 'b': ['c2', 'c3'], 'ab': ['c1', 'c2'],
+                                              'x': ['elsewhere']}}
+
+    def tearDown(self):
+        settings.cluster = self.old_cluster
+
+    def test_rounds(self):
+        grouped = collections.OrderedDict([('a', [1, 2, 3]), ('b', [4])])
+        self.assertEqual(list(groups.rounds(grouped)), [[1, 4], [2], [3]])
+
+    def test_check_disjoint(self):
+        groups.check_disjoint(['a', 'b'])
+        self.assertRaises(ValueError, groups.check_disjoint, ['a', 'ab'])
+        self.assertRaises(ValueError, groups.check_disjoint, ['x'])
+
+    def mkbenchmark(self, cls, group, **config):
+        config.update({'iteration': 0, 'client_group': group})
+        config.setdefault('osd_ra', 128)
+        return cls(Ceph(settings.cluster), config)
+
+    def test_same_benchmark(self):
+        for cls in (Radosbench, LibrbdFio):
+            a, b = self.mkbenchmark(cls, 'a'), self.mkbenchmark(cls, 'b')
+            self.assertNotEqual(a.pools(), b.pools())
+            groups.check_round([a, b])
+        self.assertEqual(self.mkbenchmark(Radosbench, 'a').pools(), ['rados-bench-cbt-a'])
+
+    def test_check_round(self):
+        shared = [self.mkbenchmark(Radosbench, group, target_pool='mine') for group in 'ab']
+        self.assertRaises(ValueError, groups.check_round, shared)
+        read_ahead = [self.mkbenchmark(LibrbdFio, 'a'), self.mkbenchmark(Radosbench, 'b', osd_ra=4096)]
+        self.assertRaises(ValueError, groups.check_round, read_ahead)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import idle
+import settings
+import transport
+from cluster.ceph import Ceph
+
+DISKSTATS = '   8       0 sda 100 0 800 50 200 0 1600 70 0 %d 120'
+
+
+class TestIdle(unittest.TestCase):
+    def test_client_io(self):
+        status = json.dumps({'pgmap': {'read_bytes_sec': 1048576, 'write_bytes_sec': 2097152,
+                                       'write_op_per_sec': 40, 'recovering_bytes_per_sec': 524288}})
+        self.assertEqual(idle.client_io(status), (3.0, 40, 0.5))
+        self.assertEqual(idle.client_io('{"pgmap": {}}'), (0.0, 0, 0.0))
+        self.assertRaises(ValueError, idle.client_io, 'HEALTH_OK')
+
+    def test_disk_util(self):
+        prev = idle.io_ticks([('osd1', DISKSTATS % 1000), ('osd1', DISKSTATS.replace('sda', 'loop0') % 0)])
+        self.assertEqual(prev, {('osd1', 'sda'): 1000})
+        cur = idle.io_ticks([('osd1', DISKSTATS % 1500), ('osd2', DISKSTATS % 0)])
+        self.assertEqual(idle.disk_util(prev, cur, 2.0), 25.0)
+        self.assertEqual(idle.disk_util({}, cur, 2.0), 0.0)
+
+    def test_detector(self):
+        detector = idle.IdleDetector(quiet=10, timeout=30, max_disk_util=5)
+        self.assertFalse(detector.sample((0, 0, 0), None, now=0))
+        self.assertFalse(detector.sample((5, 0, 0), 1, now=5))
+        self.assertFalse(detector.sample((0, 0, 0), 1, now=10))
+        self.assertTrue(detector.sample((0, 0, 0), 1, now=20))
+        self.assertEqual(detector.samples[1]['busy'], ['client IO 5.0 MB/s'])
+
+    def test_detector_timeout(self):
+        detector = idle.IdleDetector(quiet=10, timeout=30)
+        detector.sample((0, 0, 0), 50, now=0)
+        self.assertRaises(idle.ClusterBusy, detector.sample, (0, 0, 0), 50, now=30)
+
+
+class TestWaitIdle(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'transport': 'simulated', 'tmp_dir': '/tmp/cbt', 'head': 'head1',
+                            'osds': ['osd1'], 'use_existing': True}
+
+    def tearDown(self):
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+
+    def test_wait_idle(self):
+        detector = idle.IdleDetector(quiet=0.1, timeout=5, interval=0.05, max_disk_util=1000)
+        Ceph(settings.cluster).wait_idle(detector)
+        self.assertEqual(detector.samples[-1]['io'], (0.0, 0, 0.0))
+
+    def test_busy_stops_monitoring(self):
+        tmp = tempfile.mkdtemp()
+        log = os.path.join(tmp, 'pkill.log')
+        settings.cluster.update({'clients': ['client1'], 'idle': {'timeout': 1},
+                                 'simulation': {'root': os.path.join(tmp, 'sim'),
+                                                'commands': {'pkill': 'echo "$*" >> %s' % log}}})
+        ceph = Ceph(settings.cluster)
+
+        def wait_idle(detector):
+            raise idle.ClusterBusy('busy')
+        ceph.wait_idle = wait_idle
+        try:
+            self.assertRaises(idle.ClusterBusy, ceph.idle_monitoring)
+            with open(log) as f:
+                self.assertIn('collectl', f.read())
+        finally:
+            shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import ledger
+import settings
+
+
+class FakeBenchmark(object):
+    def __init__(self, out_dir, **config):
+        self.out_dir = out_dir
+        self.config = config
+
+    def getclass(self):
+        return 'Fake'
+
+    def exists(self):
+        return os.path.exists(self.out_dir)
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        self.archive = tempfile.mkdtemp()
+        settings.cluster = {'archive_dir': self.archive, 'tmp_dir': '/tmp/cbt.1', 'clients': ['a']}
+        self.ledger = ledger.open_ledger()
+
+    def tearDown(self):
+        self.ledger.close()
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.archive)
+
+    def out_dir(self, name):
+        return os.path.join(self.archive, name)
+
+    def test_key(self):
+        key = ledger.test_key({'iteration': 0, 'time': 10})
+        settings.cluster = dict(settings.cluster, tmp_dir='/tmp/cbt.2', iterations=5)
+        self.assertEqual(ledger.test_key({'time': 10, 'iteration': 0}), key)
+        self.assertNotEqual(ledger.test_key({'time': 10, 'iteration': 1}), key)
+        # harness settings do not matter
+        settings.cluster = dict(settings.cluster, transport='ssh', sync_method='rpdcp', pool_batch=2,
+                                steady_state={'window': 5}, deadline_grace=10)
+        self.assertEqual(ledger.test_key({'time': 10, 'iteration': 0}), key)
+        settings.cluster = dict(settings.cluster, clients=['b'])
+        self.assertNotEqual(ledger.test_key({'time': 10, 'iteration': 0}), key)
+
+    def test_states(self):
+        b = FakeBenchmark(self.out_dir('t'), iteration=0, time=10)
+        self.assertFalse(self.ledger.skip(b))
+        self.assertEqual(self.ledger.state(b), ledger.PLANNED)
+        self.ledger.start(b)
+        os.makedirs(b.out_dir)
+        self.ledger.synced(b)
+        self.ledger.done(b)
+        entry = self.ledger.record(b)
+        self.assertEqual(entry['state'], ledger.DONE)
+        self.assertEqual(entry['attempts'], 1)
+        self.assertTrue(entry['started'] <= entry['synced'] <= entry['finished'])
+        self.assertTrue(self.ledger.skip(FakeBenchmark(b.out_dir, iteration=0, time=10)))
+
+    def test_resume_interrupted(self):
+        b = FakeBenchmark(self.out_dir('t'), iteration=0)
+        self.ledger.skip(b)
+        self.ledger.start(b)
+        os.makedirs(b.out_dir)
+        # the run is interrupted here, a new run retries the test
+        self.ledger.close()
+        self.ledger = ledger.open_ledger()
+        b = FakeBenchmark(b.out_dir, iteration=0)
+        self.assertFalse(self.ledger.skip(b))
+        self.assertFalse(os.path.exists(b.out_dir))
+        self.assertTrue(os.path.exists(b.out_dir + '.incomplete'))
+        self.ledger.start(b)
+        self.ledger.failed(b, RuntimeError('boom'))
+        entry = self.ledger.record(b)
+        self.assertEqual((entry['state'], entry['attempts'], entry['error']), (ledger.FAILED, 2, 'boom'))
+
+    def test_collision(self):
+        first = FakeBenchmark(self.out_dir('t'), iteration=0, hidden=1)
+        self.ledger.skip(first)
+        self.ledger.start(first)
+        os.makedirs(first.out_dir)
+        self.ledger.synced(first)
+        other = FakeBenchmark(first.out_dir, iteration=0, hidden=2)
+        self.assertRaises(ledger.OutDirCollision, self.ledger.skip, other)
+        self.assertEqual(self.ledger.state(other), None)
+
+    def test_disabled(self):
+        settings.cluster = dict(settings.cluster, ledger=False)
+        self.assertTrue(isinstance(ledger.open_ledger(), ledger.NullLedger))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import objectsets
+import settings
+import transport
+from cluster.ceph import Ceph
+
+# whole words only, the paths include the random simulation root
+RADOS = ('case " $* " in *" -v "*) echo "ceph version 10.2.0";; '
+         '*" df "*) echo \'{"pools": [{"name": "rados-bench-cbt", "num_objects": 40}]}\';; '
+         '*" stat gone-"*) exit 2;; esac')
+KEY = objectsets.set_key('default', 4194304, '', 10)
+
+
+class TestObjectSets(unittest.TestCase):
+    def setUp(self):
+        # a transport left by another test would lack the rados stub
+        transport.close_transport()
+        self.old_cluster = settings.cluster
+        self.archive_dir = tempfile.mkdtemp()
+        settings.cluster = {'transport': 'simulated', 'tmp_dir': '/tmp/cbt', 'head': 'head1',
+                            'archive_dir': self.archive_dir, 'use_existing': True,
+                            'simulation': {'commands': {'rados': RADOS}}}
+        objectsets.reset()
+        self.cluster = Ceph(settings.cluster)
+
+    def tearDown(self):
+        objectsets.reset()
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.archive_dir)
+
+    def test_object_counts(self):
+        self.assertEqual(objectsets.object_counts('{"pools": [{"name": "a", "num_objects": 3}]}'), {'a': 3})
+        self.assertEqual(objectsets.object_counts('garbage'), {})
+        self.assertEqual(objectsets.count_objects(self.cluster, ['rados-bench-cbt', 'x']),
+                         {'rados-bench-cbt': 40, 'x': None})
+
+    def test_record_persists(self):
+        objectsets.record('rados-bench-cbt', KEY, ['c2-0', 'c1-0'], 40)
+        objectsets.reset()
+        self.assertEqual(objectsets.lookup('rados-bench-cbt'),
+                         {'key': KEY, 'run_names': ['c1-0', 'c2-0'], 'num_objects': 40})
+        with open(os.path.join(self.archive_dir, objectsets.FILENAME)) as f:
+            self.assertIn('rados-bench-cbt', json.load(f))
+        objectsets.forget(['rados-bench-cbt'])
+        self.assertEqual(objectsets.lookup('rados-bench-cbt'), None)
+
+    def test_usable(self):
+        objectsets.record('rados-bench-cbt', KEY, ['c1-0', 'c1-1', 'c2-0', 'c2-1'], 40)
+        self.assertTrue(objectsets.usable(self.cluster, KEY, {'rados-bench-cbt': ['c1-0', 'c2-0']}))
+        # fewer processes read, but not more
+        self.assertFalse(objectsets.usable(self.cluster, KEY, {'rados-bench-cbt': ['c1-0', 'c1-2']}))
+        self.assertFalse(objectsets.usable(self.cluster, objectsets.set_key('default', 4096, '', 10),
+                                           {'rados-bench-cbt': ['c1-0']}))
+        self.assertFalse(objectsets.usable(self.cluster, KEY, {'other': ['c1-0']}))
+
+    def test_validation(self):
+        objectsets.record('rados-bench-cbt', KEY, ['c1-0'], 41)
+        self.assertFalse(objectsets.usable(self.cluster, KEY, {'rados-bench-cbt': ['c1-0']}))
+        objectsets.record('rados-bench-cbt', KEY, ['gone-0'], 40)
+        self.assertFalse(objectsets.usable(self.cluster, KEY, {'rados-bench-cbt': ['gone-0']}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import ledger
+import planner
+import settings
+import transport
+from cluster.ceph import Ceph
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.old = settings.cluster, settings.benchmarks
+        self.archive = tempfile.mkdtemp()
+        settings.cluster = {'clients': ['c1', 'c2'], 'iterations': 1, 'archive_dir': self.archive,
+                            'tmp_dir': '/tmp/cbt', 'plan_costs': {'pool_create': 0}}
+        settings.benchmarks = {'radosbench': {'time': 100, 'osd_ra': 128,
+                                              'concurrent_ops': [16, 32],
+                                              'pool_profile': ['a', 'b']}}
+
+    def tearDown(self):
+        settings.cluster, settings.benchmarks = self.old
+        shutil.rmtree(self.archive)
+
+    def test_plan(self):
+        p = planner.Planner(Ceph(settings.cluster))
+        tests = p.plan()
+        self.assertEqual(len(tests), 4)
+        self.assertEqual(len([t for t in tests if t['skip'] == 'duplicate']), 2)
+        self.assertEqual(len(p.errors), 2)
+        self.assertIn('pool_profile', p.errors[0])
+        benchmarks, total = p.summary()
+        phases = benchmarks['radosbench']['phases']
+        self.assertEqual(phases['measure'], 2 * 2 * 100)
+        self.assertEqual(phases['idle_monitoring'], 60)
+        self.assertEqual(phases['pool_create'], 0)
+        self.assertEqual(total, sum(phases.values()))
+
+    def test_collision(self):
+        settings.benchmarks['radosbench']['pool_profile'] = 'a'
+        out_dir = planner.Planner(Ceph(settings.cluster)).plan()[0]['out_dir']
+        # an earlier run of a different config wrote the same out_dir
+        other = type('Other', (object,), {'out_dir': out_dir, 'config': {'iteration': 0, 'time': 200},
+                                          'getclass': lambda self: 'Radosbench',
+                                          'exists': lambda self: os.path.exists(out_dir)})()
+        tests = ledger.open_ledger()
+        tests.skip(other)
+        tests.start(other)
+        os.makedirs(out_dir)
+        tests.synced(other)
+        tests.close()
+        p = planner.Planner(Ceph(settings.cluster))
+        self.assertEqual([t['skip'] for t in p.plan()], ['collision', None])
+        self.assertEqual(len(p.errors), 1)
+        self.assertIn(out_dir, p.errors[0])
+
+    def test_no_remote_commands(self):
+        sim_root = os.path.join(self.archive, 'sim')
+        settings.cluster.update({'transport': 'simulated', 'simulation': {'root': sim_root}})
+        settings.benchmarks['radosbench']['valgrind'] = 'memcheck'
+        try:
+            planner.Planner(Ceph(settings.cluster)).plan()
+        finally:
+            transport.close_transport()
+        # the simulated hosts get a directory once a command reaches them
+        self.assertFalse(os.path.exists(os.path.join(sim_root, 'hosts')))
+
+    def test_format_duration(self):
+        self.assertEqual(planner.format_duration(3725), '01:02:05')
+        self.assertEqual(planner.format_duration(90000), '1d 01:00:00')
+
+if __name__ == '__main__':
+    unittest.main()
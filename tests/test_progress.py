@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import progress
+
+RADOS = '%5d %7d %9d %9d %9.3f %9d %10.6f %10.6f'
+
+
+def fio_status(runtime, io_bytes, ios, lat_ns):
+    """Lines of a fio JSON status document with a reading job."""
+    job = {'jobname': 'librbdfio-a-0', 'groupid': 0, 'job_runtime': runtime,
+           'read': {'io_bytes': io_bytes, 'total_ios': ios, 'lat_ns': {'mean': lat_ns}}}
+    return json.dumps({'fio version': 'fio-3.1', 'jobs': [job]}, indent=2).splitlines()
+
+
+class TestParsers(unittest.TestCase):
+    def test_rados_bench(self):
+        line = '    5      16       233       217   173.585       176   0.310866    0.354212'
+        sample = progress.parse_rados_bench(None, line)
+        self.assertEqual(sample['t'], 5)
+        self.assertEqual(sample['ops_total'], 217)
+        self.assertEqual(sample['mbps'], 176.0)
+        self.assertAlmostEqual(sample['lat_ms'], 310.866)
+        self.assertEqual(progress.parse_rados_bench(None, '  sec Cur ops   started  finished  avg MB/s'), None)
+
+    def test_fio_logs(self):
+        self.assertEqual(progress.parse_fio_log('output.0_bw.1.log', '1000, 2048, 0, 4096'), {'t': 1.0, 'mbps': 2.0})
+        self.assertEqual(progress.parse_fio_log('output.0_iops.1.log', '1000, 500, 0, 4096'), {'t': 1.0, 'iops': 500})
+        self.assertEqual(progress.parse_fio_log('output.0_lat.1.log', '1000, 1500, 0, 4096', 2),
+                         {'t': 1.0, 'lat_ms': 1.5})
+        self.assertEqual(progress.parse_fio_log('output.0_lat.1.log', '1000, 1500000, 0, 4096'),
+                         {'t': 1.0, 'lat_ms': 1.5})
+        self.assertEqual(progress.parse_fio_log('output.0_clat.1.log', 'garbage'), None)
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.out_dir, 'live.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_sums_clients(self):
+        p = progress.Progress(progress.parse_rados_bench, self.out_file)
+        p.feed('a', 'output.0', RADOS % (1, 16, 10, 10, 10, 10, 0.1, 0.1))
+        p.feed('b', 'output.0', RADOS % (1, 16, 20, 20, 20, 20, 0.3, 0.3))
+        for t in range(2, 4):
+            p.feed('a', 'output.0', RADOS % (t, 16, t * 10, t * 10, 10, 10, 0.1, 0.1))
+        # nothing is reported before b has caught up
+        self.assertEqual(p.lines, [])
+        for t in range(2, 4):
+            p.feed('b', 'output.0', RADOS % (t, 16, t * 20, t * 20, 20, 20, 0.3, 0.3))
+        self.assertEqual([e['second'] for e in p.lines], [1, 2])
+        p.close()
+        self.assertEqual([e['second'] for e in p.lines], [1, 2, 3])
+        self.assertEqual(p.lines[1]['mbps'], 30)
+        self.assertEqual(p.lines[1]['iops'], 30)
+        self.assertAlmostEqual(p.lines[1]['lat_ms'], 200)
+        with open(self.out_file) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(entries, p.lines)
+
+    def test_fio_files(self):
+        p = progress.Progress(progress.parse_fio_log)
+        for t in range(1, 3):
+            p.feed('a', 'output.0_bw.1.log', '%d, %d, 0, 4096' % (t * 1000, 1024))
+            p.feed('a', 'output.0_iops.1.log', '%d, 256, 0, 4096' % (t * 1000))
+        p.close()
+        self.assertEqual(p.lines, [{'second': 1, 'mbps': 1.0, 'iops': 256.0},
+                                   {'second': 2, 'mbps': 1.0, 'iops': 256.0}])
+
+    def test_fio_status(self):
+        p = progress.FioStatus(progress.parse_fio_status)
+        for host, scale in (('a', 1), ('b', 2)):
+            p.feed(host, 'output.0', 'fio: some warning')
+            for line in fio_status(1000, scale * 1048576, scale * 256, 2000000):
+                p.feed(host, 'output.0', line)
+        # the totals since the previous document, b reads slower now
+        for host in ('a', 'b'):
+            for line in fio_status(2000, 3 * 1048576, 3 * 256, 3000000 if host == 'a' else 2000000):
+                p.feed(host, 'output.0', line)
+        p.close()
+        self.assertEqual([e['second'] for e in p.lines], [1, 2])
+        self.assertEqual((p.lines[0]['mbps'], p.lines[0]['iops'], p.lines[0]['lat_ms']), (3.0, 768.0, 2.0))
+        self.assertEqual((p.lines[1]['mbps'], p.lines[1]['iops']), (3.0, 768.0))
+        # a: 512 ios at 3.5 ms after 256 at 2 ms, b: 256 at 2 ms
+        self.assertAlmostEqual(p.lines[1]['lat_ms'], (3.5 + 2.0) / 2)
+
+if __name__ == '__main__':
+    unittest.main()
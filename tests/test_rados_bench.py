@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from parsing import rados_bench
+
+HEADER = '  sec Cur ops   started  finished  avg MB/s  cur MB/s last lat(s)  avg lat(s)\n'
+ROW = '%5d %7d %9d %9d %9.4g %9.4g %11s %11.6f\n'
+SUMMARY = """Total time run:         %d
+Total writes made:      %d
+Write size:             4194304
+Object size:            4194304
+Bandwidth (MB/sec):     %s
+Stddev Bandwidth:       1
+Average IOPS:           %d
+Stddev IOPS:            0
+Average Latency(s):     0.5
+Stddev Latency(s):      0.01
+Max latency(s):         %s
+Min latency(s):         0.1
+"""
+
+
+def output(seconds, ops_per_sec, started_at=None, max_lat='0.9'):
+    """rados bench output of a process finishing ops_per_sec 4MB ops every second."""
+    text = 'Maintaining 16 concurrent writes of 4194304 bytes\n' + HEADER
+    for sec in range(seconds + 1):
+        if started_at is not None and sec and sec % 20 == 0:
+            text += '2019-05-20 10:00:%02d.500000 min lat: 0.1 max lat: 0.9 avg lat: 0.5\n' % (started_at + sec)
+            text += HEADER
+        last = '-' if sec == 0 else '0.5'
+        text += ROW % (sec, 16, sec * ops_per_sec, sec * ops_per_sec, ops_per_sec * 4, ops_per_sec * 4 if sec else 0,
+                       last, 0.5 if sec else 0)
+    ops = seconds * ops_per_sec
+    return text + SUMMARY % (seconds, ops, ops_per_sec * 4, ops_per_sec, max_lat)
+
+
+class TestParse(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def write_output(self, name, text):
+        with open(os.path.join(self.out_dir, 'output.%s' % name), 'w') as f:
+            f.write(text)
+        return os.path.join(self.out_dir, 'output.%s' % name)
+
+    def test_parse(self):
+        run = rados_bench.parse(self.write_output('0.client1', output(25, 10, started_at=0)))
+        self.assertEqual(list(run['seconds']), range(26))
+        self.assertEqual(run['cur_mbps'][5], 40)
+        self.assertTrue(numpy.isnan(run['last_lat_ms'][0]))
+        self.assertEqual(run['last_lat_ms'][1], 500)
+        self.assertEqual(run['start'] % 60, 0.5)
+        self.assertEqual(run['summary']['bandwidth_mbps'], 40)
+        self.assertEqual(run['summary']['iops'], 10)
+        self.assertEqual(run['summary']['max_lat_ms'], 900)
+
+    def test_aggregate_wall_clock(self):
+        runs = {'0.client1': rados_bench.parse(self.write_output('0.client1', output(25, 10, started_at=0))),
+                '0.client2': rados_bench.parse(self.write_output('0.client2', output(25, 30, started_at=2)))}
+        summary, arrays = rados_bench.aggregate(runs, window=(5, 20))
+        self.assertEqual(summary['cluster']['aligned_on'], 'wall_clock')
+        self.assertEqual(list(arrays['offsets']), [0, 2])
+        self.assertEqual(summary['cluster']['seconds'], 28)
+        self.assertEqual(summary['cluster']['bandwidth_mbps'], 160)
+        self.assertEqual(summary['cluster']['iops'], 40)
+        # client2 only reports from second 2 on
+        self.assertEqual(arrays['cluster_mbps'][1], 40)
+        self.assertEqual(arrays['cluster_mbps'][10], 160)
+        self.assertEqual(arrays['cluster_iops'][10], 40)
+        self.assertEqual(summary['cluster']['steady_mbps'], 160)
+        self.assertEqual(summary['cluster']['max_lat_ms'], 900)
+        self.assertAlmostEqual(summary['fairness']['jain'], 0.8)
+        self.assertAlmostEqual(summary['fairness']['min_max_ratio'], 1 / 3.0)
+
+    def test_aggregate_without_timestamps(self):
+        runs = {'0': rados_bench.parse(self.write_output('0', output(10, 10))),
+                '1': rados_bench.parse(self.write_output('1', output(10, 10)))}
+        summary, arrays = rados_bench.aggregate(runs)
+        self.assertEqual(summary['cluster']['aligned_on'], 'start')
+        self.assertEqual(summary['fairness']['jain'], 1.0)
+        self.assertEqual(summary['cluster']['peak_mbps'], 80)
+
+    def test_write(self):
+        self.write_output('0.client1', output(25, 10, started_at=0))
+        self.write_output('1.client1', output(25, 10, started_at=0))
+        with open(os.path.join(self.out_dir, 'steady_state.json'), 'w') as f:
+            json.dump({'steady': True, 'start': 2, 'end': 20}, f)
+        summary = rados_bench.write(self.out_dir)
+        self.assertEqual(rados_bench.load(self.out_dir), json.loads(json.dumps(summary)))
+        self.assertEqual(summary['cluster']['steady_window'], [2, 20])
+        arrays = numpy.load(os.path.join(self.out_dir, rados_bench.ARRAYS_FILE))
+        self.assertEqual(list(arrays['processes']), ['0.client1', '1.client1'])
+        self.assertEqual(arrays['mbps'].shape, (2, 26))
+
+if __name__ == '__main__':
+    unittest.main()
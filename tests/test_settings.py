@@ -0,0 +1,55 @@
+import unittest
+
+import settings
+
+
+class TestTopology(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'user': 'cbt',
+                            'head': 'head1',
+                            'clients': ['client1.example.com', 'head1'],
+                            'osds': 'osd1,osd2, osd1',
+                            'mons': {'mon1': {'a': '10.0.0.1:6789'}, 'osd1': {'b': '10.0.0.2:6789'}},
+                            'rgws': ['10.0.0.9'],
+                            'client_groups': {'a': ['client1.example.com'], 'b': 'head1'}}
+
+    def tearDown(self):
+        settings.cluster = self.old_cluster
+
+    def test_getnodes(self):
+        self.assertEqual(settings.getnodes('head', 'clients'), 'cbt@head1,cbt@client1.example.com')
+        self.assertEqual(settings.getnodes('osds'), 'cbt@osd1,cbt@osd2')
+        self.assertEqual(settings.getnodes('mds'), '')
+        self.assertEqual(sorted(settings.getnodes('mons').split(',')), ['cbt@mon1', 'cbt@osd1'])
+
+    def test_queries(self):
+        topology = settings.get_topology()
+        self.assertEqual(topology.hosts('osds', 'head'), ['head1', 'osd1', 'osd2'])
+        self.assertEqual(topology.shortnames('clients', 'rgws'), ['head1', 'client1', '10.0.0.9'])
+        self.assertEqual(topology.target('cbt@x'), 'cbt@x')
+        self.assertEqual(topology.index('cbt@head1'), 0)
+        self.assertEqual(topology.index('osd2'), 3)
+        self.assertEqual(topology.index('nowhere'), None)
+
+    def test_groups(self):
+        topology = settings.get_topology()
+        self.assertEqual(topology.group('a'), ['client1.example.com'])
+        self.assertEqual(topology.group_nodes('b'), 'cbt@head1')
+        self.assertRaises(ValueError, topology.group, 'c')
+
+    def test_node_users(self):
+        settings.cluster = {'head': 'admin@h', 'clients': ['root@c1', 'c2'], 'osds': ['c2', 'o1']}
+        self.assertEqual(settings.getnodes('head', 'clients'), 'admin@h,root@c1,c2')
+        settings.cluster = dict(settings.cluster, user='cbt', osds=['root@c1', 'o1'])
+        self.assertEqual(settings.getnodes('head', 'clients', 'osds'), 'admin@h,root@c1,cbt@c2,cbt@o1')
+        self.assertEqual(settings.get_topology().hosts('clients'), ['c1', 'c2'])
+
+    def test_rebuilt_on_new_cluster(self):
+        topology = settings.get_topology()
+        self.assertTrue(settings.get_topology() is topology)
+        settings.cluster = {'clients': ['a']}
+        self.assertEqual(settings.getnodes('clients'), 'a')
+
+if __name__ == '__main__':
+    unittest.main()
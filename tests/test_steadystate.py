@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import progress
+import settings
+import steadystate
+import transport
+
+RAMP = [10, 40, 70, 90] + [100, 101, 99, 100, 102, 98, 100, 101, 99, 100]
+
+
+class TestParsers(unittest.TestCase):
+    def test_fio_log(self):
+        self.assertEqual(steadystate.parse_fio_log('output.0_bw.1.log', '2000, 10240, 1, 4096'), (2.0, 10.0))
+        self.assertEqual(steadystate.parse_fio_log('output.0_bw.1.log', 'garbage'), None)
+
+    def test_rados_bench(self):
+        line = '    5      16       233       217   173.585       176   0.310866    0.354212'
+        self.assertEqual(steadystate.parse_rados_bench(None, line), (5, 176.0))
+        self.assertEqual(steadystate.parse_rados_bench(None, '  sec Cur ops   started  finished  avg MB/s  cur MB/s'), None)
+
+
+class TestDetector(unittest.TestCase):
+    def test_steady_after_ramp(self):
+        detector = steadystate.SteadyStateDetector(window=5, cov=0.02)
+        for t, v in enumerate(RAMP):
+            # two clients with half the throughput each
+            detector.add('a', t, v / 2.0)
+            detector.add('b', t, v / 2.0)
+        result = detector.result()
+        self.assertEqual((result['start'], result['end'], result['steady_seconds']), (4, 13, 10))
+        self.assertAlmostEqual(result['mean'], 100.0)
+
+    def test_incomplete_seconds(self):
+        detector = steadystate.SteadyStateDetector()
+        detector.add('a', 0, 1)
+        detector.add('a', 1, 1)
+        detector.add('b', 0.5, 1)
+        self.assertEqual(detector.points(), [])
+        self.assertEqual(detector.points(final=True), [(0, 2.0), (1, 1.0)])
+
+    def test_never_steady(self):
+        detector = steadystate.SteadyStateDetector(window=3)
+        for t, v in enumerate([10, 50, 10, 50, 10]):
+            detector.add('a', t, v)
+        self.assertFalse(detector.result()['steady'])
+
+
+class TestArchived(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_write_and_mean(self):
+        with open(os.path.join(self.out_dir, 'output.0_bw.1.log.client1'), 'w') as f:
+            for t, v in enumerate(RAMP):
+                f.write('%d, %d, 1, 4096\n' % (t * 1000, v * 1024))
+        detector = steadystate.SteadyStateDetector(window=5, cov=0.02)
+        result = steadystate.write(self.out_dir, 'output.*_bw*.log', steadystate.parse_fio_log, detector)
+        self.assertEqual(result['start'], 4)
+        with open(os.path.join(self.out_dir, steadystate.FILENAME)) as f:
+            self.assertEqual(json.load(f)['end'], 13)
+        self.assertAlmostEqual(steadystate.steady_mean(self.out_dir, 'output.*_bw*.log', steadystate.parse_fio_log), 100.0)
+
+    def test_no_window(self):
+        self.assertEqual(steadystate.steady_mean(self.out_dir, 'output.*', steadystate.parse_fio_log), None)
+
+
+class TestLiveTail(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'transport': 'local'}
+        self.run_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+        shutil.rmtree(self.run_dir)
+
+    def test_tail_feeds_detector(self):
+        detector = steadystate.SteadyStateDetector(window=3, cov=0.05)
+        watcher = steadystate.SteadyStateWatcher(steadystate.parse_rados_bench, detector)
+        tail = progress.LiveTail('a', self.run_dir, 'output.*', [watcher]).start()
+        with open(os.path.join(self.run_dir, 'output.0'), 'w') as f:
+            f.write('  sec Cur ops   started  finished  avg MB/s  cur MB/s\n')
+            for t in range(8):
+                f.write('%5d %7d %9d %9d %9.3f %9d %10.6f %10.6f\n' % (t, 16, t * 25, t * 25, 100, 100, 0.1, 0.1))
+        deadline = time.time() + 10
+        while not detector.result(final=False)['steady'] and time.time() < deadline:
+            time.sleep(0.1)
+        tail.stop()
+        self.assertEqual(detector.result(final=False)['start'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import yaml
+
+import common
+import tracing
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.old_tracer = tracing.tracer
+        tracing.tracer = tracing.Tracer()
+
+    def tearDown(self):
+        tracing.tracer = self.old_tracer
+
+    def test_command_class(self):
+        self.assertEqual(tracing.command_class('sudo /usr/bin/ceph -c x osd pool create'), 'ceph')
+        self.assertEqual(tracing.command_class('FOO=1 rados bench'), 'rados')
+        self.assertEqual(tracing.command_class(''), '')
+
+    def test_trace_and_summary(self):
+        archive = tempfile.mkdtemp()
+        try:
+            tracing.tracer.start_test('test-1')
+            with tracing.phase('run'):
+                common.CheckedPopen(['echo', 'hello']).communicate()
+                with tracing.phase('measure'):
+                    time.sleep(0.05)
+            tracing.tracer.end_test()
+            tracing.tracer.write(archive)
+
+            with open(os.path.join(archive, 'trace.json')) as f:
+                events = json.load(f)['traceEvents']
+            names = [e['name'] for e in events if e['ph'] == 'X']
+            self.assertEqual(sorted(names), ['echo', 'measure', 'run', 'test'])
+            command = [e for e in events if e['name'] == 'echo'][0]
+            self.assertEqual(command['args']['returncode'], 0)
+            self.assertEqual(command['args']['bytes'], 6)
+            self.assertEqual(command['args']['test'], 'test-1')
+
+            with open(os.path.join(archive, 'overhead.yaml')) as f:
+                summary = yaml.safe_load(f)
+            test = summary['tests'][0]
+            self.assertEqual(test['remote_commands'], 1)
+            self.assertTrue(test['measure_time'] >= 0.05)
+            self.assertTrue(test['wall_time'] >= test['measure_time'])
+        finally:
+            shutil.rmtree(archive)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import common
+import executor
+import settings
+import transport
+
+
+class TestLocalTransport(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'transport': 'local'}
+
+    def tearDown(self):
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+
+    def test_pdsh_prefixes_hosts(self):
+        out, err = common.pdsh('user@a,b', 'echo $CBT_HOST; echo x >&2').communicate()
+        self.assertIn("a: a\n", out)
+        self.assertIn("b: b\n", out)
+        self.assertIn("a: x\n", err)
+        self.assertIn("b: x\n", err)
+
+    def test_pdsh_results_per_host(self):
+        proc = common.pdsh('a,b', 'test $CBT_HOST = a')
+        self.assertEqual(proc.wait(), 1)
+        self.assertEqual(proc.popen_obj.results['a'][0], 0)
+        self.assertEqual(proc.popen_obj.results['b'][0], 1)
+
+    def test_pdsh_no_continue(self):
+        proc = common.pdsh('a', 'exit 3', continue_if_error=False)
+        self.assertRaises(Exception, proc.communicate)
+
+    def test_batch(self):
+        batch = common.CommandBatch('a,b')
+        batch.add('echo one').add('echo err >&2; test $CBT_HOST = a').add('printf two')
+        results = batch.run()
+        self.assertEqual(sorted(results), ['a', 'b'])
+        self.assertEqual([s.returncode for s in results['a']], [0, 0, 0])
+        self.assertEqual([s.returncode for s in results['b']], [0, 1, 0])
+        self.assertEqual(results['a'][0].stdout, 'one\n')
+        self.assertEqual(results['b'][1].stderr, 'err\n')
+        self.assertEqual(results['a'][2].stdout, 'two')
+
+    def test_batch_collect(self):
+        batch = common.CommandBatch('a')
+        batch.add('echo one').add('false')
+        res = executor.Executor().submit('a', batch.script()).result()
+        steps = batch.collect(res.host, res.stdout, res.stderr)
+        self.assertEqual([s.returncode for s in steps], [0, 1])
+        self.assertEqual(steps[0].stdout, 'one\n')
+
+    def test_batch_fail_fast(self):
+        batch = common.CommandBatch('a', continue_if_error=False)
+        batch.add('true').add('false').add('echo never')
+        self.assertRaises(Exception, batch.run)
+        batch.continue_if_error = True
+        results = batch.run()
+        self.assertEqual([s.returncode for s in results['a']], [0, 1, 0])
+
+    def test_stream(self):
+        seen = []
+        proc = common.pdsh('a,b', 'for i in 1 2 3; do echo $CBT_HOST$i; done; echo oops >&2')
+        lines = list(proc.stream(host_callbacks={'b': seen.append}))
+        self.assertEqual(sorted(lines), [('a', 'a1'), ('a', 'a2'), ('a', 'a3'),
+                                         ('b', 'b1'), ('b', 'b2'), ('b', 'b3')])
+        self.assertEqual(seen, ['b1', 'b2', 'b3'])
+        self.assertEqual(sorted(proc.stderr_tail), ['a: oops', 'b: oops'])
+        self.assertEqual(proc.myrtncode, 0)
+
+    def test_stream_pdsh_prefixes(self):
+        spool = tempfile.mkdtemp()
+        try:
+            proc = common.CheckedPopen(['sh', '-c', 'echo "x: 1"; echo "y: 2"; exit 2'], continue_if_error=True)
+            self.assertEqual(list(proc.stream(spool_dir=spool, max_queued=1)), [('x', '1'), ('y', '2')])
+            self.assertEqual(proc.myrtncode, 2)
+            with open(os.path.join(spool, 'y.out')) as f:
+                self.assertEqual(f.read(), '2\n')
+        finally:
+            shutil.rmtree(spool)
+
+    def test_transport_switch(self):
+        self.assertEqual(transport.get_transport().name, 'local')
+        settings.cluster = {}
+        self.assertEqual(transport.get_transport().name, 'pdsh')
+
+
+class TestSimulatedTransport(unittest.TestCase):
+    def setUp(self):
+        self.old_cluster = settings.cluster
+        settings.cluster = {'transport': 'simulated',
+                            'tmp_dir': '/tmp/cbt',
+                            'simulation': {'hosts': {'bad': {'fail_rate': 1.0},
+                                                     'slow': {'latency': 0.3}},
+                                           'commands': {'rados': 'echo bench $*'}}}
+        self.transport = transport.get_transport()
+
+    def tearDown(self):
+        transport.close_transport()
+        settings.cluster = self.old_cluster
+
+    def test_host_dirs(self):
+        common.pdsh('a,b', 'mkdir -p /tmp/cbt/x && hostname -s > /tmp/cbt/x/name').communicate()
+        for host in ['a', 'b']:
+            fn = os.path.join(self.transport.host_root(host), 'tmp/cbt/x/name')
+            with open(fn) as f:
+                self.assertEqual(f.read(), host + '\n')
+
+    def test_stubs(self):
+        out, err = common.pdsh('a', 'sudo /usr/bin/ceph health; /usr/bin/rados -p x bench 1 write; sudo killall -9 ceph-osd').communicate()
+        self.assertEqual(out, 'a: HEALTH_OK\na: bench -p x bench 1 write\n')
+
+    def test_rewrite(self):
+        cmd = self.transport.rewrite('a', 'cat /tmp/cbt/f /tmp/cbtx /var/tmp/cbt /etc/ceph/ceph.conf')
+        root = self.transport.host_root('a')
+        self.assertEqual(cmd, 'cat %s/tmp/cbt/f /tmp/cbtx /var/tmp/cbt %s/etc/ceph/ceph.conf' % (root, root))
+
+    def test_batch_host_missing(self):
+        batch = common.CommandBatch('a,bad')
+        batch.add('true').add('echo two')
+        results = batch.run()
+        self.assertEqual(sorted(results), ['a', 'bad'])
+        self.assertEqual([s.returncode for s in results['a']], [0, 0])
+        self.assertEqual([s.returncode for s in results['bad']], [None, None])
+        batch.continue_if_error = False
+        self.assertRaises(Exception, batch.run)
+
+    def test_injection(self):
+        start = time.time()
+        proc = common.pdsh('bad,slow', 'true')
+        proc.communicate()
+        self.assertTrue(time.time() - start >= 0.3)
+        self.assertEqual(proc.popen_obj.results['bad'][0], 255)
+        self.assertEqual(proc.popen_obj.results['slow'][0], 0)
+
+    def test_rebuilt(self):
+        self.assertTrue(transport.get_transport() is self.transport)
+        settings.cluster['simulation']['hosts'] = {}
+        rebuilt = transport.get_transport()
+        self.assertFalse(rebuilt is self.transport)
+        proc = common.pdsh('bad', 'true')
+        proc.communicate()
+        self.assertEqual(proc.popen_obj.results['bad'][0], 0)
+        # settings other transports are built from do not matter
+        settings.cluster['ssh_control_persist'] = 5
+        self.assertTrue(transport.get_transport() is rebuilt)
+
+
+class TestSshTransport(unittest.TestCase):
+    def test_host_args(self):
+        t = transport.SshTransport({'ssh_control_persist': 30})
+        try:
+            args = t.host_args('user@node', 'ls')
+            self.assertEqual(args[0], 'ssh')
+            self.assertEqual(args[-2:], ['user@node', 'ls'])
+            self.assertIn('ControlMaster=no', args)
+            self.assertIn('ControlPersist=30', t.master_args('user@node'))
+        finally:
+            t.close()
+
+if __name__ == '__main__':
+    unittest.main()
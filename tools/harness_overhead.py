@@ -0,0 +1,80 @@
+#!/usr/bin/env python2
+#
+# harness_overhead.py - time cbt's own remote command plumbing against a
+# simulated cluster of growing size
+#
+# For every node count the script times one pdsh fanout, one CommandBatch of
+# several steps, one executor fanout and one sync_files of a small result
+# tree, using the simulated transport so no real hosts are needed.
+#
+# example:
+# python tools/harness_overhead.py --nodes 10,50,100,200 --latency 0.01
+#
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import common
+import executor
+import settings
+import transport
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measure harness overhead on a simulated cluster.')
+    parser.add_argument('--nodes', default='10,50,100,200', help='comma separated node counts')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated per command latency (s)')
+    parser.add_argument('--steps', type=int, default=5, help='commands per CommandBatch')
+    parser.add_argument('--files', type=int, default=10, help='result files per node for sync_files')
+    return parser.parse_args()
+
+
+def timed(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def measure(count, args, local_dir):
+    nodes = ','.join('sim%03d' % i for i in xrange(count))
+    # sync_files collects from the cluster's nodes
+    settings.cluster = dict(settings.cluster, clients=nodes)
+    tmp_dir = settings.cluster['tmp_dir']
+    results = {}
+    results['pdsh'] = timed(lambda: common.pdsh(nodes, 'true').communicate())
+
+    batch = common.CommandBatch(nodes)
+    for i in xrange(args.steps):
+        batch.add('true')
+    results['batch'] = timed(batch.run)
+
+    results['executor'] = timed(lambda: executor.wait(executor.fanout(nodes, 'true')))
+
+    common.pdsh(nodes, 'mkdir -p %s/out && for i in $(seq %d); do head -c 4096 /dev/zero > %s/out/f$i; done'
+                % (tmp_dir, args.files, tmp_dir)).communicate()
+    results['sync_files'] = timed(lambda: common.sync_files('%s/out' % tmp_dir, os.path.join(local_dir, str(count))))
+    return results
+
+
+def main():
+    args = parse_args()
+    settings.cluster = {'transport': 'simulated', 'tmp_dir': '/tmp/cbt',
+                        'simulation': {'latency': args.latency}}
+    local_dir = transport.get_transport().root + '-collected'
+    try:
+        print '%8s %10s %10s %10s %10s' % ('nodes', 'pdsh', 'batch', 'executor', 'sync_files')
+        for count in [int(n) for n in args.nodes.split(',')]:
+            r = measure(count, args, local_dir)
+            print '%8d %10.3f %10.3f %10.3f %10.3f' % (count, r['pdsh'], r['batch'], r['executor'], r['sync_files'])
+    finally:
+        transport.close_transport()
+        shutil.rmtree(local_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+import yaml
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Timeline of the harness itself.
+
+Every CheckedPopen (and every command run by the executor or the
+collector) is recorded with its command class, hosts, start/end time, exit
+code and output size, as are the phases of cbt.main (initialize, run,
+cleanup, ...) and the measurement window of each benchmark.  At the end of
+a run the timeline is written to <archive>/trace.json in Chrome trace-event
+format (load it in chrome://tracing or Perfetto) together with
+<archive>/overhead.yaml, which splits the wall clock time of every test into
+measurement and harness overhead.
+"""
+
+
+def command_class(command):
+    """'sudo /usr/bin/ceph -c conf osd pool create ...' -> 'ceph'."""
+    for word in command.split():
+        if word == 'sudo' or '=' in word:
+            continue
+        return os.path.basename(word)
+    return ''
+
+
+class Tracer(object):
+    def __init__(self):
+        self.enabled = True
+        self.origin = time.time()
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self.tests = []
+        self.test = None
+        self.lock = threading.Lock()
+
+    def _add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def _us(self, t):
+        return int((t - self.origin) * 1000000)
+
+    def complete(self, name, cat, start, end, **args):
+        if not self.enabled:
+            return
+        if self.test is not None:
+            args.setdefault('test', self.test['name'])
+        thread = threading.current_thread()
+        self.threads[thread.ident] = thread.name
+        self._add({'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid,
+                   'tid': thread.ident,
+                   'ts': self._us(start), 'dur': max(0, self._us(end) - self._us(start)),
+                   'args': args})
+        if cat == 'phase' and name == 'measure' and self.test is not None:
+            with self.lock:
+                self.test['measure'] += end - start
+        elif cat == 'command' and self.test is not None:
+            with self.lock:
+                self.test['commands'] += 1
+                self.test['command_time'] += end - start
+
+    def command_start(self, kind, hosts, command):
+        return {'kind': kind, 'hosts': hosts, 'command': command, 'start': time.time()}
+
+    def command_end(self, token, returncode, nbytes):
+        if token is None:
+            return
+        self.complete(command_class(token['command']) or token['kind'], 'command',
+                      token['start'], time.time(), transport=token['kind'],
+                      hosts=token['hosts'], command=token['command'],
+                      returncode=returncode, bytes=nbytes)
+
+    @contextlib.contextmanager
+    def phase(self, name, **args):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.complete(name, 'phase', start, time.time(), **args)
+
+    def start_test(self, name):
+        self.end_test()
+        self.test = {'name': name, 'start': time.time(), 'measure': 0.0,
+                     'commands': 0, 'command_time': 0.0}
+
+    def end_test(self):
+        if self.test is None:
+            return
+        test = self.test
+        self.test = None
+        test['end'] = time.time()
+        self.complete('test', 'test', test['start'], test['end'], test=test['name'])
+        self.tests.append(test)
+
+    def summary(self):
+        tests = []
+        total = 0.0
+        measured = 0.0
+        for test in self.tests:
+            wall = test['end'] - test['start']
+            total += wall
+            measured += test['measure']
+            tests.append({'test': test['name'],
+                          'wall_time': round(wall, 3),
+                          'measure_time': round(test['measure'], 3),
+                          'overhead_time': round(wall - test['measure'], 3),
+                          'remote_commands': test['commands'],
+                          'remote_command_time': round(test['command_time'], 3)})
+        return {'wall_time': round(time.time() - self.origin, 3),
+                'test_time': round(total, 3),
+                'measure_time': round(measured, 3),
+                'overhead_time': round(total - measured, 3),
+                'tests': tests}
+
+    def write(self, archive_dir):
+        if not self.enabled or not archive_dir:
+            return
+        self.end_test()
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        with self.lock:
+            events = list(self.events)
+        for tid, name in self.threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                           'tid': tid, 'args': {'name': name}})
+        with open(os.path.join(archive_dir, 'trace.json'), 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        with open(os.path.join(archive_dir, 'overhead.yaml'), 'w') as f:
+            yaml.safe_dump(self.summary(), f, default_flow_style=False)
+        logger.info('Wrote harness trace of %d events to %s', len(events), archive_dir)
+
+
+tracer = Tracer()
+
+
+def phase(name, **args):
+    return tracer.phase(name, **args)
+
+
+def command_start(kind, hosts, command):
+    return tracer.command_start(kind, hosts, command)
+
+
+def command_end(token, returncode, nbytes):
+    tracer.command_end(token, returncode, nbytes)
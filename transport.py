@@ -0,0 +1,414 @@
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import settings
+
+logger = logging.getLogger("cbt")
+
+__doc__ = """
+Transports used by common.pdsh to run a command on a set of nodes.
+
+pdsh  - the historical behaviour, one 'pdsh -R ssh' process per call.
+ssh   - one persistent, multiplexed ssh master connection per host
+        (ControlMaster/ControlPersist), commands are sent over it.
+local - every host is run through the local shell; used for testing.
+simulated - like local, but every host gets its own directory tree, stub
+        versions of the cluster tools and optional injected latency and
+        failures (see SimulatedTransport).
+
+The transport is selected with the 'transport' key of the cluster section.
+"""
+
+
+def split_nodes(nodes):
+    if isinstance(nodes, basestring):
+        nodes = nodes.split(',')
+    return [node for node in nodes if node]
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+
+def hostname(node):
+    return node.rpartition('@')[2]
+
+
+def prefix_lines(host, data):
+    if not data:
+        return ''
+    lines = data.splitlines(True)
+    if not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    return ''.join('%s: %s' % (host, line) for line in lines)
+
+
+class MultiHostPopen(object):
+    """
+    Popen look-alike wrapping one process per host.
+
+    communicate() merges the per-host output the way pdsh does, with every
+    line prefixed by "host: ". The unmerged output of each host is kept in
+    the results dict as (returncode, stdout, stderr).
+    """
+    def __init__(self, procs):
+        self.procs = procs
+        self.returncode = None
+        self.results = {}
+
+    @property
+    def hosts(self):
+        return [host for host, proc in self.procs]
+
+    def _set_returncode(self, rcs):
+        self.returncode = 0
+        for rc in rcs:
+            if rc != 0:
+                self.returncode = rc
+                break
+
+    def poll(self):
+        rcs = [proc.poll() for host, proc in self.procs]
+        if None in rcs:
+            return None
+        self._set_returncode(rcs)
+        return self.returncode
+
+    def communicate(self, input=None):
+        def collect(host, proc):
+            out, err = proc.communicate(input=input)
+            self.results[host] = (proc.returncode, out, err)
+
+        threads = []
+        for host, proc in self.procs:
+            t = threading.Thread(target=collect, args=(host, proc))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        self._set_returncode([proc.returncode for host, proc in self.procs])
+        stdout = ''.join(prefix_lines(host, self.results[host][1]) for host in self.hosts)
+        stderr = ''.join(prefix_lines(host, self.results[host][2]) for host in self.hosts)
+        return (stdout, stderr)
+
+    def stream_sources(self):
+        """(host, name, file) of every pipe, for CheckedPopen.stream()."""
+        sources = []
+        for host, proc in self.procs:
+            sources.append((host, 'out', proc.stdout))
+            sources.append((host, 'err', proc.stderr))
+        return sources
+
+    def wait(self):
+        for host, proc in self.procs:
+            proc.wait()
+        return self.poll()
+
+    def terminate(self):
+        for host, proc in self.procs:
+            if proc.poll() is None:
+                proc.terminate()
+
+    def kill(self):
+        for host, proc in self.procs:
+            if proc.poll() is None:
+                proc.kill()
+
+
+class Transport(object):
+    name = None
+    # popen() runs a single process for all nodes, output merged
+    multi_host = False
+    # cluster settings the transport is built from
+    config_keys = ()
+
+    def __init__(self, config):
+        self.config = config
+        self.key = self.config_key(config)
+
+    @classmethod
+    def config_key(cls, config):
+        """Identity of the transport built from config, see get_transport()."""
+        return cls.name, json.dumps([config.get(k) for k in cls.config_keys], sort_keys=True, default=str)
+
+    def host_args(self, node, command):
+        """Argument vector running command on a single node."""
+        raise NotImplementedError()
+
+    def host_env(self, node):
+        """Environment of the local process for node, None to inherit ours."""
+        return None
+
+    def host_popen(self, node, command, stdin=None):
+        args = self.host_args(node, command)
+        return args, subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE, close_fds=True,
+                                      env=self.host_env(node))
+
+    def popen(self, nodes, command, continue_if_error=True):
+        """Start command on every node, returns (args, popen_obj)."""
+        nodes = split_nodes(nodes)
+        procs = []
+        for node in nodes:
+            procs.append((hostname(node), self.host_popen(node, command)[1]))
+        return [self.name, ','.join(nodes), command], MultiHostPopen(procs)
+
+    def ssh_options(self):
+        """Extra options for ssh/scp invocations sharing this transport."""
+        return []
+
+    def close(self):
+        pass
+
+
+class PdshTransport(Transport):
+    name = 'pdsh'
+    multi_host = True
+
+    def host_args(self, node, command):
+        return ['ssh', node, command]
+
+    def popen(self, nodes, command, continue_if_error=True):
+        args = ['pdsh', '-R', 'ssh', '-w', nodes, command]
+        # -S means pdsh fails if any host fails
+        if not continue_if_error:
+            args.insert(1, '-S')
+        return args, subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+
+
+class SshTransport(Transport):
+    """
+    Keeps one multiplexed ssh master per host alive for ssh_control_persist
+    seconds and runs every command as a new session over it, so only the
+    first command sent to a host pays for the handshake.
+    """
+    name = 'ssh'
+    config_keys = ('ssh_control_persist',)
+
+    def __init__(self, config):
+        super(SshTransport, self).__init__(config)
+        self.persist = config.get('ssh_control_persist', 600)
+        self.control_dir = tempfile.mkdtemp(prefix='cbt-ssh-')
+        self.masters = set()
+        self.lock = threading.Lock()
+
+    def ssh_options(self):
+        # Sessions only ever attach to an existing master. If it went away
+        # they fall back to a plain connection instead of becoming a master
+        # that would hold our output pipes open for ControlPersist seconds.
+        return ['-o', 'ControlMaster=no', '-o', 'ControlPath=%s/%%C' % self.control_dir]
+
+    def master_args(self, node):
+        return ['ssh', '-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=%s/%%C' % self.control_dir,
+                '-o', 'ControlPersist=%s' % self.persist, node, 'true']
+
+    def host_args(self, node, command):
+        return ['ssh'] + self.ssh_options() + [node, command]
+
+    def connect(self, nodes):
+        """Bring up the master connection of every node not yet connected."""
+        with self.lock:
+            new = [node for node in split_nodes(nodes) if node not in self.masters]
+            self.masters.update(new)
+        devnull = open(os.devnull, 'w')
+        procs = [(node, subprocess.Popen(self.master_args(node), stdout=devnull, stderr=devnull, close_fds=True))
+                 for node in new]
+        for node, proc in procs:
+            if proc.wait() != 0:
+                logger.warning('ssh master connection to %s failed with %d', node, proc.returncode)
+                with self.lock:
+                    self.masters.discard(node)
+        devnull.close()
+
+    def host_popen(self, node, command, stdin=None):
+        self.connect([node])
+        return super(SshTransport, self).host_popen(node, command, stdin)
+
+    def popen(self, nodes, command, continue_if_error=True):
+        self.connect(nodes)
+        return super(SshTransport, self).popen(nodes, command, continue_if_error)
+
+    def close(self):
+        with self.lock:
+            masters = list(self.masters)
+            self.masters.clear()
+        for node in masters:
+            args = ['ssh', '-o', 'ControlPath=%s/%%C' % self.control_dir, '-O', 'exit', node]
+            subprocess.call(args, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT, close_fds=True)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+
+class LocalTransport(Transport):
+    """Runs the command with the local shell once per host. CBT_HOST is set to the host name."""
+    name = 'local'
+
+    def host_env(self, node):
+        env = dict(os.environ)
+        env['CBT_HOST'] = hostname(node)
+        return env
+
+    def host_args(self, node, command):
+        return ['sh', '-c', command]
+
+
+class SimulatedTransport(LocalTransport):
+    """
+    Simulates a cluster of named hosts on the local machine so cbt can run
+    end to end, and its own overhead can be measured, without real nodes.
+
+    Every host gets a root directory (<root>/<host>) and the absolute paths
+    cbt uses remotely (tmp_dir, /etc/ceph, /var/run/ceph, /proc/sys, ...)
+    are rewritten into it.  A bin directory of stub tools is put first in
+    PATH: sudo just runs its arguments, hostname prints the simulated host,
+    'ceph health' reports HEALTH_OK and the other ceph, benchmark and
+    monitoring tools do nothing.  Stubs can be replaced through 'commands'.
+    Configured in the cluster section:
+
+      simulation:
+        root: /tmp/cbt-sim        # default: a new temporary directory
+        latency: 0.01             # seconds added to every command
+        fail_rate: 0.0            # probability that a command fails
+        seed: 0
+        hosts:                    # per host overrides
+          node7: {latency: 0.5, fail_rate: 0.1}
+        commands:                 # stub tool bodies (sh)
+          rados: 'echo "Bandwidth (MB/sec): 100"'
+    """
+    name = 'simulated'
+
+    # the arguments are matched as whole words, the rewritten paths include
+    # the (random) root
+    stubs = {
+        'sudo': 'exec "$@"',
+        'hostname': 'echo "$CBT_HOST"',
+        'ceph': 'case " $* " in *" health "*) echo HEALTH_OK;; *" status "*) echo "{\\"pgmap\\": {\\"num_pgs\\": 64}}";; '
+                '*" -v "*|*" --version "*) echo "ceph version 10.2.0 (simulated)";; esac',
+        'rados': 'case " $* " in *" -v "*) echo "ceph version 10.2.0 (simulated)";; esac',
+    }
+    noop_stubs = ['rbd', 'fio', 'collectl', 'perf', 'perf_3.6', 'blktrace', 'killall', 'pkill',
+                  'chown', 'ceph-osd', 'ceph-mon', 'ceph-run', 'radosgw', 'radosgw-admin',
+                  'ceph-authtool', 'monmaptool', 'ceph_test_rados', 'mount', 'umount',
+                  'service', 'zpool', 'swift', 'valgrind']
+    remapped = ['/etc/ceph', '/var/run/ceph', '/proc/sys', '/sys/block', '/dev/disk', '/dev/rbd', '/srv']
+    config_keys = ('simulation', 'tmp_dir')
+
+    def __init__(self, config):
+        super(SimulatedTransport, self).__init__(config)
+        self.sim = config.get('simulation', {})
+        self.root = self.sim.get('root')
+        self.created_root = self.root is None
+        if self.root is None:
+            self.root = tempfile.mkdtemp(prefix='cbt-sim-')
+        self.bin_dir = os.path.join(self.root, 'bin')
+        self.random = random.Random(self.sim.get('seed', 0))
+        self.lock = threading.Lock()
+        self.hosts = set()
+        self._make_stubs()
+
+        prefixes = list(self.remapped)
+        if config.get('tmp_dir'):
+            prefixes.append(config['tmp_dir'].rstrip('/'))
+        prefixes.sort(key=len, reverse=True)
+        self.path_re = re.compile('(?<![\\w./-])(%s)(?=/|\\b|$)' % '|'.join(re.escape(p) for p in prefixes))
+        tools = set(self.stubs) | set(self.noop_stubs) | set(self.sim.get('commands', {}))
+        self.tool_re = re.compile('/usr(?:/local)?/s?bin/(%s)\\b' % '|'.join(re.escape(t) for t in sorted(tools, key=len, reverse=True)))
+
+    def _make_stubs(self):
+        _makedirs(self.bin_dir)
+        bodies = dict((tool, 'exit 0') for tool in self.noop_stubs)
+        bodies.update(self.stubs)
+        bodies.update(self.sim.get('commands', {}))
+        for tool, body in bodies.items():
+            fn = os.path.join(self.bin_dir, tool)
+            with open(fn, 'w') as f:
+                f.write('#!/bin/sh\n%s\n' % body)
+            os.chmod(fn, 0755)
+
+    def host_root(self, node):
+        host = hostname(node)
+        root = os.path.join(self.root, 'hosts', host)
+        with self.lock:
+            if host not in self.hosts:
+                for d in ['proc/sys/vm', 'proc/sys/kernel', 'var/run/ceph', 'etc/ceph']:
+                    _makedirs(os.path.join(root, d))
+                self.hosts.add(host)
+        return root
+
+    def host_config(self, node, key, default):
+        hosts = self.sim.get('hosts', {})
+        return hosts.get(hostname(node), {}).get(key, self.sim.get(key, default))
+
+    def rewrite(self, node, command):
+        root = self.host_root(node)
+        command = self.tool_re.sub(lambda m: m.group(1), command)
+        return self.path_re.sub(lambda m: root + m.group(1), command)
+
+    def host_env(self, node):
+        env = super(SimulatedTransport, self).host_env(node)
+        env['PATH'] = '%s:%s' % (self.bin_dir, env.get('PATH', '/bin:/usr/bin'))
+        env['CBT_SIM_ROOT'] = self.host_root(node)
+        return env
+
+    def host_args(self, node, command):
+        command = self.rewrite(node, command)
+        latency = self.host_config(node, 'latency', 0)
+        with self.lock:
+            failed = self.random.random() < self.host_config(node, 'fail_rate', 0)
+        if failed:
+            command = 'echo "simulated failure on %s" >&2; exit 255' % hostname(node)
+        if latency:
+            command = 'sleep %s; %s' % (latency, command)
+        return ['sh', '-c', command]
+
+    def close(self):
+        if self.created_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+transports = {
+    PdshTransport.name: PdshTransport,
+    SshTransport.name: SshTransport,
+    LocalTransport.name: LocalTransport,
+    SimulatedTransport.name: SimulatedTransport,
+}
+
+_current = None
+# executor threads may ask for the transport first
+_current_lock = threading.RLock()
+
+
+def get_transport():
+    """
+    Transport of the cluster settings, shared by all callers.  It is rebuilt
+    when the transport or the settings it was built from change.
+    """
+    global _current
+    name = settings.cluster.get('transport', PdshTransport.name)
+    if name not in transports:
+        raise ValueError('Unknown transport: %s' % name)
+    with _current_lock:
+        if _current is None or _current.key != transports[name].config_key(settings.cluster):
+            close_transport()
+            _current = transports[name](settings.cluster)
+        return _current
+
+
+def close_transport():
+    global _current
+    with _current_lock:
+        if _current is not None:
+            _current.close()
+            _current = None
+
+atexit.register(close_transport)